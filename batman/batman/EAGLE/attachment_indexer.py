@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Attachment text indexing for the Eagle Task Management System
+
+A trigger queues every new file attachment in attachment_index. The indexer
+thread claims queued attachments in batches and has a process pool extract
+their text, so parsing never runs on a request thread and a bad file can
+only take a worker process down. The text comes back in chunks of about
+INDEX_CHUNK_CHARS and is written to the attachment_text FTS5 table, which
+Database.search_attachments queries.
+
+Memory per file is bounded: extractors stream (block reads for txt/csv,
+iterparse over the XML inside docx/xlsx) and stop at INDEX_MAX_CHARS, and
+pool processes are replaced every INDEX_TASKS_PER_CHILD files. pdf is
+indexed when pypdf is installed; doc and xls are skipped.
+
+The web app runs an indexer when EAGLE_INDEX_WORKERS > 0, except under
+eventlet/gevent, whose monkey-patched threads do not mix with the pool's
+helper threads. There (or with EAGLE_INDEX_WORKERS=0) run it as its own
+process instead:
+
+    python attachment_indexer.py           # keep indexing
+    python attachment_indexer.py --once    # drain the queue, then exit
+"""
+
+import argparse
+import codecs
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Iterator, List
+from xml.etree.ElementTree import iterparse
+
+from database import Database
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # pdf attachments are skipped without it
+    PdfReader = None
+
+INDEX_WORKERS = int(os.getenv('EAGLE_INDEX_WORKERS', '2'))
+INDEX_MAX_CHARS = int(os.getenv('EAGLE_INDEX_MAX_CHARS', str(1024 * 1024)))  # text kept per file
+INDEX_MAX_FILE_SIZE = int(os.getenv('EAGLE_INDEX_MAX_FILE_SIZE', str(64 * 1024 * 1024)))  # larger files are skipped
+INDEX_CHUNK_CHARS = 4000
+INDEX_TASKS_PER_CHILD = 50
+INDEX_BATCH_SIZE = 8
+INDEX_POLL_INTERVAL = 10.0  # seconds between polls when nobody wakes the indexer
+INDEX_TIMEOUT = 120.0  # seconds a batch may take
+INDEX_LEASE = 300.0  # seconds a claimed attachment stays reserved
+INDEX_MAX_ATTEMPTS = 3
+INDEX_RETRY_DELAY = 60.0  # seconds, multiplied by the attempt number
+
+TEXT_BLOCK_BYTES = 64 * 1024
+WORD_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+SHEET_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+class UnsupportedFormat(Exception):
+    """The file type has no extractor; the attachment is marked skipped"""
+
+
+# Extractors run in pool processes. Each yields text pieces and is abandoned
+# as soon as enough text has been collected.
+def _text_pieces(path: str) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(TEXT_BLOCK_BYTES)
+            if not block:
+                break
+            yield decoder.decode(block)
+    yield decoder.decode(b'', final=True)
+
+
+def _xml_pieces(archive: zipfile.ZipFile, member: str, text_tag: str, break_tag: str) -> Iterator[str]:
+    """Text of every text_tag element in one XML part, a newline after each break_tag"""
+    with archive.open(member) as xml:
+        for event, element in iterparse(xml, events=('end',)):
+            if element.tag == text_tag and element.text:
+                yield element.text
+            elif element.tag == break_tag:
+                yield '\n'
+                element.clear()  # keeps the parsed tree from growing with the document
+
+
+def _docx_pieces(path: str) -> Iterator[str]:
+    with zipfile.ZipFile(path) as archive:
+        yield from _xml_pieces(archive, 'word/document.xml', WORD_NS + 't', WORD_NS + 'p')
+
+
+def _xlsx_pieces(path: str) -> Iterator[str]:
+    # Cell text lives in the shared strings table; inline strings are in the sheets
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        if 'xl/sharedStrings.xml' in names:
+            yield from _xml_pieces(archive, 'xl/sharedStrings.xml', SHEET_NS + 't', SHEET_NS + 'si')
+        for name in sorted(n for n in names if n.startswith('xl/worksheets/') and n.endswith('.xml')):
+            yield from _xml_pieces(archive, name, SHEET_NS + 't', SHEET_NS + 'row')
+
+
+def _pdf_pieces(path: str) -> Iterator[str]:
+    if PdfReader is None:
+        raise UnsupportedFormat("pdf extraction needs pypdf")
+    for page in PdfReader(path).pages:
+        yield page.extract_text() or ''
+        yield '\n'
+
+
+EXTRACTORS = {
+    'txt': _text_pieces,
+    'csv': _text_pieces,
+    'docx': _docx_pieces,
+    'xlsx': _xlsx_pieces,
+    'pdf': _pdf_pieces,
+}
+
+
+def extract_chunks(path: str, file_type: str, max_chars: int = INDEX_MAX_CHARS,
+                   chunk_chars: int = INDEX_CHUNK_CHARS) -> List[str]:
+    """Text of a file in chunks of about chunk_chars, cut at whitespace, at most max_chars in all"""
+    extractor = EXTRACTORS.get((file_type or '').lower())
+    if extractor is None:
+        raise UnsupportedFormat(f"No text extractor for .{file_type} files")
+
+    chunks, pending, total = [], '', 0
+    for piece in extractor(path):
+        piece = piece[:max_chars - total]
+        total += len(piece)
+        pending += piece
+        while len(pending) >= chunk_chars:
+            cut = pending.rfind(' ', chunk_chars // 2, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            chunks.append(pending[:cut].strip())
+            pending = pending[cut:]
+        if total >= max_chars:
+            break
+    if pending.strip():
+        chunks.append(pending.strip())
+    return [chunk for chunk in chunks if chunk]
+
+
+class AttachmentIndexer:
+    """Thread that feeds queued attachments through a process pool into the FTS index"""
+
+    def __init__(self, db: Database = None, workers: int = INDEX_WORKERS, batch_size: int = INDEX_BATCH_SIZE,
+                 poll_interval: float = INDEX_POLL_INTERVAL):
+        self.db = db or Database()
+        self.workers = max(workers, 1)
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._pool = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counters = {'indexed': 0, 'reused': 0, 'skipped': 0, 'retried': 0, 'failed': 0}
+
+    def start(self):
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="attachment-indexer", daemon=True)
+        self._thread.start()
+        print(f"🔎 Attachment indexer started with {self.workers} extraction processes")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        self._shutdown_pool()
+
+    def wake(self):
+        """New attachments are queued; index them now rather than at the next poll"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                processed = self.index_once()
+            except Exception as e:
+                print(f"❌ Attachment indexer error: {e}")
+                processed = 0
+            if processed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: never fork a process that holds sockets, locks and database connections
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                             max_tasks_per_child=INDEX_TASKS_PER_CHILD)
+        return self._pool
+
+    def _shutdown_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def index_once(self) -> int:
+        """Claim one batch and index it; returns how many attachments were claimed"""
+        jobs = self.db.claim_index_jobs(self.batch_size, INDEX_LEASE)
+        futures = {}
+        for job in jobs:
+            if job['content_hash'] and self.db.copy_indexed_text(job['attachment_id'], job['content_hash']) is not None:
+                self.counters['reused'] += 1
+                continue
+            if not os.path.isfile(job['file_path']):
+                self._failed(job, "File is missing")
+                continue
+            if (job['file_size'] or 0) > INDEX_MAX_FILE_SIZE:
+                self.db.mark_index_job(job['attachment_id'], 'skipped', f"Larger than {INDEX_MAX_FILE_SIZE} bytes")
+                self.counters['skipped'] += 1
+                continue
+            futures[job['attachment_id']] = (job, self._get_pool().submit(extract_chunks, job['file_path'],
+                                                                          job['file_type']))
+
+        deadline = time.monotonic() + INDEX_TIMEOUT
+        for job, future in futures.values():
+            try:
+                chunks = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except UnsupportedFormat as e:
+                self.db.mark_index_job(job['attachment_id'], 'skipped', str(e))
+                self.counters['skipped'] += 1
+            except FutureTimeout:
+                # A stuck extraction holds its worker; start over with a fresh pool
+                self._shutdown_pool()
+                self._failed(job, "Extraction timed out")
+            except Exception as e:
+                self._failed(job, f"{type(e).__name__}: {e}")
+            else:
+                if self.db.store_attachment_text(job['attachment_id'], chunks):
+                    self.counters['indexed'] += 1
+        return len(jobs)
+
+    def _failed(self, job: Dict, error: str):
+        if job['attempts'] >= INDEX_MAX_ATTEMPTS:
+            self.db.mark_index_job(job['attachment_id'], 'failed', error)
+            self.counters['failed'] += 1
+            print(f"⚠️ Could not index attachment {job['attachment_id']}: {error}")
+        else:
+            self.db.mark_index_job(job['attachment_id'], 'pending', error,
+                                   retry_at=time.time() + INDEX_RETRY_DELAY * job['attempts'])
+            self.counters['retried'] += 1
+
+    def stats(self) -> Dict:
+        return {'workers': self.workers if self._thread else 0, 'processed': dict(self.counters),
+                'queue': self.db.get_index_stats()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the text of Eagle file attachments")
+    parser.add_argument('--once', action='store_true', help="drain the queue, then exit")
+    parser.add_argument('--workers', type=int, default=max(INDEX_WORKERS, 1))
+    args = parser.parse_args()
+
+    indexer = AttachmentIndexer(workers=args.workers)
+    try:
+        if args.once:
+            while indexer.index_once():
+                pass
+            print(f"🔎 Indexed: {indexer.counters}")
+            return
+        indexer.start()
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        indexer.stop()
+
+
+if __name__ == "__main__":
+    main()
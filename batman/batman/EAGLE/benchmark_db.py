@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Database benchmarks for the Eagle Task Management System
+
+Builds a synthetic dataset in a temporary database and times the hot
+Database queries.
+
+    python benchmark_db.py reads --threads 1 2 4 8
+    python benchmark_db.py indexes --tasks 200000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+STATUSES = ['Pending', 'In Progress', 'Completed']
+PRIORITIES = ['Low', 'Medium', 'High', 'Critical']
+
+
+def open_database(path):
+    """Create the Database singleton on a scratch file"""
+    from database import Database
+    return Database(path)
+
+
+def populate(db, companies=5, users_per_company=40, tasks=20000, comments=40000, messages=40000,
+             attachments=10000):
+    """Fill the database with random but realistic rows using the writer connection"""
+    rnd = random.Random(42)
+    conn = db.get_write_connection()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN")
+
+    for c in range(companies):
+        cursor.execute("INSERT INTO companies (name) VALUES (?)", (f"Company {c}",))
+    user_ids = []
+    for c in range(1, companies + 1):
+        for u in range(users_per_company):
+            cursor.execute(
+                "INSERT INTO users (username, password_hash, role, company_id, mobile_number) VALUES (?, ?, ?, ?, ?)",
+                (f"user_{c}_{u}", db.hash_password("pass123"), 'Admin' if u == 0 else 'Employee', c,
+                 f"9{c:02d}{u:07d}")
+            )
+            user_ids.append((cursor.lastrowid, c))
+
+    today = date.today()
+    task_ids = []
+    for i in range(tasks):
+        user_id, company_id = rnd.choice(user_ids)
+        deadline = None if rnd.random() < 0.2 else (today + timedelta(days=rnd.randint(-30, 90))).isoformat()
+        cursor.execute(
+            "INSERT INTO tasks (title, description, assigned_to, company_id, status, deadline, priority) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (f"Task {i}", "Synthetic task description " * 4, user_id, company_id,
+             rnd.choice(STATUSES), deadline, rnd.choice(PRIORITIES))
+        )
+        task_ids.append(cursor.lastrowid)
+
+    for i in range(comments):
+        user_id, _ = rnd.choice(user_ids)
+        cursor.execute("INSERT INTO task_comments (task_id, user_id, comment) VALUES (?, ?, ?)",
+                       (rnd.choice(task_ids), user_id, f"Comment {i}"))
+
+    for i in range(attachments):
+        user_id, _ = rnd.choice(user_ids)
+        cursor.execute(
+            "INSERT INTO file_attachments (task_id, filename, original_filename, file_path, file_size, file_type, uploaded_by, upload_type) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (rnd.choice(task_ids), f"{i}.txt", f"file_{i}.txt", f"uploads/{i}.txt", 1024, 'txt', user_id, 'task_progress')
+        )
+
+    for user_id, _ in user_ids:
+        cursor.execute("INSERT INTO push_subscriptions (user_id, endpoint) VALUES (?, ?)",
+                       (user_id, f"https://push.example/{user_id}"))
+
+    for i in range(messages):
+        user_id, company_id = rnd.choice(user_ids)
+        receiver = rnd.choice(user_ids)[0] if rnd.random() < 0.3 else None
+        cursor.execute("INSERT INTO messages (user_id, company_id, message, receiver_id) VALUES (?, ?, ?, ?)",
+                       (user_id, company_id, f"Message {i}", receiver))
+
+    cursor.execute("COMMIT")
+    conn.close()
+    return user_ids, task_ids
+
+
+def bench_reads(db, user_ids, thread_counts, duration):
+    """Measure read throughput of the dashboard queries as worker threads grow"""
+    print(f"\n📊 Read throughput ({duration:.0f}s per run)")
+    print(f"{'threads':>8} {'queries/s':>12} {'speedup':>8}")
+    baseline = None
+    for threads in thread_counts:
+        counts = [0] * threads
+        stop = time.monotonic() + duration
+
+        def worker(slot):
+            rnd = random.Random(slot)
+            while time.monotonic() < stop:
+                user_id, company_id = rnd.choice(user_ids)
+                db.get_user_tasks(user_id, company_id)
+                db.get_company_messages(company_id)
+                counts[slot] += 2
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        rate = sum(counts) / duration
+        baseline = baseline or rate
+        print(f"{threads:>8} {rate:>12.0f} {rate / baseline:>7.2f}x")
+
+
+def _time_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def _hot_queries(db, user_ids, task_ids):
+    user_id, company_id = user_ids[len(user_ids) // 2]
+    task_id = task_ids[len(task_ids) // 2]
+    return [
+        ('get_tasks_by_company', lambda: db.get_tasks_by_company(company_id)),
+        ('get_tasks_page', lambda: db.get_tasks_page(company_id, status='Pending')),
+        ('get_user_tasks', lambda: db.get_user_tasks(user_id, company_id)),
+        ('get_task_comments', lambda: db.get_task_comments(task_id)),
+        ('get_company_messages', lambda: db.get_company_messages(company_id)),
+        ('get_all_company_messages', lambda: db.get_all_company_messages(company_id)),
+        ('get_task_attachments', lambda: db.get_task_attachments(task_id)),
+        ('get_user_subscriptions', lambda: db.get_user_subscriptions(user_id)),
+        ('authenticate_user (mobile)', lambda: db.authenticate_user(f"9{company_id:02d}0000005", "wrong")),
+    ]
+
+
+def bench_indexes(db, user_ids, task_ids, repeat):
+    """Time each hot query without and with the schema's secondary indexes"""
+    queries = _hot_queries(db, user_ids, task_ids)
+
+    conn = db.get_write_connection()
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND name LIKE 'idx_%'"
+    ).fetchall()
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+    conn.close()
+    before = [_time_call(fn, repeat) for _, fn in queries]
+
+    conn = db.get_write_connection()
+    for _, sql in indexes:
+        conn.execute(sql)
+    conn.close()
+    after = [_time_call(fn, repeat) for _, fn in queries]
+
+    print(f"\n📊 Hot queries, mean of {repeat} runs (ms)")
+    print(f"{'query':<28} {'no index':>10} {'indexed':>10} {'speedup':>8}")
+    for (label, _), b, a in zip(queries, before, after):
+        print(f"{label:<28} {b:>10.2f} {a:>10.2f} {b / a:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eagle database benchmarks")
+    parser.add_argument('scenario', choices=['reads', 'indexes'])
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='eagle-bench-')
+    try:
+        db = open_database(os.path.join(workdir, 'bench.db'))
+        print(f"🏗️  Populating {args.tasks} tasks...")
+        user_ids, task_ids = populate(db, users_per_company=max(40, args.tasks // 500), tasks=args.tasks,
+                                      comments=args.tasks * 2, messages=args.tasks * 2,
+                                      attachments=args.tasks // 2)
+
+        if args.scenario == 'reads':
+            bench_reads(db, user_ids, args.threads, args.duration)
+        elif args.scenario == 'indexes':
+            bench_indexes(db, user_ids, task_ids, args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
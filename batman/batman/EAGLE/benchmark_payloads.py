@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Payload encoding benchmarks for the Eagle Task Management System
+
+Builds the benchmark_db dataset, takes real API and Socket.IO payloads from
+it and compares JSON with MessagePack: bytes on the wire (raw and gzipped)
+and encode/decode time.
+
+    python benchmark_payloads.py --tasks 5000 --repeat 50
+"""
+
+import argparse
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import msgpack
+from socketio import msgpack_packet, packet
+
+from benchmark_db import open_database, populate
+
+
+def _time_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000.0
+
+
+def api_payloads(db, user_ids):
+    """Response bodies of the heaviest list endpoints"""
+    user_id, company_id = user_ids[len(user_ids) // 2]
+    return [
+        ('/api/tasks (all)', db.get_tasks_by_company(company_id)),
+        ('/api/tasks?limit=50', db.get_tasks_page(company_id, limit=50)),
+        ('/api/tasks (employee)', db.get_user_tasks(user_id, company_id)),
+        ('/api/tasks/changes', db.get_task_changes(company_id, since=0, limit=500)),
+        ('/api/messages', db.get_company_messages(company_id)),
+        ('/api/admin/all_messages', db.get_all_company_messages(company_id)),
+    ]
+
+
+def socketio_payloads(db, task_ids):
+    """Event packets as the Socket.IO server encodes them"""
+    task = db.get_task_snapshot(task_ids[len(task_ids) // 2])
+    task.pop('company_id')
+    message = {'id': 1, 'message': 'Can someone review the quarterly report before Friday?',
+               'username': 'user_1_5', 'timestamp': '2025-01-01T10:00:00', 'user_id': 5,
+               'event_id': 1234, 'event_epoch': 'a1b2c3d4e5f6'}
+    return [
+        ('task_created', ['task_created', dict(task, event_id=1234, event_epoch='a1b2c3d4e5f6')]),
+        ('task_updated', ['task_updated', {'id': task['id'], 'status': 'Completed', 'change_seq': 99,
+                                           'event_id': 1235, 'event_epoch': 'a1b2c3d4e5f6'}]),
+        ('new_message', ['new_message', message]),
+    ]
+
+
+def bench_api(payloads, repeat):
+    print(f"\n📊 API responses, mean of {repeat} runs")
+    print(f"{'payload':<24} {'json B':>9} {'msgpack B':>10} {'json gz':>8} {'mp gz':>8} "
+          f"{'json enc':>9} {'mp enc':>8} {'json dec':>9} {'mp dec':>8}")
+    for label, obj in payloads:
+        as_json = json.dumps(obj, separators=(',', ':')).encode()
+        as_msgpack = msgpack.packb(obj, use_bin_type=True)
+        times = [
+            _time_call(lambda: json.dumps(obj, separators=(',', ':')).encode(), repeat),
+            _time_call(lambda: msgpack.packb(obj, use_bin_type=True), repeat),
+            _time_call(lambda: json.loads(as_json), repeat),
+            _time_call(lambda: msgpack.unpackb(as_msgpack), repeat),
+        ]
+        print(f"{label:<24} {len(as_json):>9} {len(as_msgpack):>10} "
+              f"{len(gzip.compress(as_json)):>8} {len(gzip.compress(as_msgpack)):>8} "
+              f"{times[0]:>8.2f}ms {times[1]:>6.2f}ms {times[2]:>8.2f}ms {times[3]:>6.2f}ms")
+
+
+def bench_socketio(payloads, repeat):
+    print(f"\n📊 Socket.IO event packets, mean of {repeat * 100} runs")
+    print(f"{'event':<16} {'json B':>8} {'msgpack B':>10} {'json enc':>10} {'mp enc':>10}")
+    for label, data in payloads:
+        as_json = packet.Packet(packet.EVENT, data=data).encode()
+        as_msgpack = msgpack_packet.MsgPackPacket(packet.EVENT, data=data).encode()
+        json_enc = _time_call(lambda: packet.Packet(packet.EVENT, data=data).encode(), repeat * 100)
+        msgpack_enc = _time_call(lambda: msgpack_packet.MsgPackPacket(packet.EVENT, data=data).encode(), repeat * 100)
+        print(f"{label:<16} {len(as_json):>8} {len(as_msgpack):>10} "
+              f"{json_enc * 1000:>8.1f}us {msgpack_enc * 1000:>8.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eagle payload encoding benchmarks")
+    parser.add_argument('--tasks', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='eagle-bench-')
+    try:
+        db = open_database(os.path.join(workdir, 'bench.db'))
+        print(f"🏗️  Populating {args.tasks} tasks...")
+        user_ids, task_ids = populate(db, tasks=args.tasks, comments=args.tasks, messages=args.tasks,
+                                      attachments=0)
+        bench_api(api_payloads(db, user_ids), args.repeat)
+        bench_socketio(socketio_payloads(db, task_ids), args.repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
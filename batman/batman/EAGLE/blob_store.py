@@ -0,0 +1,108 @@
+"""
+Content-addressed file storage for the Eagle Task Management System
+
+Attachment bytes are stored once per SHA-256 under <root>/ab/cd/<sha256>, no
+matter how many attachments point at them. The database owns the reference
+counts (blobs.ref_count, kept by triggers on file_attachments); this module
+only moves files. Placing a new blob and dropping a released one both happen
+inside the writer's transaction, and a released blob is first moved to
+.trash so a rollback can put it back.
+"""
+
+import hashlib
+import os
+import uuid
+from typing import BinaryIO, Iterator, Optional, Tuple
+
+BLOB_STORE_ROOT = os.getenv('EAGLE_BLOB_ROOT', os.path.join('uploads', 'blobs'))
+BLOB_IO_BLOCK = 64 * 1024
+
+
+class BlobStore:
+    """Files named by their SHA-256, plus staging and trash areas on the same filesystem"""
+
+    def __init__(self, root: str = BLOB_STORE_ROOT):
+        self.root = root
+        self.staging_dir = os.path.join(root, '.staging')
+        self.trash_dir = os.path.join(root, '.trash')
+
+    def path_for(self, digest: str) -> str:
+        # Two levels of fan-out keep directories small
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path_for(digest))
+
+    def stage(self, stream: BinaryIO) -> Tuple[str, str, int]:
+        """Copy a stream to a staging file while hashing it; returns (path, sha256, size)"""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        path = os.path.join(self.staging_dir, uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(path, 'wb') as f:
+                while True:
+                    block = stream.read(BLOB_IO_BLOCK)
+                    if not block:
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    size += len(block)
+        except Exception:
+            self.discard_staged(path)
+            raise
+        return path, hasher.hexdigest(), size
+
+    def adopt(self, staged_path: str, digest: str) -> str:
+        """Move a staged file into place as the blob for digest"""
+        path = self.path_for(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(staged_path, path)
+        return path
+
+    def discard_staged(self, staged_path: str):
+        try:
+            os.remove(staged_path)
+        except FileNotFoundError:
+            pass
+
+    def detach(self, digest: str) -> Optional[str]:
+        """Move a released blob to the trash; returns the trash path (None if it was already gone)"""
+        os.makedirs(self.trash_dir, exist_ok=True)
+        trash_path = os.path.join(self.trash_dir, f"{digest}.{uuid.uuid4().hex}")
+        try:
+            os.replace(self.path_for(digest), trash_path)
+        except FileNotFoundError:
+            return None
+        return trash_path
+
+    def restore(self, digest: str, trash_path: str):
+        """Undo detach() after the releasing transaction rolled back"""
+        try:
+            os.replace(trash_path, self.path_for(digest))
+        except FileNotFoundError:
+            pass  # already put back by the storage reconciler
+
+    def iter_digests(self) -> Iterator[str]:
+        """Digests of the stored files, walking the fan-out directories one at a time"""
+        for first in _subdirectories(self.root):
+            for second in _subdirectories(first):
+                with os.scandir(second) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            yield entry.name
+
+    def purge(self, trash_path: str):
+        try:
+            os.remove(trash_path)
+        except FileNotFoundError:
+            pass
+
+
+def _subdirectories(path: str) -> Iterator[str]:
+    try:
+        with os.scandir(path) as entries:
+            dirs = [entry.path for entry in entries if entry.is_dir() and not entry.name.startswith('.')]
+    except FileNotFoundError:
+        return
+    yield from dirs
@@ -271,21 +271,17 @@ class CLIInterface:
         self.clear_screen()
         self.print_header("TASK STATISTICS")
         
-        tasks = self.task_manager.view_all_tasks()
+        stats = self.task_manager.get_task_stats()
         
-        if not tasks:
+        if not stats or not stats['total']:
             print("No tasks found.")
         else:
-            pending = sum(1 for task in tasks if task['status'] == 'Pending')
-            in_progress = sum(1 for task in tasks if task['status'] == 'In Progress')
-            completed = sum(1 for task in tasks if task['status'] == 'Completed')
-            
             print(f"📊 Task Statistics:")
-            print(f"   Total Tasks: {len(tasks)}")
-            print(f"   ⏳ Pending: {pending}")
-            print(f"   🔄 In Progress: {in_progress}")
-            print(f"   ✅ Completed: {completed}")
-            print(f"   📈 Completion Rate: {(completed/len(tasks)*100):.1f}%")
+            print(f"   Total Tasks: {stats['total']}")
+            print(f"   ⏳ Pending: {stats['pending']}")
+            print(f"   🔄 In Progress: {stats['in_progress']}")
+            print(f"   ✅ Completed: {stats['completed']}")
+            print(f"   📈 Completion Rate: {(stats['completed']/stats['total']*100):.1f}%")
         
         input("\nPress Enter to continue...")
     
@@ -1,11 +1,394 @@
 
 import sqlite3
+import base64
 import hashlib
+import html
+import json
+import os
+import random
+from collections import deque
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, Tuple
 import threading
 import time
 
+from blob_store import BlobStore
+from cache import TTLCache
+from migrations import (ATTACHMENT_TEXT_SPAN, TASK_DEADLINE_SORT_KEY, apply_migrations, get_schema_version,
+                        latest_version)
+
+# Connection pool settings (overridable through the environment)
+POOL_MAX_SIZE = int(os.getenv('EAGLE_DB_POOL_SIZE', '10'))
+POOL_MAX_AGE = float(os.getenv('EAGLE_DB_POOL_MAX_AGE', '3600'))  # seconds
+POOL_HEALTH_CHECK_INTERVAL = float(os.getenv('EAGLE_DB_POOL_HEALTH_CHECK', '30'))  # seconds idle
+POOL_CHECKOUT_TIMEOUT = float(os.getenv('EAGLE_DB_POOL_TIMEOUT', '30'))
+
+# Concurrency settings: WAL lets readers run alongside the single writer connection
+DB_JOURNAL_MODE = os.getenv('EAGLE_DB_JOURNAL_MODE', 'WAL')
+DB_BUSY_TIMEOUT_MS = int(os.getenv('EAGLE_DB_BUSY_TIMEOUT_MS', '5000'))
+BUSY_MAX_RETRIES = 5
+BUSY_RETRY_DELAY = 0.05  # seconds, doubled per attempt and jittered
+
+# Reference data (companies, users, Telegram contacts) is cached in-process
+REFERENCE_CACHE_TTL = float(os.getenv('EAGLE_CACHE_TTL', '300'))  # seconds
+
+
+def fts_match_query(text: str) -> Optional[str]:
+    """Turn what a user typed into an FTS5 MATCH expression: every word must
+    appear, the last one as a prefix. Words are quoted, so FTS5 syntax in the
+    input is matched literally instead of failing the query."""
+    words = text.split()
+    if not words:
+        return None
+    terms = ['"' + word.replace('"', '""') + '"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+# snippet() marks matches with these; highlight_snippet() makes the result safe HTML
+SNIPPET_START, SNIPPET_END = '\x02', '\x03'
+
+
+def highlight_snippet(snippet: str) -> str:
+    """HTML-escape an FTS5 snippet of user content and wrap its matches in <mark>"""
+    return html.escape(snippet or '').replace(SNIPPET_START, '<mark>').replace(SNIPPET_END, '</mark>')
+
+
+# Search kinds for Database.search. Each query takes (snippet start, snippet end,
+# MATCH, company_id); 'visible' is appended for non-admins with the user id for
+# every placeholder. Column weights favour task titles over descriptions.
+SEARCH_KINDS = ('tasks', 'comments', 'messages', 'private_messages', 'attachments')
+SEARCH_QUERIES = {
+    'tasks': {
+        'index': 'tasks_fts',
+        'columns': 'title description',
+        'sql': '''
+            SELECT t.id, t.title, t.status, t.priority, t.deadline, u.username AS assigned_to,
+                   snippet(tasks_fts, 1, ?, ?, '…', 16) AS snippet, bm25(tasks_fts, 10.0, 1.0, 0.0) AS score
+            FROM tasks_fts
+            JOIN tasks t ON t.id = tasks_fts.rowid
+            LEFT JOIN users u ON u.id = t.assigned_to
+            WHERE tasks_fts MATCH ? AND t.company_id = ?
+        ''',
+        'visible': " AND EXISTS (SELECT 1 FROM task_watchers w WHERE w.task_id = t.id AND w.user_id = ?)",
+    },
+    'comments': {
+        'index': 'task_comments_fts',
+        'columns': 'comment',
+        'sql': '''
+            SELECT c.id, c.task_id, t.title AS task_title, u.username, c.created_at,
+                   snippet(task_comments_fts, 0, ?, ?, '…', 16) AS snippet, bm25(task_comments_fts) AS score
+            FROM task_comments_fts
+            JOIN task_comments c ON c.id = task_comments_fts.rowid
+            JOIN tasks t ON t.id = c.task_id
+            JOIN users u ON u.id = c.user_id
+            WHERE task_comments_fts MATCH ? AND t.company_id = ?
+        ''',
+        'visible': " AND EXISTS (SELECT 1 FROM task_watchers w WHERE w.task_id = t.id AND w.user_id = ?)",
+    },
+    'messages': {
+        'index': 'messages_fts',
+        'columns': 'message',
+        'sql': '''
+            SELECT m.id, u.username, m.user_id, m.receiver_id, m.timestamp,
+                   snippet(messages_fts, 0, ?, ?, '…', 16) AS snippet, bm25(messages_fts) AS score
+            FROM messages_fts
+            JOIN messages m ON m.id = messages_fts.rowid
+            JOIN users u ON u.id = m.user_id
+            WHERE messages_fts MATCH ? AND m.company_id = ?
+        ''',
+        'visible': " AND (m.receiver_id IS NULL OR m.user_id = ? OR m.receiver_id = ?)",
+    },
+    'private_messages': {
+        'index': 'private_messages_fts',
+        'columns': 'message',
+        'sql': '''
+            SELECT pm.id, s.username AS sender, r.username AS receiver, pm.sender_id, pm.receiver_id,
+                   pm.timestamp, snippet(private_messages_fts, 0, ?, ?, '…', 16) AS snippet,
+                   bm25(private_messages_fts) AS score
+            FROM private_messages_fts
+            JOIN private_messages pm ON pm.id = private_messages_fts.rowid
+            JOIN users s ON s.id = pm.sender_id
+            JOIN users r ON r.id = pm.receiver_id
+            WHERE private_messages_fts MATCH ? AND s.company_id = ?
+        ''',
+        'visible': " AND (pm.sender_id = ? OR pm.receiver_id = ?)",
+    },
+}
+
+
+def _is_busy_error(error: sqlite3.OperationalError) -> bool:
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def _busy_backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter so contending writers spread out"""
+    return BUSY_RETRY_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+
+class _RetryingCursor(sqlite3.Cursor):
+    """Cursor that retries a statement on SQLITE_BUSY outside of an open transaction.
+
+    Inside a transaction the statement is not retried: the surrounding
+    transaction has to be restarted by the caller instead.
+    """
+
+    def execute(self, sql, parameters=()):
+        for attempt in range(BUSY_MAX_RETRIES):
+            try:
+                return super().execute(sql, parameters)
+            except sqlite3.OperationalError as e:
+                if (not _is_busy_error(e) or attempt == BUSY_MAX_RETRIES - 1
+                        or self.connection.in_transaction):
+                    raise
+                time.sleep(_busy_backoff(attempt))
+
+    def executemany(self, sql, seq_of_parameters):
+        for attempt in range(BUSY_MAX_RETRIES):
+            try:
+                return super().executemany(sql, seq_of_parameters)
+            except sqlite3.OperationalError as e:
+                if (not _is_busy_error(e) or attempt == BUSY_MAX_RETRIES - 1
+                        or self.connection.in_transaction):
+                    raise
+                time.sleep(_busy_backoff(attempt))
+
+
+class _EagleConnection(sqlite3.Connection):
+    """sqlite3 connection whose cursors retry on SQLITE_BUSY"""
+
+    def cursor(self, factory=_RetryingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class _PooledEntry:
+    """A physical sqlite3 connection tracked by the pool"""
+    __slots__ = ('conn', 'created_at', 'last_used', 'depth', 'owner')
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.depth = 0
+        self.owner = None
+
+
+class PooledConnection:
+    """Handle returned by ConnectionPool.acquire().
+
+    Behaves like a sqlite3 connection; close() hands the connection back to
+    the pool instead of closing it. A handle that is dropped without being
+    closed is released when it is garbage collected.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', entry: _PooledEntry):
+        self._pool = pool
+        self._entry = entry
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._entry.conn, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Bounded pool of configured sqlite3 connections.
+
+    A thread (or greenlet, when threading is monkey-patched) that already holds
+    a connection gets the same one back on nested acquire() calls. Idle
+    connections are health-checked before reuse and recycled once they exceed
+    max_age.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection], max_size: int = POOL_MAX_SIZE,
+                 max_age: float = POOL_MAX_AGE, health_check_interval: float = POOL_HEALTH_CHECK_INTERVAL,
+                 timeout: float = POOL_CHECKOUT_TIMEOUT):
+        self._connect = connect
+        self.max_size = max(1, max_size)
+        self.max_age = max_age
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self._idle = deque()
+        self._size = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'unhealthy': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    def acquire(self) -> PooledConnection:
+        """Check out a connection for the current thread"""
+        ident = threading.get_ident()
+        entry = getattr(self._local, 'entry', None)
+        if entry is not None and entry.depth > 0 and entry.owner == ident:
+            entry.depth += 1
+            return PooledConnection(self, entry)
+
+        entry = self._checkout()
+        entry.depth = 1
+        entry.owner = ident
+        self._local.entry = entry
+        return PooledConnection(self, entry)
+
+    def release(self, entry: _PooledEntry):
+        """Return a connection handle; the connection goes back to the idle list at depth 0"""
+        entry.depth -= 1
+        if entry.depth > 0:
+            return
+
+        entry.owner = None
+        if getattr(self._local, 'entry', None) is entry:
+            self._local.entry = None
+
+        try:
+            if entry.conn.in_transaction:
+                entry.conn.rollback()
+        except sqlite3.Error:
+            self._discard(entry, 'unhealthy')
+            return
+
+        now = time.monotonic()
+        if now - entry.created_at > self.max_age:
+            self._discard(entry, 'recycled')
+            return
+
+        entry.last_used = now
+        with self._cond:
+            self._idle.append(entry)
+            self._cond.notify()
+
+    def _checkout(self) -> _PooledEntry:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                if not self._idle and self._size >= self.max_size:
+                    self._stats['waits'] += 1
+                    while not self._idle and self._size >= self.max_size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._stats['timeouts'] += 1
+                            raise sqlite3.OperationalError("database connection pool exhausted")
+                        self._cond.wait(remaining)
+                if self._idle:
+                    entry = self._idle.pop()
+                else:
+                    entry = None
+                    self._size += 1
+
+            if entry is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+                return _PooledEntry(conn)
+
+            if self._is_usable(entry):
+                with self._cond:
+                    self._stats['reused'] += 1
+                return entry
+
+    def _is_usable(self, entry: _PooledEntry) -> bool:
+        now = time.monotonic()
+        if now - entry.created_at > self.max_age:
+            self._discard(entry, 'recycled')
+            return False
+        if now - entry.last_used > self.health_check_interval:
+            try:
+                entry.conn.execute('SELECT 1').fetchone()
+            except sqlite3.Error:
+                self._discard(entry, 'unhealthy')
+                return False
+        return True
+
+    def _discard(self, entry: _PooledEntry, reason: str):
+        try:
+            entry.conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats[reason] += 1
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            try:
+                entry.conn.close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool counters"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'max_size': self.max_size,
+            })
+        return stats
+
+
+TASK_PAGE_MAX_LIMIT = 200
+TASK_CHANGES_MAX_LIMIT = 1000
+
+
+def _encode_cursor(values: list) -> str:
+    """Opaque keyset cursor for the client to send back"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or not values:
+        raise ValueError("Invalid cursor")
+    return values
+
+
 class Database:
     _instance = None
     _lock = threading.Lock()
@@ -22,218 +405,73 @@ class Database:
             return
         
         self.db_path = db_path
-        self.local_lock = threading.RLock()
+        # Readers share a pool; every write goes through the one writer connection
+        self.pool = ConnectionPool(self._connect)
+        self.writer_pool = ConnectionPool(lambda: self._connect(writer=True), max_size=1)
+        self.cache = TTLCache(REFERENCE_CACHE_TTL)
+        self.blob_store = BlobStore()
         self.initialized = True
         self.init_database()
 
-    def get_connection(self):
-        """Get a database connection with proper error handling"""
-        max_retries = 5
-        retry_delay = 0.1
-        
-        for attempt in range(max_retries):
+    def _connect(self, writer: bool = False) -> sqlite3.Connection:
+        """Open and configure a new physical connection with proper error handling"""
+        for attempt in range(BUSY_MAX_RETRIES):
             try:
                 conn = sqlite3.connect(
                     self.db_path, 
-                    timeout=30.0,
+                    timeout=DB_BUSY_TIMEOUT_MS / 1000.0,
                     check_same_thread=False,
-                    isolation_level=None
+                    isolation_level=None,
+                    factory=_EagleConnection
                 )
-                conn.execute('PRAGMA journal_mode=DELETE;')  # Changed from WAL to DELETE
+                conn.execute(f'PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS};')
+                conn.execute(f'PRAGMA journal_mode={DB_JOURNAL_MODE};')
                 conn.execute('PRAGMA synchronous=NORMAL;')
                 conn.execute('PRAGMA temp_store=MEMORY;')
                 conn.execute('PRAGMA mmap_size=268435456;')  # 256MB
+                if not writer:
+                    # Guard the single-writer design: reader connections cannot write
+                    conn.execute('PRAGMA query_only=1;')
                 return conn
             except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < max_retries - 1:
-                    time.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
+                if _is_busy_error(e) and attempt < BUSY_MAX_RETRIES - 1:
+                    time.sleep(_busy_backoff(attempt))
                     continue
                 raise e
 
-    def init_database(self):
-        """Initialize database with required tables"""
-        with self.local_lock:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-
-            # Check if tasks table exists and has the new columns
-            cursor.execute("PRAGMA table_info(tasks)")
-            columns = [column[1] for column in cursor.fetchall()]
-            
-            if 'start_date' not in columns or 'deadline' not in columns or 'priority' not in columns:
-                # Drop and recreate tables with new schema
-                cursor.execute("DROP TABLE IF EXISTS task_comments")
-                cursor.execute("DROP TABLE IF EXISTS messages")
-                cursor.execute("DROP TABLE IF EXISTS tasks")
-                cursor.execute("DROP TABLE IF EXISTS users")
-                cursor.execute("DROP TABLE IF EXISTS companies")
-
-            # Companies table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS companies (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL UNIQUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            # Users table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT NOT NULL UNIQUE,
-                    password_hash TEXT NOT NULL,
-                    role TEXT NOT NULL CHECK (role IN ('Admin', 'Manager', 'Employee')),
-                    company_id INTEGER NOT NULL,
-                    is_active BOOLEAN DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (company_id) REFERENCES companies (id)
-                )
-            ''')
-
-            # Add is_active column to existing users table if it doesn't exist
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'is_active' not in columns:
-                cursor.execute("ALTER TABLE users ADD COLUMN is_active BOOLEAN DEFAULT 1")
-
-            # Tasks table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    assigned_to INTEGER NOT NULL,
-                    company_id INTEGER NOT NULL,
-                    status TEXT NOT NULL DEFAULT 'Pending' CHECK (status IN ('Pending', 'In Progress', 'Completed')),
-                    start_date DATE,
-                    deadline DATE,
-                    priority TEXT NOT NULL DEFAULT 'Medium' CHECK (priority IN ('Low', 'Medium', 'High', 'Critical')),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (assigned_to) REFERENCES users (id),
-                    FOREIGN KEY (company_id) REFERENCES companies (id)
-                )
-            ''')
-
-            # Task Comments table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS task_comments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    task_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    comment TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (task_id) REFERENCES tasks (id),
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
-
-            # Messages table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    company_id INTEGER NOT NULL,
-                    message TEXT NOT NULL,
-                    receiver_id INTEGER,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id),
-                    FOREIGN KEY (company_id) REFERENCES companies (id),
-                    FOREIGN KEY (receiver_id) REFERENCES users (id)
-                )
-            ''')
-
-            # Private Messages table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS private_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    sender_id INTEGER NOT NULL,
-                    receiver_id INTEGER NOT NULL,
-                    message TEXT NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (sender_id) REFERENCES users (id),
-                    FOREIGN KEY (receiver_id) REFERENCES users (id)
-                )
-            ''')
-
-            # Reminders table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    title TEXT NOT NULL,
-                    description TEXT,
-                    reminder_date DATE NOT NULL,
-                    alert_days_before INTEGER DEFAULT 1,
-                    is_active BOOLEAN DEFAULT 1,
-                    company_id INTEGER NOT NULL,
-                    created_by INTEGER NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (company_id) REFERENCES companies (id),
-                    FOREIGN KEY (created_by) REFERENCES users (id)
-                )
-            ''')
-
-            # File attachments table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS file_attachments (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    task_id INTEGER NOT NULL,
-                    filename TEXT NOT NULL,
-                    original_filename TEXT NOT NULL,
-                    file_path TEXT NOT NULL,
-                    file_size INTEGER,
-                    file_type TEXT,
-                    uploaded_by INTEGER NOT NULL,
-                    upload_type TEXT NOT NULL CHECK (upload_type IN ('task_assignment', 'task_progress')),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (task_id) REFERENCES tasks (id),
-                    FOREIGN KEY (uploaded_by) REFERENCES users (id)
-                )
-            ''')
+    def get_connection(self) -> PooledConnection:
+        """Get a pooled read-only connection; close() returns it to the pool"""
+        return self.pool.acquire()
 
-            # Update task_comments table to support unread status
-            cursor.execute("PRAGMA table_info(task_comments)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'is_read' not in columns:
-                cursor.execute("ALTER TABLE task_comments ADD COLUMN is_read BOOLEAN DEFAULT 0")
+    def get_write_connection(self) -> PooledConnection:
+        """Get the writer connection; callers queue here so writes are serialized"""
+        return self.writer_pool.acquire()
 
-            # Push subscriptions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS push_subscriptions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    endpoint TEXT NOT NULL,
-                    p256dh TEXT,
-                    auth TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Get connection pool statistics"""
+        return {
+            'readers': self.pool.stats(),
+            'writer': self.writer_pool.stats(),
+            'journal_mode': DB_JOURNAL_MODE,
+            'busy_timeout_ms': DB_BUSY_TIMEOUT_MS,
+        }
 
-            # Notifications table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS notifications (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    message TEXT NOT NULL,
-                    is_read BOOLEAN DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id)
-                )
-            ''')
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Get reference data cache statistics"""
+        return self.cache.stats()
 
-            # Add telegram_chat_id column to users table if it doesn't exist
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [column[1] for column in cursor.fetchall()]
-            if 'telegram_chat_id' not in columns:
-                cursor.execute("ALTER TABLE users ADD COLUMN telegram_chat_id TEXT")
-            
-            # Add mobile_number column to users table if it doesn't exist
-            if 'mobile_number' not in columns:
-                cursor.execute("ALTER TABLE users ADD COLUMN mobile_number TEXT")
+    def init_database(self):
+        """Bring the schema up to date; a current database costs one PRAGMA read"""
+        conn = self.get_connection()
+        version = get_schema_version(conn)
+        conn.close()
+        if version >= latest_version():
+            return
 
-            conn.commit()
+        conn = self.get_write_connection()
+        try:
+            apply_migrations(conn)
+        finally:
             conn.close()
 
     def hash_password(self, password: str) -> str:
@@ -247,99 +485,109 @@ class Database:
     # Company methods
     def create_company(self, name: str) -> bool:
         """Create a new company"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute("INSERT INTO companies (name) VALUES (?)", (name,))
-                conn.commit()
-                conn.close()
-                return True
-            except sqlite3.IntegrityError:
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("INSERT INTO companies (name) VALUES (?)", (name,))
+            conn.commit()
+            self.cache.invalidate(('companies',))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            conn.close()
 
     def get_companies(self) -> List[Dict]:
-        """Get all companies"""
-        with self.local_lock:
-            conn = self.get_connection()
+        """Get all companies (cached)"""
+        companies = self.cache.get_or_load(('companies',), self._load_companies)
+        return [dict(company) for company in companies]
+
+    def _load_companies(self) -> List[Dict]:
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute("SELECT id, name FROM companies")
             companies = [{"id": row[0], "name": row[1]} for row in cursor.fetchall()]
-            conn.close()
             return companies
+        finally:
+            conn.close()
 
     # User methods
     def create_user(self, username: str, password: str, role: str, company_id: int) -> bool:
         """Create a new user"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                password_hash = self.hash_password(password)
-                cursor.execute(
-                    "INSERT INTO users (username, password_hash, role, company_id) VALUES (?, ?, ?, ?)",
-                    (username, password_hash, role, company_id)
-                )
-                conn.commit()
-                conn.close()
-                return True
-            except sqlite3.IntegrityError:
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            password_hash = self.hash_password(password)
+            cursor.execute(
+                "INSERT INTO users (username, password_hash, role, company_id) VALUES (?, ?, ?, ?)",
+                (username, password_hash, role, company_id)
+            )
+            user_id = cursor.lastrowid
+            conn.commit()
+            self.cache.invalidate(('company_users', company_id))
+            self.cache.invalidate(('user_contact', user_id))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            conn.close()
 
     def update_user_telegram_chat_id(self, user_id: int, telegram_chat_id: str) -> bool:
         """Update user's Telegram chat ID"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE users SET telegram_chat_id = ? WHERE id = ?",
-                    (telegram_chat_id, user_id)
-                )
-                conn.commit()
-                success = cursor.rowcount > 0
-                conn.close()
-                return success
-            except sqlite3.Error:
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET telegram_chat_id = ? WHERE id = ?",
+                (telegram_chat_id, user_id)
+            )
+            conn.commit()
+            success = cursor.rowcount > 0
+            self.cache.invalidate(('user_contact', user_id))
+            return success
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
     
     def set_user_telegram_chat_id_by_username(self, username: str, telegram_chat_id: str) -> bool:
         """Set Telegram chat ID for user by username"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE users SET telegram_chat_id = ? WHERE username = ?",
-                    (telegram_chat_id, username)
-                )
-                conn.commit()
-                success = cursor.rowcount > 0
-                conn.close()
-                print(f"✅ Updated Telegram chat ID for {username}: {telegram_chat_id}")
-                return success
-            except sqlite3.Error as e:
-                print(f"❌ Error updating chat ID: {e}")
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE users SET telegram_chat_id = ? WHERE username = ?",
+                (telegram_chat_id, username)
+            )
+            conn.commit()
+            success = cursor.rowcount > 0
+            self.cache.invalidate_kind('user_contact')
+            print(f"✅ Updated Telegram chat ID for {username}: {telegram_chat_id}")
+            return success
+        except sqlite3.Error as e:
+            print(f"❌ Error updating chat ID: {e}")
+            return False
+        finally:
+            conn.close()
 
     def authenticate_user(self, identifier: str, password: str) -> Optional[Dict]:
         """Authenticate user with username or mobile number and return user info"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT id, username, role, company_id, password_hash, is_active, mobile_number FROM users WHERE username = ? OR mobile_number = ?",
                 (identifier, identifier)
             )
             user = cursor.fetchone()
-            conn.close()
 
             if user and self.verify_password(password, user[4]):
                 # Check if user is active
                 is_active = user[5] if len(user) > 5 else True
                 if not is_active:
                     return None  # Don't allow login for deactivated users
-                
+            
                 return {
                     "id": user[0],
                     "username": user[1],
@@ -348,42 +596,78 @@ class Database:
                     "mobile_number": user[6]
                 }
             return None
+        finally:
+            conn.close()
 
     def get_users_by_company(self, company_id: int) -> List[Dict]:
-        """Get all users in a company"""
-        with self.local_lock:
-            conn = self.get_connection()
+        """Get all users in a company (cached)"""
+        users = self.cache.get_or_load(('company_users', company_id),
+                                       lambda: self._load_users_by_company(company_id))
+        return [dict(user) for user in users]
+
+    def _load_users_by_company(self, company_id: int) -> List[Dict]:
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT id, username, role FROM users WHERE company_id = ?",
                 (company_id,)
             )
             users = [{"id": row[0], "username": row[1], "role": row[2]} for row in cursor.fetchall()]
-            conn.close()
             return users
+        finally:
+            conn.close()
+
+    def get_user_contact(self, user_id: int) -> Optional[Dict]:
+        """Get a user's username and Telegram chat ID for notifications (cached)"""
+        contact = self.cache.get_or_load(('user_contact', user_id), lambda: self._load_user_contact(user_id))
+        return dict(contact) if contact else None
+
+    def _load_user_contact(self, user_id: int) -> Optional[Dict]:
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT telegram_chat_id, username FROM users WHERE id = ?", (user_id,))
+            row = cursor.fetchone()
+            if not row:
+                return None
+            return {"telegram_chat_id": row[0], "username": row[1]}
+        finally:
+            conn.close()
 
     # Task methods
     def create_task(self, title: str, description: str, assigned_to: int, company_id: int, 
-                   start_date: str = None, deadline: str = None, priority: str = 'Medium') -> bool:
-        """Create a new task"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO tasks (title, description, assigned_to, company_id, start_date, deadline, priority) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                    (title, description, assigned_to, company_id, start_date, deadline, priority)
-                )
-                conn.commit()
-                conn.close()
-                return True
-            except sqlite3.Error:
-                return False
+                   start_date: str = None, deadline: str = None, priority: str = 'Medium',
+                   outbox: List[Tuple[str, int, Dict]] = None) -> Optional[int]:
+        """Create a new task and return its id (None on failure).
+
+        outbox holds (channel, user_id, payload) notifications that are queued
+        in the same transaction, so they exist exactly when the task does.
+        """
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(
+                "INSERT INTO tasks (title, description, assigned_to, company_id, start_date, deadline, priority) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (title, description, assigned_to, company_id, start_date, deadline, priority)
+            )
+            task_id = cursor.lastrowid
+            for channel, user_id, payload in outbox or []:
+                self._insert_outbox(cursor, channel, user_id, payload)
+            cursor.execute("COMMIT")
+            return task_id
+        except sqlite3.Error:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            return None
+        finally:
+            conn.close()
 
     def get_tasks_by_company(self, company_id: int) -> List[Dict]:
         """Get all tasks for a company, sorted by deadline (closest first)"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT t.id, t.title, t.description, t.status, t.created_at, t.updated_at,
@@ -391,13 +675,7 @@ class Database:
                 FROM tasks t
                 LEFT JOIN users u ON t.assigned_to = u.id
                 WHERE t.company_id = ?
-                ORDER BY 
-                    CASE 
-                        WHEN t.deadline IS NULL THEN 1 
-                        ELSE 0 
-                    END,
-                    t.deadline ASC,
-                    t.created_at DESC
+                ORDER BY COALESCE(t.deadline, '9999-12-31') ASC, t.id DESC
             ''', (company_id,))
 
             tasks = []
@@ -415,13 +693,14 @@ class Database:
                     "priority": row[9],
                     "assigned_to": row[10]
                 })
-            conn.close()
             return tasks
+        finally:
+            conn.close()
 
     def get_user_tasks(self, user_id: int, company_id: int) -> List[Dict]:
         """Get tasks assigned to a specific user"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT t.id, t.title, t.description, t.status, t.created_at, t.updated_at,
@@ -429,7 +708,7 @@ class Database:
                 FROM tasks t
                 LEFT JOIN users u ON t.assigned_to = u.id
                 WHERE t.assigned_to = ? AND t.company_id = ?
-                ORDER BY t.created_at DESC
+                ORDER BY t.id DESC
             ''', (user_id, company_id))
 
             tasks = []
@@ -446,167 +725,368 @@ class Database:
                     "deadline": row[8],
                     "priority": row[9]
                 })
-            conn.close()
             return tasks
+        finally:
+            conn.close()
+
+    def get_tasks_page(self, company_id: int, assigned_to: int = None, status: str = None,
+                       priority: str = None, deadline_from: str = None, deadline_to: str = None,
+                       sort: str = 'deadline', cursor: str = None, limit: int = 50) -> Dict:
+        """Get one keyset-paginated page of tasks with server-side filters.
+
+        sort='deadline' orders by deadline (no deadline last) then newest first;
+        sort='created' orders newest first. Returns {'tasks', 'next_cursor'}.
+        """
+        if sort not in ('deadline', 'created'):
+            raise ValueError("Invalid sort")
+        limit = max(1, min(int(limit), TASK_PAGE_MAX_LIMIT))
+        sort_key = TASK_DEADLINE_SORT_KEY.replace('deadline', 't.deadline')
+
+        conditions = ["t.company_id = ?"]
+        values = [company_id]
+        if assigned_to:
+            conditions.append("t.assigned_to = ?")
+            values.append(assigned_to)
+        if status:
+            conditions.append("t.status = ?")
+            values.append(status)
+        if priority:
+            conditions.append("t.priority = ?")
+            values.append(priority)
+        if deadline_from or deadline_to:
+            conditions.append("t.deadline IS NOT NULL")
+        if deadline_from:
+            conditions.append(f"{sort_key} >= ?")
+            values.append(deadline_from)
+        if deadline_to:
+            conditions.append(f"{sort_key} <= ?")
+            values.append(deadline_to)
+
+        if cursor:
+            after = _decode_cursor(cursor)
+            if after[0] != sort or len(after) != (3 if sort == 'deadline' else 2):
+                raise ValueError("Invalid cursor")
+            if sort == 'deadline':
+                # Written as a range plus a tie-break so the index can seek to the cursor
+                conditions.append(f"{sort_key} >= ? AND ({sort_key} > ? OR t.id < ?)")
+                values.extend([after[1], after[1], after[2]])
+            else:
+                conditions.append("t.id < ?")
+                values.append(after[1])
+
+        order_by = f"{sort_key} ASC, t.id DESC" if sort == 'deadline' else "t.id DESC"
+        conn = self.get_connection()
+        try:
+            db_cursor = conn.cursor()
+            db_cursor.execute(f'''
+                SELECT t.id, t.title, t.description, t.status, t.created_at, t.updated_at,
+                       u.username, t.start_date, t.deadline, t.priority, t.assigned_to,
+                       {sort_key}
+                FROM tasks t
+                LEFT JOIN users u ON t.assigned_to = u.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY {order_by}
+                LIMIT ?
+            ''', values + [limit + 1])
+            rows = db_cursor.fetchall()
+
+            next_cursor = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                last = rows[-1]
+                next_cursor = _encode_cursor(['deadline', last[11], last[0]] if sort == 'deadline' else ['created', last[0]])
+
+            tasks = []
+            for row in rows:
+                tasks.append({
+                    "id": row[0],
+                    "title": row[1],
+                    "description": row[2],
+                    "status": row[3],
+                    "created_at": row[4],
+                    "updated_at": row[5],
+                    "assigned_to_name": row[6],
+                    "start_date": row[7],
+                    "deadline": row[8],
+                    "priority": row[9],
+                    "assigned_to": row[10]
+                })
+            return {'tasks': tasks, 'next_cursor': next_cursor}
+        finally:
+            conn.close()
+
+    def get_task_changes(self, company_id: int, since: int = 0, assigned_to: int = None,
+                         limit: int = 500) -> Dict:
+        """Get tasks changed or removed after change sequence `since`.
+
+        Returns {'tasks', 'deleted', 'cursor', 'has_more'}: clients drop the
+        deleted ids, upsert the tasks and send cursor back as since. since=0
+        is a full sync.
+        """
+        limit = max(1, min(int(limit), TASK_CHANGES_MAX_LIMIT))
+        conditions = ["company_id = ?"]
+        params = [company_id]
+        if assigned_to:
+            conditions.append("assigned_to = ?")
+            params.append(assigned_to)
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        # One read transaction so tasks and tombstones come from the same snapshot
+        cursor.execute("BEGIN")
+        try:
+            cursor.execute(f'''
+                SELECT t.id, t.title, t.description, t.status, t.created_at, t.updated_at,
+                       u.username, t.start_date, t.deadline, t.priority, t.assigned_to, t.change_seq
+                FROM tasks t
+                LEFT JOIN users u ON t.assigned_to = u.id
+                WHERE {' AND '.join('t.' + condition for condition in conditions)}
+                  AND t.change_seq > ?
+                ORDER BY t.change_seq
+                LIMIT ?
+            ''', params + [since, limit + 1])
+            task_rows = cursor.fetchall()
+
+            tombstones = []
+            if since > 0:
+                # A reassignment only removes a task from the old assignee's view
+                reason = "" if assigned_to else "AND reason = 'deleted'"
+                cursor.execute(f'''
+                    SELECT task_id, change_seq FROM task_tombstones
+                    WHERE {' AND '.join(conditions)} AND change_seq > ? {reason}
+                    ORDER BY change_seq
+                    LIMIT ?
+                ''', params + [since, limit + 1])
+                tombstones = cursor.fetchall()
+        finally:
+            cursor.execute("COMMIT")
+            conn.close()
+
+        # Merge both streams in sequence order; each was fetched limit + 1 deep,
+        # so the first `limit` merged events are exactly the next page
+        events = [(row[11], 'task', row) for row in task_rows] + [(seq, 'deleted', task_id) for task_id, seq in tombstones]
+        events.sort(key=lambda event: event[0])
+        has_more = len(events) > limit
+        events = events[:limit]
+
+        tasks = []
+        for seq, kind, row in events:
+            if kind != 'task':
+                continue
+            tasks.append({
+                "id": row[0],
+                "title": row[1],
+                "description": row[2],
+                "status": row[3],
+                "created_at": row[4],
+                "updated_at": row[5],
+                "assigned_to_name": row[6],
+                "start_date": row[7],
+                "deadline": row[8],
+                "priority": row[9],
+                "assigned_to": row[10],
+                "change_seq": seq
+            })
+        # A task's current row is newer than any of its tombstones, so a task
+        # that is in this page (e.g. reassigned back) is not deleted
+        present = {task["id"] for task in tasks}
+        deleted = list(dict.fromkeys(row for _, kind, row in events if kind == 'deleted' and row not in present))
+
+        return {
+            'tasks': tasks,
+            'deleted': deleted,
+            'cursor': events[-1][0] if events else since,
+            'has_more': has_more
+        }
+
+    def get_task_stats(self, company_id: int, assigned_to: int = None) -> Dict:
+        """Get task counts by status and priority from the trigger-maintained counters"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT status, priority, task_count FROM task_counters
+                WHERE company_id = ? AND assigned_to = ?
+            ''', (company_id, assigned_to or 0))
+
+            by_status = {'Pending': 0, 'In Progress': 0, 'Completed': 0}
+            by_priority = {'Critical': 0, 'High': 0, 'Medium': 0, 'Low': 0}
+            for status, priority, count in cursor.fetchall():
+                by_status[status] = by_status.get(status, 0) + count
+                by_priority[priority] = by_priority.get(priority, 0) + count
+
+            return {
+                'total': sum(by_status.values()),
+                'pending': by_status['Pending'],
+                'in_progress': by_status['In Progress'],
+                'completed': by_status['Completed'],
+                'by_priority': {
+                    'critical': by_priority['Critical'],
+                    'high': by_priority['High'],
+                    'medium': by_priority['Medium'],
+                    'low': by_priority['Low']
+                }
+            }
+        finally:
+            conn.close()
 
     def update_task_status(self, task_id: int, status: str, user_id: int) -> bool:
         """Update task status (only if task belongs to user and not already completed)"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                # First check if task is already completed - prevent further changes
-                cursor.execute('''
-                    SELECT status FROM tasks 
-                    WHERE id = ? AND assigned_to = ?
-                ''', (task_id, user_id))
-                result = cursor.fetchone()
-                
-                if not result:
-                    conn.close()
-                    return False
-                
-                current_status = result[0]
-                if current_status == 'Completed':
-                    # Task is already completed, no further changes allowed
-                    conn.close()
-                    return False
-                
-                # Update status only if task is not completed
-                cursor.execute('''
-                    UPDATE tasks 
-                    SET status = ?, updated_at = CURRENT_TIMESTAMP 
-                    WHERE id = ? AND assigned_to = ? AND status != 'Completed'
-                ''', (status, task_id, user_id))
-
-                success = cursor.rowcount > 0
-                conn.commit()
-                conn.close()
-                return success
-            except sqlite3.Error:
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # First check if task is already completed - prevent further changes
+            cursor.execute('''
+                SELECT status FROM tasks 
+                WHERE id = ? AND assigned_to = ?
+            ''', (task_id, user_id))
+            result = cursor.fetchone()
+            
+            if not result:
+                return False
+            
+            current_status = result[0]
+            if current_status == 'Completed':
+                # Task is already completed, no further changes allowed
                 return False
+            
+            # Update status only if task is not completed
+            cursor.execute('''
+                UPDATE tasks 
+                SET status = ?, updated_at = CURRENT_TIMESTAMP 
+                WHERE id = ? AND assigned_to = ? AND status != 'Completed'
+            ''', (status, task_id, user_id))
+
+            success = cursor.rowcount > 0
+            conn.commit()
+            return success
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
 
     def admin_update_task(self, task_id: int, title: str, description: str, assigned_to: int, 
                          start_date: str = None, deadline: str = None, priority: str = 'Medium', 
                          status: str = None, company_id: int = None) -> bool:
         """Update task (Admin only)"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                # Build update query dynamically based on provided fields
-                update_fields = []
-                values = []
-                
-                if title:
-                    update_fields.append("title = ?")
-                    values.append(title)
-                if description is not None:
-                    update_fields.append("description = ?")
-                    values.append(description)
-                if assigned_to:
-                    update_fields.append("assigned_to = ?")
-                    values.append(assigned_to)
-                if start_date is not None:
-                    update_fields.append("start_date = ?")
-                    values.append(start_date)
-                if deadline is not None:
-                    update_fields.append("deadline = ?")
-                    values.append(deadline)
-                if priority:
-                    update_fields.append("priority = ?")
-                    values.append(priority)
-                if status:
-                    update_fields.append("status = ?")
-                    values.append(status)
-                
-                update_fields.append("updated_at = CURRENT_TIMESTAMP")
-                
-                query = f"UPDATE tasks SET {', '.join(update_fields)} WHERE id = ?"
-                if company_id:
-                    query += " AND company_id = ?"
-                    values.extend([task_id, company_id])
-                else:
-                    values.append(task_id)
-                
-                cursor.execute(query, values)
-                success = cursor.rowcount > 0
-                conn.commit()
-                conn.close()
-                return success
-            except sqlite3.Error as e:
-                print(f"Error updating task: {e}")
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # Build update query dynamically based on provided fields
+            update_fields = []
+            values = []
+            
+            if title:
+                update_fields.append("title = ?")
+                values.append(title)
+            if description is not None:
+                update_fields.append("description = ?")
+                values.append(description)
+            if assigned_to:
+                update_fields.append("assigned_to = ?")
+                values.append(assigned_to)
+            if start_date is not None:
+                update_fields.append("start_date = ?")
+                values.append(start_date)
+            if deadline is not None:
+                update_fields.append("deadline = ?")
+                values.append(deadline)
+            if priority:
+                update_fields.append("priority = ?")
+                values.append(priority)
+            if status:
+                update_fields.append("status = ?")
+                values.append(status)
+            
+            update_fields.append("updated_at = CURRENT_TIMESTAMP")
+            
+            query = f"UPDATE tasks SET {', '.join(update_fields)} WHERE id = ?"
+            if company_id:
+                query += " AND company_id = ?"
+                values.extend([task_id, company_id])
+            else:
+                values.append(task_id)
+            
+            cursor.execute(query, values)
+            success = cursor.rowcount > 0
+            conn.commit()
+            return success
+        except sqlite3.Error as e:
+            print(f"Error updating task: {e}")
+            return False
+        finally:
+            conn.close()
 
     def admin_delete_task(self, task_id: int, company_id: int) -> bool:
         """Delete task (Admin only)"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                # Delete task comments first
-                cursor.execute("DELETE FROM task_comments WHERE task_id = ?", (task_id,))
-                
-                # Delete file attachments
-                cursor.execute("DELETE FROM file_attachments WHERE task_id = ?", (task_id,))
-                
-                # Delete the task
-                cursor.execute("DELETE FROM tasks WHERE id = ? AND company_id = ?", (task_id, company_id))
-                
-                success = cursor.rowcount > 0
-                conn.commit()
-                conn.close()
-                return success
-            except sqlite3.Error as e:
-                print(f"Error deleting task: {e}")
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # Delete task comments first
+            cursor.execute("DELETE FROM task_comments WHERE task_id = ?", (task_id,))
+            
+            # Delete file attachments; blobs left unreferenced go to the storage reconciler
+            cursor.execute("DELETE FROM file_attachments WHERE task_id = ?", (task_id,))
+            
+            # Delete the task
+            cursor.execute("DELETE FROM tasks WHERE id = ? AND company_id = ?", (task_id, company_id))
+            
+            success = cursor.rowcount > 0
+            cursor.execute("COMMIT")
+            return success
+        except sqlite3.Error as e:
+            print(f"Error deleting task: {e}")
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            return False
+        finally:
+            conn.close()
 
     # Message methods
     def create_message(self, user_id, company_id, message, receiver_id=None):
         """Create a new message"""
-        with self.local_lock:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            try:
-                cursor.execute('''
-                    INSERT INTO messages (user_id, company_id, message, receiver_id)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, company_id, message, receiver_id))
-                conn.commit()
-                message_id = cursor.lastrowid
-                conn.close()
-                return message_id
-            except sqlite3.Error as e:
-                print(f"Error creating message: {e}")
-                conn.close()
-                return None
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO messages (user_id, company_id, message, receiver_id)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, company_id, message, receiver_id))
+            conn.commit()
+            message_id = cursor.lastrowid
+            return message_id
+        except sqlite3.Error as e:
+            print(f"Error creating message: {e}")
+            return None
+        finally:
+            conn.close()
 
     def create_private_message(self, sender_id, receiver_id, message):
         """Create a private message between users"""
-        with self.local_lock:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            try:
-                cursor.execute('''
-                    INSERT INTO private_messages (sender_id, receiver_id, message)
-                    VALUES (?, ?, ?)
-                ''', (sender_id, receiver_id, message))
-                conn.commit()
-                message_id = cursor.lastrowid
-                conn.close()
-                return message_id
-            except sqlite3.Error as e:
-                print(f"Error creating private message: {e}")
-                conn.close()
-                return None
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                INSERT INTO private_messages (sender_id, receiver_id, message)
+                VALUES (?, ?, ?)
+            ''', (sender_id, receiver_id, message))
+            conn.commit()
+            message_id = cursor.lastrowid
+            return message_id
+        except sqlite3.Error as e:
+            print(f"Error creating private message: {e}")
+            return None
+        finally:
+            conn.close()
 
     def get_company_messages(self, company_id, limit=50):
         """Get messages for a company"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT m.id, m.message, m.timestamp, u.username, u.id as user_id, m.receiver_id
@@ -627,14 +1107,15 @@ class Database:
                     'user_id': row[4],
                     'receiver_id': row[5]
                 })
-            
-            conn.close()
+        
             return messages[::-1]  # Reverse to show oldest first
+        finally:
+            conn.close()
 
     def get_all_company_messages(self, company_id=None, limit=50):
         """Get all messages for admin view"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             if company_id:
                 cursor.execute('''
@@ -671,14 +1152,15 @@ class Database:
                     'company_name': row[5],
                     'receiver_username': row[6]
                 })
-            
-            conn.close()
+        
             return messages[::-1]
+        finally:
+            conn.close()
 
     def get_private_messages(self, user1_id, user2_id, limit=50):
         """Get private messages between two users"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT pm.id, pm.message, pm.timestamp, 
@@ -705,13 +1187,14 @@ class Database:
                     'receiver_id': row[6]
                 })
 
-            conn.close()
             return messages[::-1]
+        finally:
+            conn.close()
 
     def get_all_private_messages_for_admin(self, limit=100):
         """Get all private messages across all users for admin monitoring"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT pm.id, pm.message, pm.timestamp, 
@@ -740,16 +1223,17 @@ class Database:
                     'sender_company': row[7],
                     'receiver_company': row[8]
                 })
-            
-            conn.close()
+        
             return messages[::-1]
+        finally:
+            conn.close()
 
     def get_private_messages_with_admin_filter(self, user_id, is_admin=False, limit=50):
         """Get private messages based on user role - admin sees all admin chats, users only see their own admin chats"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
-            
+        
             if is_admin:
                 # Admin sees all private messages
                 cursor.execute('''
@@ -788,14 +1272,15 @@ class Database:
                     'receiver_name': row[5],
                     'receiver_id': row[6]
                 })
-            
-            conn.close()
+        
             return messages[::-1]
+        finally:
+            conn.close()
 
     def get_all_users(self):
         """Get all users across all companies (Admin only)"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT u.id, u.username, u.role, c.name as company_name, u.company_id, u.is_active, u.mobile_number
@@ -803,7 +1288,7 @@ class Database:
                 JOIN companies c ON u.company_id = c.id
                 ORDER BY c.name, u.username
             ''')
-            
+        
             users = []
             for row in cursor.fetchall():
                 users.append({
@@ -815,123 +1300,130 @@ class Database:
                     "is_active": row[5] if len(row) > 5 else True,
                     "mobile_number": row[6] if len(row) > 6 else None
                 })
-            conn.close()
             return users
+        finally:
+            conn.close()
+
+    def _invalidate_user(self, user_id: int):
+        """Drop cached reference data that may include this user"""
+        self.cache.invalidate(('user_contact', user_id))
+        self.cache.invalidate_kind('company_users')
 
     def deactivate_user(self, user_id: int, admin_company_id: int = None) -> bool:
         """Deactivate a user (Admin only)"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                # Admin can deactivate users from any company, but let's add a check
-                if admin_company_id:
-                    cursor.execute("UPDATE users SET is_active = 0 WHERE id = ? AND company_id = ?", 
-                                 (user_id, admin_company_id))
-                else:
-                    cursor.execute("UPDATE users SET is_active = 0 WHERE id = ?", (user_id,))
-                
-                success = cursor.rowcount > 0
-                conn.commit()
-                conn.close()
-                return success
-            except sqlite3.Error:
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # Admin can deactivate users from any company, but let's add a check
+            if admin_company_id:
+                cursor.execute("UPDATE users SET is_active = 0 WHERE id = ? AND company_id = ?", 
+                             (user_id, admin_company_id))
+            else:
+                cursor.execute("UPDATE users SET is_active = 0 WHERE id = ?", (user_id,))
+            
+            success = cursor.rowcount > 0
+            conn.commit()
+            self._invalidate_user(user_id)
+            return success
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
 
     def reactivate_user(self, user_id: int, admin_company_id: int = None) -> bool:
         """Reactivate a user (Admin only)"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                if admin_company_id:
-                    cursor.execute("UPDATE users SET is_active = 1 WHERE id = ? AND company_id = ?", 
-                                 (user_id, admin_company_id))
-                else:
-                    cursor.execute("UPDATE users SET is_active = 1 WHERE id = ?", (user_id,))
-                
-                success = cursor.rowcount > 0
-                conn.commit()
-                conn.close()
-                return success
-            except sqlite3.Error:
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            
+            if admin_company_id:
+                cursor.execute("UPDATE users SET is_active = 1 WHERE id = ? AND company_id = ?", 
+                             (user_id, admin_company_id))
+            else:
+                cursor.execute("UPDATE users SET is_active = 1 WHERE id = ?", (user_id,))
+            
+            success = cursor.rowcount > 0
+            conn.commit()
+            self._invalidate_user(user_id)
+            return success
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
 
     def delete_user(self, user_id: int, admin_company_id: int = None) -> bool:
         """Delete a user permanently (Admin only) - Use with caution"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                # First, get user info to check if they have tasks
-                cursor.execute("SELECT id, username FROM users WHERE id = ?", (user_id,))
-                user = cursor.fetchone()
-                if not user:
-                    conn.close()
-                    return False
-                
-                # Check if user has tasks assigned
-                cursor.execute("SELECT COUNT(*) FROM tasks WHERE assigned_to = ?", (user_id,))
-                task_count = cursor.fetchone()[0]
-                
-                if task_count > 0:
-                    # Don't delete if user has tasks - suggest deactivation instead
-                    conn.close()
-                    return False
-                
-             
-                cursor.execute("DELETE FROM task_comments WHERE user_id = ?", (user_id,))
-                
-               
-                cursor.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
-                cursor.execute("DELETE FROM private_messages WHERE sender_id = ? OR receiver_id = ?", 
-                             (user_id, user_id))
-                
-                
-                cursor.execute("DELETE FROM push_subscriptions WHERE user_id = ?", (user_id,))
-                
-                # Delete user's notifications
-                cursor.execute("DELETE FROM notifications WHERE user_id = ?", (user_id,))
-                
-                # Finally delete the user
-                if admin_company_id:
-                    cursor.execute("DELETE FROM users WHERE id = ? AND company_id = ?", 
-                                 (user_id, admin_company_id))
-                else:
-                    cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
-                
-                success = cursor.rowcount > 0
-                conn.commit()
-                conn.close()
-                return success
-            except sqlite3.Error as e:
-                print(f"Error deleting user: {e}")
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # First, get user info to check if they have tasks
+            cursor.execute("SELECT id, username FROM users WHERE id = ?", (user_id,))
+            user = cursor.fetchone()
+            if not user:
+                return False
+            
+            # Check if user has tasks assigned
+            cursor.execute("SELECT COUNT(*) FROM tasks WHERE assigned_to = ?", (user_id,))
+            task_count = cursor.fetchone()[0]
+            
+            if task_count > 0:
+                # Don't delete if user has tasks - suggest deactivation instead
                 return False
+            
+         
+            cursor.execute("DELETE FROM task_comments WHERE user_id = ?", (user_id,))
+            
+           
+            cursor.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            cursor.execute("DELETE FROM private_messages WHERE sender_id = ? OR receiver_id = ?", 
+                         (user_id, user_id))
+            
+            
+            cursor.execute("DELETE FROM push_subscriptions WHERE user_id = ?", (user_id,))
+            
+            # Delete user's notifications
+            cursor.execute("DELETE FROM notifications WHERE user_id = ?", (user_id,))
+            
+            # Finally delete the user
+            if admin_company_id:
+                cursor.execute("DELETE FROM users WHERE id = ? AND company_id = ?", 
+                             (user_id, admin_company_id))
+            else:
+                cursor.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            
+            success = cursor.rowcount > 0
+            conn.commit()
+            self._invalidate_user(user_id)
+            return success
+        except sqlite3.Error as e:
+            print(f"Error deleting user: {e}")
+            return False
+        finally:
+            conn.close()
 
     # Task Comments methods
     def add_task_comment(self, task_id: int, user_id: int, comment: str) -> bool:
         """Add a comment to a task"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute(
-                    "INSERT INTO task_comments (task_id, user_id, comment) VALUES (?, ?, ?)",
-                    (task_id, user_id, comment)
-                )
-                conn.commit()
-                conn.close()
-                return True
-            except sqlite3.Error:
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO task_comments (task_id, user_id, comment) VALUES (?, ?, ?)",
+                (task_id, user_id, comment)
+            )
+            conn.commit()
+            return True
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
 
     def get_task_comments(self, task_id: int, user_id: int = None) -> List[Dict]:
         """Get all comments for a task"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT tc.id, tc.comment, tc.created_at, u.username, tc.user_id, tc.is_read
@@ -951,34 +1443,35 @@ class Database:
                     "user_id": row[4],
                     "is_read": row[5]
                 })
-            conn.close()
-            
+        
             # Mark comments as read for the viewing user
             if user_id:
                 self.mark_comments_as_read(task_id, user_id)
-            
+        
             return comments
+        finally:
+            conn.close()
 
     def mark_comments_as_read(self, task_id: int, user_id: int) -> bool:
         """Mark comments as read for a user"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE task_comments SET is_read = 1 
-                    WHERE task_id = ? AND user_id != ?
-                ''', (task_id, user_id))
-                conn.commit()
-                conn.close()
-                return True
-            except sqlite3.Error:
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE task_comments SET is_read = 1 
+                WHERE task_id = ? AND user_id != ?
+            ''', (task_id, user_id))
+            conn.commit()
+            return True
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
 
     def get_unread_comments_count(self, user_id: int, company_id: int) -> int:
         """Get count of unread comments for user's tasks"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT COUNT(*) FROM task_comments tc
@@ -990,36 +1483,37 @@ class Database:
                 AND tc.is_read = 0
                 AND t.company_id = ?
             ''', (user_id, user_id, company_id, user_id, company_id))
-            
+        
             result = cursor.fetchone()
-            conn.close()
             return result[0] if result else 0
+        finally:
+            conn.close()
 
     # File attachment methods
     def save_file_attachment(self, task_id: int, filename: str, original_filename: str, 
                            file_path: str, file_size: int, file_type: str, 
                            uploaded_by: int, upload_type: str) -> bool:
         """Save file attachment info to database"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO file_attachments 
-                    (task_id, filename, original_filename, file_path, file_size, file_type, uploaded_by, upload_type)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (task_id, filename, original_filename, file_path, file_size, file_type, uploaded_by, upload_type))
-                conn.commit()
-                conn.close()
-                return True
-            except sqlite3.Error as e:
-                print(f"Error saving file attachment: {e}")
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO file_attachments 
+                (task_id, filename, original_filename, file_path, file_size, file_type, uploaded_by, upload_type)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (task_id, filename, original_filename, file_path, file_size, file_type, uploaded_by, upload_type))
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving file attachment: {e}")
+            return False
+        finally:
+            conn.close()
 
     def get_task_attachments(self, task_id: int) -> List[Dict]:
         """Get all file attachments for a task"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT fa.id, fa.filename, fa.original_filename, fa.file_path, fa.file_size, 
@@ -1043,66 +1537,631 @@ class Database:
                     "created_at": row[7],
                     "uploaded_by": row[8]
                 })
-            conn.close()
             return attachments
+        finally:
+            conn.close()
+
+    def get_download_attachment(self, attachment_id: int, user_id: int, company_id: int) -> Optional[Dict]:
+        """Get what a download needs for an attachment the user may read"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute('''
+                SELECT fa.file_path, fa.original_filename, fa.file_size, fa.content_hash
+                FROM file_attachments fa
+                JOIN tasks t ON fa.task_id = t.id
+                WHERE fa.id = ? AND (t.assigned_to = ? OR t.company_id = ?)
+            ''', (attachment_id, user_id, company_id)).fetchone()
+            if not row:
+                return None
+            return {"file_path": row[0], "original_filename": row[1], "file_size": row[2], "content_hash": row[3]}
+        finally:
+            conn.close()
+
+    def save_blob_attachment(self, task_id: int, digest: str, size: int, original_filename: str, file_type: str,
+                             uploaded_by: int, upload_type: str, staged_path: str = None) -> Optional[int]:
+        """Attach content by SHA-256 and return the attachment id.
+
+        staged_path holds the uploaded bytes; they become the blob if the
+        content is new and are dropped if it is already stored. Without
+        staged_path the blob must already exist and be size bytes, since
+        size is only the client's word then (None is returned if not).
+        """
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        adopted = None
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT size FROM blobs WHERE sha256 = ?", (digest,))
+            row = cursor.fetchone()
+            known = row is not None
+            if known and not staged_path and row[0] != size:
+                cursor.execute("ROLLBACK")
+                return None
+            if not known or (staged_path and not self.blob_store.exists(digest)):
+                if not staged_path:
+                    cursor.execute("ROLLBACK")
+                    return None
+                # New content (or a stored file that went missing): this upload becomes the blob
+                adopted = self.blob_store.adopt(staged_path, digest)
+                cursor.execute("INSERT OR IGNORE INTO blobs (sha256, size) VALUES (?, ?)", (digest, size))
+            cursor.execute('''
+                INSERT INTO file_attachments
+                (task_id, filename, original_filename, file_path, file_size, file_type, uploaded_by, upload_type, content_hash)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (task_id, f"{digest}.{file_type}", original_filename, self.blob_store.path_for(digest), size,
+                  file_type, uploaded_by, upload_type, digest))
+            attachment_id = cursor.lastrowid
+            cursor.execute("COMMIT")
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error saving blob attachment: {e}")
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            if adopted:
+                os.replace(adopted, staged_path)
+            return None
+        finally:
+            conn.close()
+
+        if staged_path and not adopted:
+            self.blob_store.discard_staged(staged_path)
+        return attachment_id
+
+    def company_has_blob(self, digest: str, company_id: int) -> bool:
+        """Whether one of the company's attachments already holds this content"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute('''
+                SELECT 1 FROM file_attachments fa
+                JOIN tasks t ON t.id = fa.task_id
+                WHERE fa.content_hash = ? AND t.company_id = ?
+                LIMIT 1
+            ''', (digest, company_id)).fetchone()
+            return row is not None
+        finally:
+            conn.close()
 
     def delete_file_attachment(self, attachment_id: int, user_id: int) -> bool:
-        """Delete a file attachment"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                # Get file path first
-                cursor.execute("SELECT file_path FROM file_attachments WHERE id = ? AND uploaded_by = ?", 
-                             (attachment_id, user_id))
-                result = cursor.fetchone()
-                
-                if result:
-                    import os
-                    file_path = result[0]
-                    
-                    # Delete from database
-                    cursor.execute("DELETE FROM file_attachments WHERE id = ? AND uploaded_by = ?", 
-                                 (attachment_id, user_id))
-                    
-                    # Delete physical file
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                    
-                    conn.commit()
-                    conn.close()
-                    return True
-                
-                conn.close()
+        """Delete a file attachment, releasing its blob reference"""
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            
+            # Get file path first
+            cursor.execute("SELECT file_path, content_hash FROM file_attachments WHERE id = ? AND uploaded_by = ?", 
+                         (attachment_id, user_id))
+            result = cursor.fetchone()
+            
+            if not result:
+                cursor.execute("ROLLBACK")
                 return False
-            except sqlite3.Error as e:
-                print(f"Error deleting file attachment: {e}")
+
+            file_path, content_hash = result
+            
+            # Delete from database; a blob left without references is collected
+            # by the storage reconciler once its grace period is over
+            cursor.execute("DELETE FROM file_attachments WHERE id = ? AND uploaded_by = ?", 
+                         (attachment_id, user_id))
+            cursor.execute("COMMIT")
+            
+            # Attachments from before the blob store own their file
+            if not content_hash and os.path.exists(file_path):
+                os.remove(file_path)
+            return True
+        except sqlite3.Error as e:
+            print(f"Error deleting file attachment: {e}")
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            return False
+        finally:
+            conn.close()
+
+    # Storage reconciliation (see storage_gc.py)
+    def collect_unreferenced_blobs(self, grace_seconds: float, limit: int = 500) -> Tuple[int, int]:
+        """Delete up to limit blobs unreferenced for grace_seconds; returns (blobs, bytes freed)"""
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        detached = []
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                SELECT sha256, size FROM blobs
+                WHERE ref_count <= 0 AND COALESCE(released_at, created_at) <= datetime('now', ?)
+                LIMIT ?
+            ''', (f"-{int(grace_seconds)} seconds", limit))
+            rows = cursor.fetchall()
+            for digest, size in rows:
+                cursor.execute("DELETE FROM blobs WHERE sha256 = ? AND ref_count <= 0", (digest,))
+                # Moved aside rather than removed so a rollback can put it back
+                trash_path = self.blob_store.detach(digest)
+                if trash_path:
+                    detached.append((digest, trash_path, size))
+            cursor.execute("COMMIT")
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error collecting unreferenced blobs: {e}")
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            for digest, trash_path, _ in detached:
+                self.blob_store.restore(digest, trash_path)
+            return 0, 0
+        finally:
+            conn.close()
+
+        for _, trash_path, _ in detached:
+            self.blob_store.purge(trash_path)
+        return len(rows), sum(size for _, _, size in detached)
+
+    def remove_orphan_blob_files(self, digests: List[str], grace_seconds: float) -> Tuple[int, int]:
+        """Remove blob files with no blobs row, older than grace_seconds; returns (files, bytes)"""
+        cutoff = time.time() - grace_seconds
+        removed = freed = 0
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            # Under the write lock, so no save can adopt a file between the check and the unlink
+            cursor.execute("BEGIN IMMEDIATE")
+            placeholders = ",".join("?" * len(digests))
+            cursor.execute(f"SELECT sha256 FROM blobs WHERE sha256 IN ({placeholders})", digests)
+            known = {row[0] for row in cursor.fetchall()}
+            for digest in digests:
+                if digest in known:
+                    continue
+                path = self.blob_store.path_for(digest)
+                try:
+                    stat = os.stat(path)
+                    if stat.st_mtime > cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                freed += stat.st_size
+            cursor.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"Error removing orphan blob files: {e}")
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+        finally:
+            conn.close()
+        return removed, freed
+
+    def recover_blob_trash(self, entries: List[Tuple[str, str]]) -> Tuple[int, int, int]:
+        """Settle (digest, trash path) pairs a crash left in the trash: put back blobs that
+        still have a row, purge the rest; returns (restored, purged, bytes purged)"""
+        restored = purged = freed = 0
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            # The write lock means no release is half done while we look
+            cursor.execute("BEGIN IMMEDIATE")
+            for digest, trash_path in entries:
+                cursor.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (digest,))
+                if cursor.fetchone() and not self.blob_store.exists(digest):
+                    self.blob_store.restore(digest, trash_path)
+                    restored += 1
+                    continue
+                try:
+                    size = os.path.getsize(trash_path)
+                except FileNotFoundError:
+                    continue
+                self.blob_store.purge(trash_path)
+                purged += 1
+                freed += size
+            cursor.execute("COMMIT")
+        except sqlite3.Error as e:
+            print(f"Error recovering blob trash: {e}")
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+        finally:
+            conn.close()
+        return restored, purged, freed
+
+    def get_known_blobs(self, digests: List[str]) -> set:
+        """Which of these digests have a blobs row"""
+        conn = self.get_connection()
+        try:
+            placeholders = ",".join("?" * len(digests))
+            rows = conn.execute(f"SELECT sha256 FROM blobs WHERE sha256 IN ({placeholders})", digests).fetchall()
+            return {row[0] for row in rows}
+        finally:
+            conn.close()
+
+    def get_referenced_legacy_filenames(self, filenames: List[str]) -> set:
+        """Which of these names a pre-blob-store attachment still has as its own file"""
+        conn = self.get_connection()
+        try:
+            placeholders = ",".join("?" * len(filenames))
+            rows = conn.execute(f'''
+                SELECT filename FROM file_attachments
+                WHERE content_hash IS NULL AND filename IN ({placeholders})
+            ''', filenames).fetchall()
+            return {row[0] for row in rows}
+        finally:
+            conn.close()
+
+    def get_legacy_attachment_files(self, limit: int = 500) -> List[Tuple[str, str]]:
+        """(filename, file_path) of the newest pre-blob-store attachments"""
+        conn = self.get_connection()
+        try:
+            return conn.execute('''
+                SELECT filename, file_path FROM file_attachments
+                WHERE content_hash IS NULL ORDER BY id DESC LIMIT ?
+            ''', (limit,)).fetchall()
+        finally:
+            conn.close()
+
+    def get_attachment_files_page(self, after_id: int = 0, limit: int = 500) -> List[Tuple[int, str]]:
+        """(id, file_path) of attachments after after_id, in id order"""
+        conn = self.get_connection()
+        try:
+            rows = conn.execute("SELECT id, file_path FROM file_attachments WHERE id > ? ORDER BY id LIMIT ?",
+                                (after_id, limit)).fetchall()
+            return rows
+        finally:
+            conn.close()
+
+    def get_blob_stats(self) -> Dict[str, int]:
+        """Stored versus attached bytes, to show what deduplication saves"""
+        conn = self.get_connection()
+        try:
+            blobs, stored, unreferenced = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(ref_count <= 0), 0) FROM blobs").fetchone()
+            references, attached = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(file_size), 0) FROM file_attachments WHERE content_hash IS NOT NULL").fetchone()
+            return {'blobs': blobs, 'stored_bytes': stored, 'unreferenced': unreferenced,
+                    'references': references, 'attached_bytes': attached}
+        finally:
+            conn.close()
+
+    # Full-text search (search indexes from migration 12)
+    def search(self, company_id: int, user_id: int, is_admin: bool, query: str, kinds=SEARCH_KINDS,
+               limit: int = 20, offset: int = 0) -> Dict[str, Dict]:
+        """Best matches per kind, limited to what the user may see; next_offset is None on the last page"""
+        terms = fts_match_query(query)
+        results = {}
+        if not terms:
+            return results
+        for kind in kinds:
+            if kind == 'attachments':
+                items = self.search_attachments(company_id, user_id, is_admin, query, limit + 1, offset)
+            else:
+                items = self._search_kind(kind, company_id, user_id, is_admin, terms, limit + 1, offset)
+            results[kind] = {'items': items[:limit], 'next_offset': offset + limit if len(items) > limit else None}
+        return results
+
+    def _search_kind(self, kind: str, company_id: int, user_id: int, is_admin: bool, terms: str,
+                     limit: int, offset: int) -> List[Dict]:
+        index, columns = SEARCH_QUERIES[kind]['index'], SEARCH_QUERIES[kind]['columns']
+        # The tenant is part of the MATCH, so FTS5 only ranks this company's rows
+        match = f'company_id : "{int(company_id)}" AND {{{columns}}} : ({terms})'
+        sql = SEARCH_QUERIES[kind]['sql']
+        params = [SNIPPET_START, SNIPPET_END, match, company_id]
+        if not is_admin:
+            sql += SEARCH_QUERIES[kind]['visible']
+            params += [user_id] * SEARCH_QUERIES[kind]['visible'].count('?')
+        sql += " ORDER BY score LIMIT ? OFFSET ?"
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(sql, params + [limit, offset])
+            names = [column[0] for column in cursor.description]
+            rows = cursor.fetchall()
+        except sqlite3.OperationalError as e:
+            print(f"Error searching {index}: {e}")
+            return []
+        finally:
+            conn.close()
+        items = []
+        for row in rows:
+            item = dict(zip(names, row))
+            item['snippet'] = highlight_snippet(item['snippet'])
+            items.append(item)
+        return items
+
+    # Attachment text index (see attachment_indexer.py)
+    def claim_index_jobs(self, limit: int, lease: float) -> List[Dict]:
+        """Atomically claim attachments waiting for text extraction, for lease seconds"""
+        now = time.time()
+        conn = self.get_write_connection()
+        try:
+            rows = conn.execute('''
+                UPDATE attachment_index SET status = 'processing', attempts = attempts + 1, next_attempt_at = ?
+                WHERE attachment_id IN (
+                    SELECT attachment_id FROM attachment_index
+                    WHERE status IN ('pending', 'processing') AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                )
+                RETURNING attachment_id, attempts
+            ''', (now + lease, now, limit)).fetchall()
+            if not rows:
+                return []
+            attempts = dict(rows)
+            placeholders = ",".join("?" * len(attempts))
+            details = conn.execute(f'''
+                SELECT id, file_path, file_type, file_size, content_hash FROM file_attachments
+                WHERE id IN ({placeholders})
+            ''', list(attempts)).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                "attachment_id": row[0],
+                "file_path": row[1],
+                "file_type": row[2],
+                "file_size": row[3],
+                "content_hash": row[4],
+                "attempts": attempts[row[0]]
+            }
+            for row in details
+        ]
+
+    def store_attachment_text(self, attachment_id: int, chunks: List[str]) -> bool:
+        """Replace an attachment's indexed text; False if the attachment is gone"""
+        base = attachment_id * ATTACHMENT_TEXT_SPAN
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                UPDATE attachment_index SET status = 'indexed', chunks = ?, last_error = NULL,
+                                            indexed_at = CURRENT_TIMESTAMP
+                WHERE attachment_id = ?
+            ''', (len(chunks), attachment_id))
+            if not cursor.rowcount:
+                cursor.execute("ROLLBACK")
                 return False
+            cursor.execute("DELETE FROM attachment_text WHERE rowid BETWEEN ? AND ?",
+                           (base, base + ATTACHMENT_TEXT_SPAN - 1))
+            cursor.executemany("INSERT INTO attachment_text (rowid, content) VALUES (?, ?)",
+                               [(base + number, chunk) for number, chunk in enumerate(chunks)])
+            cursor.execute("COMMIT")
+            return True
+        except sqlite3.Error as e:
+            print(f"Error storing attachment text: {e}")
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            return False
+        finally:
+            conn.close()
+
+    def copy_indexed_text(self, attachment_id: int, content_hash: str) -> Optional[int]:
+        """Reuse the text of an indexed attachment with the same content; returns its chunk
+        count, or None if no such attachment exists yet"""
+        base = attachment_id * ATTACHMENT_TEXT_SPAN
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                SELECT ai.attachment_id, ai.chunks FROM attachment_index ai
+                JOIN file_attachments fa ON fa.id = ai.attachment_id
+                WHERE fa.content_hash = ? AND ai.status = 'indexed' AND ai.attachment_id != ?
+                LIMIT 1
+            ''', (content_hash, attachment_id))
+            source = cursor.fetchone()
+            if not source:
+                cursor.execute("ROLLBACK")
+                return None
+            source_id, chunks = source
+            cursor.execute('''
+                UPDATE attachment_index SET status = 'indexed', chunks = ?, last_error = NULL,
+                                            indexed_at = CURRENT_TIMESTAMP
+                WHERE attachment_id = ?
+            ''', (chunks, attachment_id))
+            if cursor.rowcount:
+                cursor.execute("DELETE FROM attachment_text WHERE rowid BETWEEN ? AND ?",
+                               (base, base + ATTACHMENT_TEXT_SPAN - 1))
+                cursor.execute('''
+                    INSERT INTO attachment_text (rowid, content)
+                    SELECT ? + rowid - ?, content FROM attachment_text WHERE rowid BETWEEN ? AND ?
+                ''', (base, source_id * ATTACHMENT_TEXT_SPAN, source_id * ATTACHMENT_TEXT_SPAN,
+                      source_id * ATTACHMENT_TEXT_SPAN + ATTACHMENT_TEXT_SPAN - 1))
+            cursor.execute("COMMIT")
+            return chunks
+        except sqlite3.Error as e:
+            print(f"Error copying attachment text: {e}")
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            return None
+        finally:
+            conn.close()
+
+    def mark_index_job(self, attachment_id: int, status: str, error: str = None, retry_at: float = None):
+        """Record a job that produced no text: 'skipped' (nothing to extract), 'failed', or
+        back to 'pending' until retry_at (unix time)"""
+        conn = self.get_write_connection()
+        try:
+            if retry_at is not None:
+                conn.execute("UPDATE attachment_index SET status = 'pending', next_attempt_at = ?, last_error = ? "
+                             "WHERE attachment_id = ?", (retry_at, error, attachment_id))
+            else:
+                conn.execute("UPDATE attachment_index SET status = ?, last_error = ? WHERE attachment_id = ?",
+                             (status, error, attachment_id))
+        finally:
+            conn.close()
+
+    def get_index_stats(self) -> Dict[str, int]:
+        """Attachments per extraction status"""
+        conn = self.get_connection()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM attachment_index GROUP BY status").fetchall()
+            return dict(rows)
+        finally:
+            conn.close()
+
+    def search_attachments(self, company_id: int, user_id: int, is_admin: bool, query: str,
+                           limit: int = 20, offset: int = 0) -> List[Dict]:
+        """Attachments whose text matches query, best first, with a snippet from each one's
+        best-matching chunk. Admins search the company; other users the tasks they watch."""
+        match = fts_match_query(query)
+        if not match:
+            return []
+        visible, params = "", [match, company_id]
+        if not is_admin:
+            visible = SEARCH_QUERIES['tasks']['visible']
+            params.append(user_id)
+        conn = self.get_connection()
+        try:
+            hits = conn.execute(f'''
+                SELECT fa.id, at.rowid, MIN(at.rank) AS score, fa.original_filename, fa.file_type,
+                       t.id, t.title, t.status
+                FROM attachment_text at
+                JOIN file_attachments fa ON fa.id = at.rowid / {ATTACHMENT_TEXT_SPAN}
+                JOIN tasks t ON t.id = fa.task_id
+                WHERE attachment_text MATCH ? AND t.company_id = ?{visible}
+                GROUP BY fa.id
+                ORDER BY score
+                LIMIT ? OFFSET ?
+            ''', params + [limit, offset]).fetchall()
+            if not hits:
+                return []
+            # snippet() cannot be used in an aggregate query, so fetch them for the best chunks
+            placeholders = ",".join("?" * len(hits))
+            snippets = dict(conn.execute(f'''
+                SELECT rowid, snippet(attachment_text, 0, ?, ?, '…', 16)
+                FROM attachment_text WHERE attachment_text MATCH ? AND rowid IN ({placeholders})
+            ''', [SNIPPET_START, SNIPPET_END, match] + [hit[1] for hit in hits]).fetchall())
+        except sqlite3.OperationalError as e:
+            print(f"Error searching attachments: {e}")
+            return []
+        finally:
+            conn.close()
+        return [
+            {
+                "attachment_id": hit[0],
+                "original_filename": hit[3],
+                "file_type": hit[4],
+                "task_id": hit[5],
+                "task_title": hit[6],
+                "task_status": hit[7],
+                "snippet": highlight_snippet(snippets.get(hit[1])),
+                "score": hit[2]
+            }
+            for hit in hits
+        ]
+
+    # Chunked upload session methods
+    def create_upload_session(self, upload_id: str, task_id: int, user_id: int, company_id: int,
+                              original_filename: str, file_type: str, upload_type: str, total_size: int,
+                              expected_sha256: str = None) -> bool:
+        """Start a resumable upload"""
+        conn = self.get_write_connection()
+        try:
+            conn.execute('''
+                INSERT INTO upload_sessions
+                (id, task_id, user_id, company_id, original_filename, file_type, upload_type, total_size, expected_sha256)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (upload_id, task_id, user_id, company_id, original_filename, file_type, upload_type,
+                  total_size, expected_sha256))
+            return True
+        except sqlite3.Error as e:
+            print(f"Error creating upload session: {e}")
+            return False
+        finally:
+            conn.close()
+
+    def get_upload_session(self, upload_id: str) -> Optional[Dict]:
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, task_id, user_id, company_id, original_filename, file_type, upload_type,
+                       total_size, received, expected_sha256, status
+                FROM upload_sessions WHERE id = ?
+            ''', (upload_id,))
+            row = cursor.fetchone()
+
+            if not row:
+                return None
+            return {
+                "id": row[0],
+                "task_id": row[1],
+                "user_id": row[2],
+                "company_id": row[3],
+                "original_filename": row[4],
+                "file_type": row[5],
+                "upload_type": row[6],
+                "total_size": row[7],
+                "received": row[8],
+                "expected_sha256": row[9],
+                "status": row[10]
+            }
+        finally:
+            conn.close()
+
+    def advance_upload_session(self, upload_id: str, offset: int, received: int) -> bool:
+        """Move received from offset to received; False if another chunk got there first"""
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.execute('''
+                UPDATE upload_sessions SET received = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND received = ? AND status = 'uploading'
+            ''', (received, upload_id, offset))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def set_upload_session_status(self, upload_id: str, status: str, expected: str = None) -> bool:
+        """Change an upload's status, only from the expected one when given"""
+        conn = self.get_write_connection()
+        try:
+            if expected is None:
+                cursor = conn.execute(
+                    "UPDATE upload_sessions SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (status, upload_id))
+            else:
+                cursor = conn.execute(
+                    "UPDATE upload_sessions SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ? AND status = ?",
+                    (status, upload_id, expected))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def get_stale_upload_sessions(self, max_age_seconds: float, limit: int = 100) -> List[str]:
+        """Ids of upload sessions untouched for max_age_seconds"""
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('''
+                SELECT id FROM upload_sessions
+                WHERE updated_at < datetime('now', ?)
+                ORDER BY updated_at LIMIT ?
+            ''', (f"-{int(max_age_seconds)} seconds", limit)).fetchall()
+            return [row[0] for row in rows]
+        finally:
+            conn.close()
+
+    def delete_upload_session(self, upload_id: str) -> bool:
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.execute("DELETE FROM upload_sessions WHERE id = ?", (upload_id,))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
 
     # Reminders methods
     def create_reminder(self, title: str, description: str, reminder_date: str, 
-                       alert_days_before: int, company_id: int, created_by: int) -> bool:
-        """Create a new reminder"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO reminders (title, description, reminder_date, alert_days_before, company_id, created_by)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (title, description, reminder_date, alert_days_before, company_id, created_by))
-                conn.commit()
-                conn.close()
-                return True
-            except sqlite3.Error as e:
-                print(f"Error creating reminder: {e}")
-                return False
+                       alert_days_before: int, company_id: int, created_by: int) -> Optional[int]:
+        """Create a new reminder and return its id"""
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO reminders (title, description, reminder_date, alert_days_before, company_id, created_by)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (title, description, reminder_date, alert_days_before, company_id, created_by))
+            conn.commit()
+            reminder_id = cursor.lastrowid
+            return reminder_id
+        except sqlite3.Error as e:
+            print(f"Error creating reminder: {e}")
+            return None
+        finally:
+            conn.close()
 
     def get_reminders(self, company_id: int) -> List[Dict]:
         """Get all active reminders for a company"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT r.id, r.title, r.description, r.reminder_date, r.alert_days_before, 
@@ -1112,7 +2171,7 @@ class Database:
                 WHERE r.company_id = ? AND r.is_active = 1
                 ORDER BY r.reminder_date ASC
             ''', (company_id,))
-            
+        
             reminders = []
             for row in cursor.fetchall():
                 reminders.append({
@@ -1124,26 +2183,29 @@ class Database:
                     'created_at': row[5],
                     'created_by': row[6]
                 })
-            conn.close()
             return reminders
+        finally:
+            conn.close()
 
     def get_upcoming_reminders(self, company_id: int) -> List[Dict]:
         """Get reminders that need alerts (within alert days)"""
-        with self.local_lock:
-            from datetime import date, timedelta
-            
-            conn = self.get_connection()
+        from datetime import date
+        
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             today = date.today()
-            
+        
+            # alert_date is kept by a trigger, so idx_reminders_company_alert finds these. Stored
+            # ISO dates compare as text; one with a time of day still sorts after its date.
             cursor.execute('''
                 SELECT r.id, r.title, r.description, r.reminder_date, r.alert_days_before
                 FROM reminders r
                 WHERE r.company_id = ? AND r.is_active = 1
-                AND DATE(r.reminder_date) <= DATE(?, '+' || r.alert_days_before || ' days')
-                AND DATE(r.reminder_date) >= DATE(?)
+                AND r.alert_date <= ?
+                AND r.reminder_date >= ?
             ''', (company_id, today.isoformat(), today.isoformat()))
-            
+        
             reminders = []
             for row in cursor.fetchall():
                 reminders.append({
@@ -1153,60 +2215,119 @@ class Database:
                     'reminder_date': row[3],
                     'alert_days_before': row[4]
                 })
-            conn.close()
             return reminders
+        finally:
+            conn.close()
+
+    def claim_due_reminders(self, today: str) -> List[Dict]:
+        """Mark every reminder whose alert date has come as alerted and return the ones still
+        ahead, queuing a Telegram notification to each of their company's admins.
+
+        Claiming is one transaction, so each reminder alerts once however many
+        schedulers run.
+        """
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                UPDATE reminders SET alerted_at = CURRENT_TIMESTAMP
+                WHERE is_active = 1 AND alerted_at IS NULL AND alert_date <= ?
+                RETURNING id, title, description, reminder_date, alert_days_before, company_id
+            ''', (today,))
+            due = []
+            for row in cursor.fetchall():
+                reminder = {
+                    'id': row[0],
+                    'title': row[1],
+                    'description': row[2],
+                    'reminder_date': row[3],
+                    'alert_days_before': row[4],
+                    'company_id': row[5]
+                }
+                # A reminder whose date went by unseen (server down) is only marked
+                if (reminder['reminder_date'] or '')[:10] >= today:
+                    due.append(reminder)
+            for reminder in due:
+                cursor.execute('''
+                    SELECT id FROM users
+                    WHERE company_id = ? AND role = 'Admin' AND is_active = 1 AND telegram_chat_id IS NOT NULL
+                ''', (reminder['company_id'],))
+                for (admin_id,) in cursor.fetchall():
+                    self._insert_outbox(cursor, 'telegram', admin_id, {
+                        'message': f"⏰ Reminder: {reminder['title']} on {reminder['reminder_date']}"
+                    })
+            cursor.execute("COMMIT")
+            return due
+        except sqlite3.Error as e:
+            print(f"Error claiming due reminders: {e}")
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            return []
+        finally:
+            conn.close()
+
+    def get_next_reminder_alert(self) -> Optional[str]:
+        """Earliest alert date of a reminder that has not alerted yet"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute(
+                "SELECT MIN(alert_date) FROM reminders WHERE is_active = 1 AND alerted_at IS NULL").fetchone()
+            return row[0]
+        finally:
+            conn.close()
 
     def delete_reminder(self, reminder_id: int, company_id: int) -> bool:
         """Delete a reminder (soft delete by setting is_active to false)"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE reminders SET is_active = 0
-                    WHERE id = ? AND company_id = ?
-                ''', (reminder_id, company_id))
-                success = cursor.rowcount > 0
-                conn.commit()
-                conn.close()
-                return success
-            except sqlite3.Error:
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE reminders SET is_active = 0
+                WHERE id = ? AND company_id = ?
+            ''', (reminder_id, company_id))
+            success = cursor.rowcount > 0
+            conn.commit()
+            return success
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
 
     def save_push_subscription(self, user_id: int, subscription: dict) -> bool:
         """Save push notification subscription"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                
-                # Remove existing subscription for this user
-                cursor.execute("DELETE FROM push_subscriptions WHERE user_id = ?", (user_id,))
-                
-                # Add new subscription
-                cursor.execute('''
-                    INSERT INTO push_subscriptions (user_id, endpoint, p256dh, auth)
-                    VALUES (?, ?, ?, ?)
-                ''', (user_id, subscription.get('endpoint'), 
-                      subscription.get('keys', {}).get('p256dh'),
-                      subscription.get('keys', {}).get('auth')))
-                
-                conn.commit()
-                conn.close()
-                return True
-            except sqlite3.Error as e:
-                print(f"Error saving push subscription: {e}")
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            
+            # Remove existing subscription for this user
+            cursor.execute("DELETE FROM push_subscriptions WHERE user_id = ?", (user_id,))
+            
+            # Add new subscription
+            cursor.execute('''
+                INSERT INTO push_subscriptions (user_id, endpoint, p256dh, auth)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, subscription.get('endpoint'), 
+                  subscription.get('keys', {}).get('p256dh'),
+                  subscription.get('keys', {}).get('auth')))
+            
+            conn.commit()
+            return True
+        except sqlite3.Error as e:
+            print(f"Error saving push subscription: {e}")
+            return False
+        finally:
+            conn.close()
 
     def get_user_subscriptions(self, user_id: int) -> List[Dict]:
         """Get push subscriptions for user"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT endpoint, p256dh, auth FROM push_subscriptions WHERE user_id = ?
             ''', (user_id,))
-            
+        
             subscriptions = []
             for row in cursor.fetchall():
                 subscriptions.append({
@@ -1216,38 +2337,277 @@ class Database:
                         'auth': row[2]
                     }
                 })
-            conn.close()
             return subscriptions
+        finally:
+            conn.close()
 
     def store_notification(self, user_id: int, message: str) -> bool:
         """Store notification in database"""
-        with self.local_lock:
-            try:
-                conn = self.get_connection()
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO notifications (user_id, message)
-                    VALUES (?, ?)
-                ''', (user_id, message))
-                conn.commit()
-                conn.close()
-                return True
-            except sqlite3.Error:
-                return False
+        conn = self.get_write_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO notifications (user_id, message)
+                VALUES (?, ?)
+            ''', (user_id, message))
+            conn.commit()
+            return True
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
+
+    # Notification outbox methods
+    def _insert_outbox(self, cursor, channel: str, user_id: int, payload: Dict):
+        cursor.execute(
+            "INSERT INTO outbox (channel, user_id, payload, next_attempt_at) VALUES (?, ?, ?, ?)",
+            (channel, user_id, json.dumps(payload), time.time())
+        )
+
+    def enqueue_notification(self, channel: str, user_id: int, payload: Dict) -> bool:
+        """Queue a notification for the outbox dispatcher"""
+        conn = self.get_write_connection()
+        try:
+            self._insert_outbox(conn.cursor(), channel, user_id, payload)
+            return True
+        except sqlite3.Error:
+            return False
+        finally:
+            conn.close()
+
+    def claim_outbox(self, limit: int, lease: float) -> List[Dict]:
+        """Atomically claim due outbox rows for delivery.
+
+        Claimed rows are 'sending' until lease seconds from now; if the worker
+        dies before reporting back they become due again.
+        """
+        now = time.time()
+        conn = self.get_write_connection()
+        try:
+            rows = conn.execute('''
+                UPDATE outbox SET status = 'sending', attempts = attempts + 1, next_attempt_at = ?
+                WHERE id IN (
+                    SELECT id FROM outbox
+                    WHERE status IN ('pending', 'sending') AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                )
+                RETURNING id, channel, user_id, payload, attempts
+            ''', (now + lease, now, limit)).fetchall()
+        finally:
+            conn.close()
+        return [
+            {
+                "id": row[0],
+                "channel": row[1],
+                "user_id": row[2],
+                "payload": json.loads(row[3]),
+                "attempts": row[4]
+            }
+            for row in rows
+        ]
+
+    def mark_outbox_sent(self, outbox_id: int):
+        """Record a successful delivery"""
+        conn = self.get_write_connection()
+        try:
+            conn.execute(
+                "UPDATE outbox SET status = 'sent', sent_at = CURRENT_TIMESTAMP, last_error = NULL WHERE id = ?",
+                (outbox_id,)
+            )
+        finally:
+            conn.close()
+
+    def mark_outbox_failed(self, outbox_id: int, error: str, retry_at: float = None):
+        """Schedule a retry at retry_at (unix time), or dead-letter the row if it is None"""
+        conn = self.get_write_connection()
+        try:
+            if retry_at is None:
+                conn.execute("UPDATE outbox SET status = 'dead', last_error = ? WHERE id = ?", (error, outbox_id))
+            else:
+                conn.execute(
+                    "UPDATE outbox SET status = 'pending', next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (retry_at, error, outbox_id)
+                )
+        finally:
+            conn.close()
+
+    def get_outbox_stats(self) -> Dict[str, int]:
+        """Count outbox rows by status"""
+        conn = self.get_connection()
+        try:
+            rows = conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+            stats = {'pending': 0, 'sending': 0, 'sent': 0, 'dead': 0}
+            stats.update({status: count for status, count in rows})
+            return stats
+        finally:
+            conn.close()
+
+    def get_task_snapshot(self, task_id: int) -> Optional[Dict]:
+        """Get a task in the listing row shape plus company_id and change_seq"""
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT t.id, t.title, t.description, t.status, t.created_at, t.updated_at,
+                       u.username, t.start_date, t.deadline, t.priority, t.assigned_to,
+                       t.company_id, t.change_seq
+                FROM tasks t
+                LEFT JOIN users u ON t.assigned_to = u.id
+                WHERE t.id = ?
+            ''', (task_id,))
+            row = cursor.fetchone()
+
+            if not row:
+                return None
+            return {
+                "id": row[0],
+                "title": row[1],
+                "description": row[2],
+                "status": row[3],
+                "created_at": row[4],
+                "updated_at": row[5],
+                "assigned_to_name": row[6],
+                "start_date": row[7],
+                "deadline": row[8],
+                "priority": row[9],
+                "assigned_to": row[10],
+                "company_id": row[11],
+                "change_seq": row[12]
+            }
+        finally:
+            conn.close()
+
+    # Deadline escalation methods
+    def get_task_deadlines(self, since_seq: Optional[int] = None) -> Tuple[List[Dict], int]:
+        """Deadlines for the deadline scheduler, and the change sequence they are current to.
+
+        Without since_seq: every open task with a deadline. With it: every task
+        changed after since_seq, whatever its status, so completed ones can be
+        dropped. Each task lists the thresholds already escalated for its
+        current deadline.
+        """
+        conn = self.get_connection()
+        try:
+            conn.execute("BEGIN")  # one snapshot for the rows and the sequence value
+            seq = conn.execute("SELECT value FROM change_sequences WHERE name = 'tasks'").fetchone()
+            if since_seq is None:
+                condition, values = "t.status != 'Completed' AND t.deadline > ''", ()
+            else:
+                condition, values = "t.change_seq > ?", (since_seq,)
+            rows = conn.execute(f'''
+                SELECT t.id, t.deadline, t.status,
+                       (SELECT GROUP_CONCAT(e.threshold) FROM task_escalations e
+                        WHERE e.task_id = t.id AND e.deadline = t.deadline)
+                FROM tasks t
+                WHERE {condition}
+            ''', values).fetchall()
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return [
+            {
+                "id": row[0],
+                "deadline": row[1],
+                "status": row[2],
+                "escalated": set(row[3].split(',')) if row[3] else set()
+            }
+            for row in rows
+        ], (seq[0] if seq else 0)
+
+    def claim_deadline_escalation(self, task_id: int, threshold: str, deadline: str) -> Optional[Dict]:
+        """Record that a task crossed a deadline threshold and queue its Telegram notifications.
+
+        Returns the task, or None when the task is gone, completed, has another
+        deadline or was already escalated at this threshold (by this or another
+        worker). Database errors are raised so the caller can try again.
+        """
+        conn = self.get_write_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                SELECT t.id, t.title, t.deadline, t.assigned_to, u.username, t.company_id
+                FROM tasks t
+                LEFT JOIN users u ON t.assigned_to = u.id
+                WHERE t.id = ? AND t.status != 'Completed' AND t.deadline = ?
+            ''', (task_id, deadline))
+            row = cursor.fetchone()
+            if row is not None:
+                cursor.execute("INSERT OR IGNORE INTO task_escalations (task_id, threshold, deadline) VALUES (?, ?, ?)",
+                               (task_id, threshold, deadline))
+            if row is None or cursor.rowcount == 0:
+                cursor.execute("ROLLBACK")
+                return None
+
+            task = {
+                "id": row[0],
+                "title": row[1],
+                "deadline": row[2],
+                "assigned_to": row[3],
+                "username": row[4],
+                "company_id": row[5],
+                "threshold": threshold
+            }
+            if threshold == 'overdue':
+                message = f"🚨 Task overdue: {task['title']} (deadline {task['deadline']})"
+            else:
+                message = f"⏳ Task due soon: {task['title']} (deadline {task['deadline']})"
+            task['message'] = message
+
+            # The assignee hears about both thresholds; an overdue task also goes to the admins
+            cursor.execute('''
+                SELECT id FROM users
+                WHERE is_active = 1 AND telegram_chat_id IS NOT NULL
+                  AND (id = ? OR (? AND company_id = ? AND role = 'Admin'))
+            ''', (task['assigned_to'], threshold == 'overdue', task['company_id']))
+            for (user_id,) in cursor.fetchall():
+                if user_id == task['assigned_to']:
+                    self._insert_outbox(cursor, 'telegram', user_id, {'message': message})
+                else:
+                    self._insert_outbox(cursor, 'telegram', user_id, {
+                        'message': f"{message}, assigned to {task['username']}"
+                    })
+            cursor.execute("COMMIT")
+            return task
+        except sqlite3.Error:
+            if conn.in_transaction:
+                cursor.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get_watched_task_ids(self, user_id: int) -> List[int]:
+        """Tasks whose event room the user joins (assigned, commented on or uploaded to)"""
+        conn = self.get_connection()
+        try:
+            rows = conn.execute("SELECT task_id FROM task_watchers WHERE user_id = ?", (user_id,)).fetchall()
+            return [row[0] for row in rows]
+        finally:
+            conn.close()
+
+    def is_task_watcher(self, task_id: int, user_id: int) -> bool:
+        """Whether the user may join the task's event room"""
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT 1 FROM task_watchers WHERE task_id = ? AND user_id = ?",
+                               (task_id, user_id)).fetchone()
+            return row is not None
+        finally:
+            conn.close()
 
     def get_task_by_id(self, task_id: int) -> Optional[Dict]:
         """Get task by ID"""
-        with self.local_lock:
-            conn = self.get_connection()
+        conn = self.get_connection()
+        try:
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT id, title, description, assigned_to, status
                 FROM tasks WHERE id = ?
             ''', (task_id,))
-            
+        
             result = cursor.fetchone()
-            conn.close()
-            
+        
             if result:
                 return {
                     'id': result[0],
@@ -1257,6 +2617,8 @@ class Database:
                     'status': result[4]
                 }
             return None
+        finally:
+            conn.close()
 
     def __del__(self):
         pass  
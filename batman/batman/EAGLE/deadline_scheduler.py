@@ -0,0 +1,141 @@
+"""
+Deadline escalations for the Eagle Task Management System
+
+Every open task with a deadline has two thresholds: 'due_soon', DEADLINE_DUE_SOON
+seconds before the deadline, and 'overdue', when the deadline has passed (a
+date-only deadline lasts until the end of that day). The scheduler keeps the
+thresholds still to come in a min-heap, sleeps until the earliest one and
+escalates it. Claiming an escalation records it in task_escalations and queues
+its Telegram notifications in one transaction, so each threshold fires
+exactly once per deadline even with several workers running schedulers.
+Claimed escalations are handed to on_escalation, which pushes them to the
+assignee and the admins.
+
+The heap is seeded once from the open-deadline index. After that it is kept
+current from the task change sequence: each pass reads only the tasks changed
+since the last one (idx_tasks_change_seq), never the whole table. Task writes
+in the web app call wake(); writes from other processes are picked up within
+DEADLINE_SYNC_INTERVAL. Entries for a task whose deadline moved or that was
+completed are skipped when they come up, or dropped once there are many.
+"""
+
+import heapq
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from database import Database
+
+DEADLINE_DUE_SOON = float(os.getenv('EAGLE_DEADLINE_DUE_SOON_HOURS', '24')) * 3600  # seconds
+DEADLINE_SYNC_INTERVAL = float(os.getenv('EAGLE_DEADLINE_SYNC_INTERVAL', '60'))  # seconds, longest sleep
+DEADLINE_RETRY_DELAY = 60.0  # seconds after an error
+
+
+def deadline_passes_at(deadline: str) -> Optional[float]:
+    """Timestamp at which a task becomes overdue; None if the deadline does not parse"""
+    try:
+        if len(deadline) == 10:
+            return datetime.combine(date.fromisoformat(deadline) + timedelta(days=1), datetime.min.time()).timestamp()
+        return datetime.fromisoformat(deadline).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class DeadlineScheduler:
+    """Thread that escalates tasks as their deadlines approach and pass"""
+
+    def __init__(self, on_escalation: Callable[[Dict], None], db: Database = None,
+                 due_soon: float = DEADLINE_DUE_SOON, sync_interval: float = DEADLINE_SYNC_INTERVAL):
+        self.db = db or Database()
+        self.on_escalation = on_escalation
+        self.due_soon = due_soon
+        self.sync_interval = sync_interval
+        self.escalated = {'due_soon': 0, 'overdue': 0}
+        self._heap: List[Tuple[float, int, str, str]] = []  # (fires at, task id, threshold, deadline)
+        self._deadlines: Dict[int, str] = {}  # open task -> the deadline its heap entries are for
+        self._seq: Optional[int] = None  # task change sequence the heap is current to
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="deadline-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        """Tasks changed; pick the changes up now instead of after the next sleep"""
+        self._wake.set()
+
+    def _sync(self):
+        tasks, self._seq = self.db.get_task_deadlines(self._seq)
+        now = time.time()
+        for task in tasks:
+            deadline = task['deadline']
+            if task['status'] == 'Completed' or not deadline:
+                self._deadlines.pop(task['id'], None)
+                continue
+            if self._deadlines.get(task['id']) == deadline:
+                continue  # already scheduled
+            overdue_at = deadline_passes_at(deadline)
+            if overdue_at is None:
+                continue
+            if 'overdue' in task['escalated']:
+                self._deadlines.pop(task['id'], None)
+                continue
+            self._deadlines[task['id']] = deadline
+            # A task that is overdue already skips straight to the overdue notice
+            if 'due_soon' not in task['escalated'] and overdue_at > now:
+                heapq.heappush(self._heap, (overdue_at - self.due_soon, task['id'], 'due_soon', deadline))
+            heapq.heappush(self._heap, (overdue_at, task['id'], 'overdue', deadline))
+
+        # Entries of moved deadlines and completed tasks wait until they come up; drop
+        # them early when they outnumber the live ones
+        if len(self._heap) > 4 * len(self._deadlines) + 64:
+            self._heap = [entry for entry in self._heap if self._deadlines.get(entry[1]) == entry[3]]
+            heapq.heapify(self._heap)
+
+    def run_once(self) -> float:
+        """Apply task changes and escalate every threshold reached; returns seconds until the next"""
+        self._sync()
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            _, task_id, threshold, deadline = self._heap[0]
+            escalation = None
+            if self._deadlines.get(task_id) == deadline:
+                # Raises on a database error, leaving the entry to be tried again
+                escalation = self.db.claim_deadline_escalation(task_id, threshold, deadline)
+            heapq.heappop(self._heap)
+            if threshold == 'overdue' and self._deadlines.get(task_id) == deadline:
+                del self._deadlines[task_id]  # nothing left to schedule for this deadline
+            if escalation:
+                self.escalated[threshold] += 1
+                try:
+                    self.on_escalation(escalation)
+                except Exception as e:
+                    print(f"❌ Deadline escalation error: {e}")
+
+        if not self._heap:
+            return self.sync_interval
+        return min(max(self._heap[0][0] - now, 0.0), self.sync_interval)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                delay = self.run_once()
+            except Exception as e:
+                print(f"❌ Deadline scheduler error: {e}")
+                delay = DEADLINE_RETRY_DELAY
+            self._wake.wait(delay)
+
+    def stats(self) -> Dict:
+        return {'escalated': dict(self.escalated), 'scheduled': len(self._heap),
+                'open_tasks': len(self._deadlines), 'next_escalation': self._heap[0][0] if self._heap else None}
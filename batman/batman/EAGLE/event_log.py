@@ -0,0 +1,105 @@
+"""
+Replayable Socket.IO event log for the Eagle Task Management System
+
+Every logged emit gets the next id from one process-wide counter and is kept
+in a bounded ring buffer for each room it was sent to. A reconnecting client
+reports the last id it saw and receives only the events it missed, or a
+resync signal when its position has already been evicted.
+
+Ids are only meaningful within one process, so each log has a random epoch;
+a client whose epoch does not match (server restart, different worker) must
+resync.
+
+Long-lived readers (the SSE stream) register a threading.Event per room and
+are woken only by appends to their own rooms.
+"""
+
+import os
+import threading
+import uuid
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+EVENT_LOG_SIZE = int(os.getenv('EAGLE_EVENT_LOG_SIZE', '200'))  # events kept per room
+
+
+class EventLog:
+    """Per-room ring buffers of (event_id, event, data)"""
+
+    def __init__(self, capacity: int = EVENT_LOG_SIZE):
+        self.capacity = capacity
+        self.epoch = uuid.uuid4().hex[:12]
+        self._last_id = 0
+        self._rooms: Dict[str, deque] = {}
+        # Highest id evicted from each room; a client behind it has missed events
+        self._evicted: Dict[str, int] = {}
+        self._listeners: Dict[str, Set[threading.Event]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def position(self) -> Dict:
+        """What a client stores to resume from later"""
+        return {'epoch': self.epoch, 'last_event_id': self._last_id}
+
+    def append(self, rooms: Iterable[str], event: str, data: Dict) -> int:
+        """Record one emit to one or more rooms and return its id"""
+        with self._lock:
+            self._last_id += 1
+            entry = (self._last_id, event, data)
+            for room in rooms:
+                buffer = self._rooms.get(room)
+                if buffer is None:
+                    buffer = self._rooms[room] = deque()
+                if len(buffer) >= self.capacity:
+                    self._evicted[room] = buffer.popleft()[0]
+                buffer.append(entry)
+                for signal in self._listeners.get(room, ()):
+                    signal.set()
+            return self._last_id
+
+    def listen(self, rooms: Iterable[str], signal: threading.Event):
+        """Set signal whenever an event is appended to one of rooms"""
+        with self._lock:
+            for room in rooms:
+                self._listeners.setdefault(room, set()).add(signal)
+
+    def unlisten(self, rooms: Iterable[str], signal: threading.Event):
+        with self._lock:
+            for room in rooms:
+                listeners = self._listeners.get(room)
+                if listeners is not None:
+                    listeners.discard(signal)
+                    if not listeners:
+                        del self._listeners[room]
+
+    def since(self, rooms: Iterable[str], last_id: int, epoch: str = None) -> Optional[List[Tuple[int, str, Dict]]]:
+        """Events after last_id across rooms in id order, or None if the client must resync"""
+        if epoch is not None and epoch != self.epoch:
+            return None
+        if last_id > self._last_id:
+            return None
+        with self._lock:
+            missed = {}
+            for room in rooms:
+                if self._evicted.get(room, 0) > last_id:
+                    return None
+                for entry in reversed(self._rooms.get(room, ())):
+                    if entry[0] <= last_id:
+                        break
+                    missed[entry[0]] = entry
+        # An emit to several rooms is one event; the dict keeps it once
+        return [missed[event_id] for event_id in sorted(missed)]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'epoch': self.epoch,
+                'last_event_id': self._last_id,
+                'rooms': len(self._rooms),
+                'buffered': sum(len(buffer) for buffer in self._rooms.values()),
+                'capacity': self.capacity,
+                'listeners': len({signal for listeners in self._listeners.values() for signal in listeners}),
+            }
@@ -32,6 +32,12 @@ def main():
     try:
         # Setup initial data
         setup_initial_data()
+
+        if '--production' in sys.argv:
+            # Multi-worker server; see server.py for the options
+            from server import serve
+            serve(port=int(os.getenv('PORT', '5000')), workers=int(os.getenv('EAGLE_WORKERS', '1')))
+            return
         
         print("\n" + "="*60)
         print("EAGLE TASK MANAGEMENT SYSTEM")
@@ -53,7 +59,8 @@ def main():
         print("="*60)
         
         # Import and start web app
-        from web_app import app, socketio
+        from web_app import app, socketio, start_background_workers
+        start_background_workers()
         
         # Run the web application
         # Use localhost for local development, 0.0.0.0 for Replit
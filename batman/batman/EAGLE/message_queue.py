@@ -0,0 +1,69 @@
+"""
+Socket.IO message queue selection for the Eagle Task Management System
+
+With more than one server process, an emit to a room (company_{id}, user_{id})
+has to reach the clients connected to every process. Flask-SocketIO does that
+through a pub/sub client manager; EAGLE_MESSAGE_QUEUE picks which one:
+
+    (unset)              single process, rooms live in memory
+    local://             in-process bus (tests, several servers in one process)
+    redis://host:6379/0  Redis pub/sub (also rediss://)
+    amqp://...           any other URL is handed to Flask-SocketIO (Kombu, Kafka, ZeroMQ)
+"""
+
+import os
+import queue
+import threading
+from typing import Dict
+
+import socketio
+
+EAGLE_MESSAGE_QUEUE = os.getenv('EAGLE_MESSAGE_QUEUE', '')
+SOCKETIO_CHANNEL = os.getenv('EAGLE_MESSAGE_QUEUE_CHANNEL', 'eagle-socketio')
+
+
+class LocalPubSubManager(socketio.PubSubManager):
+    """In-process stand-in for Redis: every manager on a channel gets every message.
+
+    Messages are JSON-encoded as they would be on the wire, so several
+    Socket.IO servers in one process coordinate rooms exactly like separate
+    worker processes sharing a Redis server.
+    """
+
+    name = 'local'
+    _subscribers: Dict[str, list] = {}
+    _subscribers_lock = threading.Lock()
+
+    def __init__(self, url: str = 'local://', channel: str = SOCKETIO_CHANNEL, write_only: bool = False,
+                 logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.url = url
+        self._inbox = queue.Queue()
+        if not write_only:
+            with self._subscribers_lock:
+                self._subscribers.setdefault(channel, []).append(self._inbox)
+
+    def _publish(self, data):
+        message = self.json.dumps(data)
+        with self._subscribers_lock:
+            inboxes = list(self._subscribers.get(self.channel, []))
+        for inbox in inboxes:
+            inbox.put(message)
+
+    def _listen(self):
+        while True:
+            yield self._inbox.get()
+
+
+def is_multi_process(url: str = EAGLE_MESSAGE_QUEUE) -> bool:
+    """Whether the queue can link separate processes (local:// cannot)"""
+    return bool(url) and not url.startswith('local://')
+
+
+def socketio_queue_options(url: str = EAGLE_MESSAGE_QUEUE, channel: str = SOCKETIO_CHANNEL) -> Dict:
+    """Keyword arguments for SocketIO() that attach the configured message queue"""
+    if not url:
+        return {}
+    if url.startswith('local://'):
+        return {'client_manager': LocalPubSubManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
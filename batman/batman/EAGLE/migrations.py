@@ -0,0 +1,803 @@
+"""
+Versioned schema migrations for the Eagle Task Management System
+
+The schema version is stored in PRAGMA user_version. Migrations are applied
+once, in order, each inside its own transaction on the writer connection, so
+a database that is already current only costs a single PRAGMA read at start.
+"""
+
+import sqlite3
+from typing import Callable, List, Optional, Set, Tuple
+
+# (version, description, step) - append new steps, never edit applied ones
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = []
+
+
+def migration(version: int, description: str):
+    """Register a migration step for the given schema version"""
+    def register(step):
+        if MIGRATIONS and version <= MIGRATIONS[-1][0]:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append((version, description, step))
+        return step
+    return register
+
+
+def _columns(cursor: sqlite3.Cursor, table: str) -> Set[str]:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {column[1] for column in cursor.fetchall()}
+
+
+def _add_missing_columns(cursor: sqlite3.Cursor, table: str, columns: List[Tuple[str, str]]):
+    existing = _columns(cursor, table)
+    for name, definition in columns:
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+@migration(1, "baseline schema")
+def _baseline_schema(cursor: sqlite3.Cursor):
+    # Companies table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS companies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            role TEXT NOT NULL CHECK (role IN ('Admin', 'Manager', 'Employee')),
+            company_id INTEGER NOT NULL,
+            is_active BOOLEAN DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            telegram_chat_id TEXT,
+            mobile_number TEXT,
+            FOREIGN KEY (company_id) REFERENCES companies (id)
+        )
+    ''')
+
+    # Tasks table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            assigned_to INTEGER NOT NULL,
+            company_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'Pending' CHECK (status IN ('Pending', 'In Progress', 'Completed')),
+            start_date DATE,
+            deadline DATE,
+            priority TEXT NOT NULL DEFAULT 'Medium' CHECK (priority IN ('Low', 'Medium', 'High', 'Critical')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (assigned_to) REFERENCES users (id),
+            FOREIGN KEY (company_id) REFERENCES companies (id)
+        )
+    ''')
+
+    # Task Comments table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            comment TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_read BOOLEAN DEFAULT 0,
+            FOREIGN KEY (task_id) REFERENCES tasks (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Messages table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            company_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            receiver_id INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (company_id) REFERENCES companies (id),
+            FOREIGN KEY (receiver_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Private Messages table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS private_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER NOT NULL,
+            receiver_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (sender_id) REFERENCES users (id),
+            FOREIGN KEY (receiver_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Reminders table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            description TEXT,
+            reminder_date DATE NOT NULL,
+            alert_days_before INTEGER DEFAULT 1,
+            is_active BOOLEAN DEFAULT 1,
+            company_id INTEGER NOT NULL,
+            created_by INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (company_id) REFERENCES companies (id),
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+    ''')
+
+    # File attachments table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_attachments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            filename TEXT NOT NULL,
+            original_filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_size INTEGER,
+            file_type TEXT,
+            uploaded_by INTEGER NOT NULL,
+            upload_type TEXT NOT NULL CHECK (upload_type IN ('task_assignment', 'task_progress')),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (task_id) REFERENCES tasks (id),
+            FOREIGN KEY (uploaded_by) REFERENCES users (id)
+        )
+    ''')
+
+    # Push subscriptions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS push_subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            endpoint TEXT NOT NULL,
+            p256dh TEXT,
+            auth TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Notifications table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            is_read BOOLEAN DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Databases created before versioning may predate these columns; add them
+    # in place instead of dropping the tables
+    _add_missing_columns(cursor, 'users', [
+        ('is_active', 'BOOLEAN DEFAULT 1'),
+        ('telegram_chat_id', 'TEXT'),
+        ('mobile_number', 'TEXT'),
+    ])
+    _add_missing_columns(cursor, 'tasks', [
+        ('start_date', 'DATE'),
+        ('deadline', 'DATE'),
+        ('priority', "TEXT NOT NULL DEFAULT 'Medium' CHECK (priority IN ('Low', 'Medium', 'High', 'Critical'))"),
+    ])
+    _add_missing_columns(cursor, 'task_comments', [
+        ('is_read', 'BOOLEAN DEFAULT 0'),
+    ])
+
+
+# Secondary indexes for the hot Database queries, as (name, definition)
+HOT_QUERY_INDEXES = [
+    # get_tasks_by_company: company seek, rows already in deadline order (NULLs last)
+    ('idx_tasks_company_deadline', 'tasks(company_id, deadline IS NULL, deadline, created_at DESC)'),
+    # get_user_tasks, delete_user task count
+    ('idx_tasks_assignee', 'tasks(assigned_to, company_id, created_at DESC)'),
+    # get_task_comments
+    ('idx_task_comments_task', 'task_comments(task_id, created_at)'),
+    # get_company_messages: only company-wide messages are indexed
+    ('idx_messages_company_public', 'messages(company_id, timestamp) WHERE receiver_id IS NULL'),
+    # get_all_company_messages, per company and across companies
+    ('idx_messages_company', 'messages(company_id, timestamp)'),
+    ('idx_messages_timestamp', 'messages(timestamp)'),
+    # get_private_messages / get_private_messages_with_admin_filter
+    ('idx_private_messages_pair', 'private_messages(sender_id, receiver_id, timestamp)'),
+    ('idx_private_messages_receiver', 'private_messages(receiver_id, timestamp)'),
+    # get_task_attachments
+    ('idx_file_attachments_task', 'file_attachments(task_id, created_at)'),
+    # get_user_subscriptions
+    ('idx_push_subscriptions_user', 'push_subscriptions(user_id)'),
+    # authenticate_user: username uses the UNIQUE index, mobile_number this one
+    ('idx_users_mobile', 'users(mobile_number) WHERE mobile_number IS NOT NULL'),
+    # get_users_by_company, /api/users_by_company
+    ('idx_users_company', 'users(company_id, username)'),
+    # get_reminders
+    ('idx_reminders_company', 'reminders(company_id, is_active, reminder_date)'),
+    ('idx_notifications_user', 'notifications(user_id)'),
+]
+
+
+@migration(2, "indexes for hot queries")
+def _hot_query_indexes(cursor: sqlite3.Cursor):
+    for name, definition in HOT_QUERY_INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+
+@migration(3, "trigger-maintained task counters")
+def _task_counters(cursor: sqlite3.Cursor):
+    # One row per (company, assignee, status, priority); assigned_to = 0 holds
+    # the company-wide totals so both scopes are read with a single seek
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_counters (
+            company_id INTEGER NOT NULL,
+            assigned_to INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            priority TEXT NOT NULL,
+            task_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (company_id, assigned_to, status, priority)
+        ) WITHOUT ROWID
+    ''')
+
+    increment = '''
+        INSERT INTO task_counters (company_id, assigned_to, status, priority, task_count)
+        VALUES (NEW.company_id, 0, NEW.status, NEW.priority, 1),
+               (NEW.company_id, NEW.assigned_to, NEW.status, NEW.priority, 1)
+        ON CONFLICT (company_id, assigned_to, status, priority)
+        DO UPDATE SET task_count = task_count + 1;
+    '''
+    decrement = '''
+        UPDATE task_counters SET task_count = task_count - 1
+        WHERE company_id = OLD.company_id AND assigned_to IN (0, OLD.assigned_to)
+          AND status = OLD.status AND priority = OLD.priority;
+    '''
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_task_counters_insert AFTER INSERT ON tasks BEGIN {increment} END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_task_counters_delete AFTER DELETE ON tasks BEGIN {decrement} END")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_task_counters_update
+        AFTER UPDATE OF company_id, assigned_to, status, priority ON tasks
+        BEGIN {decrement} {increment} END
+    ''')
+
+    # Backfill from the existing tasks
+    cursor.execute("DELETE FROM task_counters")
+    cursor.execute('''
+        INSERT INTO task_counters (company_id, assigned_to, status, priority, task_count)
+        SELECT company_id, assigned_to, status, priority, COUNT(*)
+        FROM tasks GROUP BY company_id, assigned_to, status, priority
+    ''')
+    cursor.execute('''
+        INSERT INTO task_counters (company_id, assigned_to, status, priority, task_count)
+        SELECT company_id, 0, status, priority, COUNT(*)
+        FROM tasks GROUP BY company_id, status, priority
+    ''')
+
+
+# NULL deadlines sort last; shared by the task listing queries and their indexes
+TASK_DEADLINE_SORT_KEY = "COALESCE(deadline, '9999-12-31')"
+
+
+@migration(4, "keyset pagination indexes for task listings")
+def _task_keyset_indexes(cursor: sqlite3.Cursor):
+    # (sort key, id DESC) is unique per row, so pages can resume from a cursor
+    cursor.execute("DROP INDEX IF EXISTS idx_tasks_company_deadline")
+    cursor.execute("DROP INDEX IF EXISTS idx_tasks_assignee")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_company_due ON tasks(company_id, {TASK_DEADLINE_SORT_KEY}, id DESC)")
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_assignee_due ON tasks(assigned_to, company_id, {TASK_DEADLINE_SORT_KEY}, id DESC)")
+    # Newest-first listings walk these in rowid order
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_company ON tasks(company_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_assignee ON tasks(assigned_to, company_id)")
+
+
+@migration(5, "notification outbox")
+def _notification_outbox(cursor: sqlite3.Cursor):
+    # Written in the same transaction as the change that triggers it and
+    # drained by outbox.OutboxDispatcher. next_attempt_at (unix time) doubles
+    # as the lease expiry while a row is 'sending', so a crashed worker's
+    # rows become claimable again on their own.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel TEXT NOT NULL,
+            user_id INTEGER,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at)")
+
+
+@migration(6, "task change sequence and tombstones for delta sync")
+def _task_change_tracking(cursor: sqlite3.Cursor):
+    # Every insert, update and delete of a task takes the next value of one
+    # counter. Writes are serialized, so readers never see a gap fill in
+    # behind them and "change_seq > cursor" returns exactly what changed.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    _add_missing_columns(cursor, 'tasks', [('change_seq', 'INTEGER NOT NULL DEFAULT 0')])
+    cursor.execute("UPDATE tasks SET change_seq = id")
+    cursor.execute("INSERT OR REPLACE INTO change_sequences (name, value) SELECT 'tasks', COALESCE(MAX(id), 0) FROM tasks")
+
+    # A tombstone tells a client to drop a task it holds: the task was deleted,
+    # or it moved away from the assignee (whose view no longer includes it)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_tombstones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            company_id INTEGER NOT NULL,
+            assigned_to INTEGER,
+            reason TEXT NOT NULL,
+            change_seq INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_company_changes ON tasks(company_id, change_seq)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_assignee_changes ON tasks(assigned_to, company_id, change_seq)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_tombstones_company ON task_tombstones(company_id, change_seq)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_tombstones_assignee ON task_tombstones(assigned_to, company_id, change_seq)")
+
+    bump = "UPDATE change_sequences SET value = value + 1 WHERE name = 'tasks';"
+    current = "(SELECT value FROM change_sequences WHERE name = 'tasks')"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_change_insert AFTER INSERT ON tasks
+        BEGIN
+            {bump}
+            UPDATE tasks SET change_seq = {current} WHERE id = NEW.id;
+        END
+    ''')
+    # Guarded on change_seq so the trigger's own UPDATE (or an explicit one) does not bump again
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_change_update AFTER UPDATE ON tasks
+        WHEN NEW.change_seq = OLD.change_seq
+        BEGIN
+            {bump}
+            UPDATE tasks SET change_seq = {current} WHERE id = NEW.id;
+            INSERT INTO task_tombstones (task_id, company_id, assigned_to, reason, change_seq)
+            SELECT OLD.id, OLD.company_id, OLD.assigned_to, 'reassigned', {current}
+            WHERE OLD.assigned_to IS NOT NEW.assigned_to OR OLD.company_id IS NOT NEW.company_id;
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_tasks_change_delete AFTER DELETE ON tasks
+        BEGIN
+            {bump}
+            INSERT INTO task_tombstones (task_id, company_id, assigned_to, reason, change_seq)
+            VALUES (OLD.id, OLD.company_id, OLD.assigned_to, 'deleted', {current});
+        END
+    ''')
+
+
+@migration(7, "task watchers for per-task event rooms")
+def _task_watchers(cursor: sqlite3.Cursor):
+    # Who receives a task's comment and attachment events (room task_{id}).
+    # 'assignee' rows follow the assignment; 'participant' rows (commented or
+    # uploaded) stay until the task is deleted. Admins get every task's events
+    # through company_{id}_admins and are not listed here.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_watchers (
+            task_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (task_id, user_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_task_watchers_user ON task_watchers(user_id, task_id)")
+
+    watch_as_assignee = '''
+        INSERT INTO task_watchers (task_id, user_id, reason)
+        SELECT NEW.id, NEW.assigned_to, 'assignee' WHERE NEW.assigned_to IS NOT NULL
+        ON CONFLICT (task_id, user_id) DO UPDATE SET reason = 'assignee';
+    '''
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_task_watchers_task_insert AFTER INSERT ON tasks BEGIN {watch_as_assignee} END")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_task_watchers_reassign AFTER UPDATE OF assigned_to ON tasks
+        WHEN OLD.assigned_to IS NOT NEW.assigned_to
+        BEGIN
+            DELETE FROM task_watchers WHERE task_id = OLD.id AND user_id = OLD.assigned_to AND reason = 'assignee';
+            {watch_as_assignee}
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_task_watchers_task_delete AFTER DELETE ON tasks
+        BEGIN
+            DELETE FROM task_watchers WHERE task_id = OLD.id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_task_watchers_comment AFTER INSERT ON task_comments
+        BEGIN
+            INSERT OR IGNORE INTO task_watchers (task_id, user_id, reason) VALUES (NEW.task_id, NEW.user_id, 'participant');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_task_watchers_attachment AFTER INSERT ON file_attachments
+        BEGIN
+            INSERT OR IGNORE INTO task_watchers (task_id, user_id, reason) VALUES (NEW.task_id, NEW.uploaded_by, 'participant');
+        END
+    ''')
+
+    # Backfill from the existing tasks, comments and attachments
+    cursor.execute('''
+        INSERT OR IGNORE INTO task_watchers (task_id, user_id, reason)
+        SELECT id, assigned_to, 'assignee' FROM tasks WHERE assigned_to IS NOT NULL
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO task_watchers (task_id, user_id, reason)
+        SELECT DISTINCT tc.task_id, tc.user_id, 'participant' FROM task_comments tc JOIN tasks t ON t.id = tc.task_id
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO task_watchers (task_id, user_id, reason)
+        SELECT DISTINCT fa.task_id, fa.uploaded_by, 'participant' FROM file_attachments fa JOIN tasks t ON t.id = fa.task_id
+        WHERE fa.uploaded_by IS NOT NULL
+    ''')
+
+
+@migration(8, "resumable chunked upload sessions")
+def _upload_sessions(cursor: sqlite3.Cursor):
+    # One row per chunked upload (see uploads.py); received only moves forward
+    # by a conditional UPDATE, so a retried or duplicated chunk cannot skip bytes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            task_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            company_id INTEGER NOT NULL,
+            original_filename TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            upload_type TEXT NOT NULL,
+            total_size INTEGER NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            expected_sha256 TEXT,
+            status TEXT NOT NULL DEFAULT 'uploading',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated ON upload_sessions(updated_at)")
+
+
+@migration(9, "content-addressed attachment blobs with reference counts")
+def _attachment_blobs(cursor: sqlite3.Cursor):
+    # One row per stored SHA-256 (see blob_store.py); ref_count is the number
+    # of file_attachments rows pointing at it. Attachments from before this
+    # migration keep content_hash NULL and their own file.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            released_at TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs(released_at) WHERE ref_count <= 0")
+    _add_missing_columns(cursor, 'file_attachments', [('content_hash', 'TEXT')])
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_attachments_hash ON file_attachments(content_hash)")
+
+    acquire = '''
+        UPDATE blobs SET ref_count = ref_count + 1, released_at = NULL WHERE sha256 = NEW.content_hash;
+    '''
+    release = '''
+        UPDATE blobs SET ref_count = ref_count - 1,
+                         released_at = CASE WHEN ref_count <= 1 THEN CURRENT_TIMESTAMP END
+        WHERE sha256 = OLD.content_hash;
+    '''
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_blobs_ref_insert AFTER INSERT ON file_attachments
+        WHEN NEW.content_hash IS NOT NULL
+        BEGIN {acquire} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_blobs_ref_delete AFTER DELETE ON file_attachments
+        WHEN OLD.content_hash IS NOT NULL
+        BEGIN {release} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_blobs_ref_update AFTER UPDATE OF content_hash ON file_attachments
+        WHEN OLD.content_hash IS NOT NEW.content_hash
+        BEGIN {release} {acquire} END
+    ''')
+
+
+@migration(10, "file path index for the storage reconciler")
+def _attachment_path_index(cursor: sqlite3.Cursor):
+    # storage_gc.py asks, a batch of files at a time, whether anything still points at them
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_file_attachments_path ON file_attachments(file_path)")
+
+
+# attachment_text rowids are attachment_id * ATTACHMENT_TEXT_SPAN + chunk number,
+# so one attachment's chunks are a rowid range (see attachment_indexer.py)
+ATTACHMENT_TEXT_SPAN = 10000
+
+
+@migration(11, "full-text index of attachment contents")
+def _attachment_text(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS attachment_text
+        USING fts5(content, tokenize = 'unicode61 remove_diacritics 2')
+    ''')
+    # Extraction queue, one row per attachment, claimed with a lease like the outbox
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS attachment_index (
+            attachment_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'pending'
+                CHECK (status IN ('pending', 'processing', 'indexed', 'skipped', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            chunks INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            indexed_at TIMESTAMP
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attachment_index_due ON attachment_index(status, next_attempt_at)")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_attachment_index_queue AFTER INSERT ON file_attachments
+        BEGIN
+            INSERT OR IGNORE INTO attachment_index (attachment_id) VALUES (NEW.id);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_attachment_index_delete AFTER DELETE ON file_attachments
+        BEGIN
+            DELETE FROM attachment_index WHERE attachment_id = OLD.id;
+            DELETE FROM attachment_text
+            WHERE rowid BETWEEN OLD.id * {ATTACHMENT_TEXT_SPAN} AND OLD.id * {ATTACHMENT_TEXT_SPAN} + {ATTACHMENT_TEXT_SPAN - 1};
+        END
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO attachment_index (attachment_id) SELECT id FROM file_attachments")
+
+
+# Search indexes: FTS5 tables over their source rows (external content), kept in
+# step by triggers. Each carries the row's company_id as an indexed column so a
+# search can AND the tenant into the MATCH instead of filtering afterwards.
+SEARCH_INDEXES = {
+    # index: (content table or view, text columns)
+    'tasks_fts': ('tasks', ('title', 'description')),
+    'task_comments_fts': ('task_comments_search', ('comment',)),
+    'messages_fts': ('messages', ('message',)),
+    'private_messages_fts': ('private_messages_search', ('message',)),
+}
+
+
+def _fts_values(columns, row):
+    return ", ".join(f"{row}.{column}" for column in columns)
+
+
+@migration(12, "full-text search over tasks, comments and messages")
+def _search_indexes(cursor: sqlite3.Cursor):
+    # Comments and private messages have no company_id of their own
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS task_comments_search AS
+        SELECT c.id, c.comment, t.company_id FROM task_comments c JOIN tasks t ON t.id = c.task_id
+    ''')
+    cursor.execute('''
+        CREATE VIEW IF NOT EXISTS private_messages_search AS
+        SELECT pm.id, pm.message, u.company_id FROM private_messages pm JOIN users u ON u.id = pm.sender_id
+    ''')
+    for index, (content, columns) in SEARCH_INDEXES.items():
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {index}
+            USING fts5({", ".join(columns)}, company_id, content = '{content}', content_rowid = 'id',
+                       tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')
+        ''')
+        cursor.execute(f"INSERT INTO {index} ({index}) VALUES ('rebuild')")
+
+    # Tables with company_id: index NEW, and for a delete hand FTS5 the old values
+    for index, table in (('tasks_fts', 'tasks'), ('messages_fts', 'messages')):
+        columns = SEARCH_INDEXES[index][1] + ('company_id',)
+        names = ", ".join(columns)
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{index}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {index} (rowid, {names}) VALUES (NEW.id, {_fts_values(columns, 'NEW')});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{index}_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', OLD.id, {_fts_values(columns, 'OLD')});
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{index}_update AFTER UPDATE OF {names} ON {table}
+            BEGIN
+                INSERT INTO {index} ({index}, rowid, {names}) VALUES ('delete', OLD.id, {_fts_values(columns, 'OLD')});
+                INSERT INTO {index} (rowid, {names}) VALUES (NEW.id, {_fts_values(columns, 'NEW')});
+            END
+        ''')
+
+    # View-backed indexes read the row through the view: after an insert, and
+    # before a delete while the row (and its company) can still be looked up
+    for index, table, text in (('task_comments_fts', 'task_comments', 'comment'),
+                               ('private_messages_fts', 'private_messages', 'message')):
+        view = SEARCH_INDEXES[index][0]
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{index}_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {index} (rowid, {text}, company_id)
+                SELECT id, {text}, company_id FROM {view} WHERE id = NEW.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{index}_delete BEFORE DELETE ON {table}
+            BEGIN
+                INSERT INTO {index} ({index}, rowid, {text}, company_id)
+                SELECT 'delete', id, {text}, company_id FROM {view} WHERE id = OLD.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{index}_update_before BEFORE UPDATE OF {text} ON {table}
+            BEGIN
+                INSERT INTO {index} ({index}, rowid, {text}, company_id)
+                SELECT 'delete', id, {text}, company_id FROM {view} WHERE id = OLD.id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{index}_update_after AFTER UPDATE OF {text} ON {table}
+            BEGIN
+                INSERT INTO {index} (rowid, {text}, company_id)
+                SELECT id, {text}, company_id FROM {view} WHERE id = NEW.id;
+            END
+        ''')
+
+
+# Day a reminder starts alerting; kept on the row so it can be indexed
+REMINDER_ALERT_DATE = "DATE(reminder_date, (-COALESCE(alert_days_before, 0)) || ' days')"
+
+
+@migration(13, "stored reminder alert dates for the reminder scheduler")
+def _reminder_alert_dates(cursor: sqlite3.Cursor):
+    _add_missing_columns(cursor, 'reminders', [('alert_date', 'DATE'), ('alerted_at', 'TIMESTAMP')])
+    cursor.execute(f"UPDATE reminders SET alert_date = {REMINDER_ALERT_DATE}")
+    # Reminders already past are not alerted after the upgrade
+    cursor.execute("UPDATE reminders SET alerted_at = CURRENT_TIMESTAMP "
+                   "WHERE DATE(reminder_date) < DATE('now', 'localtime')")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reminders_alert_date_insert AFTER INSERT ON reminders
+        BEGIN
+            UPDATE reminders SET alert_date = {REMINDER_ALERT_DATE} WHERE id = NEW.id;
+        END
+    ''')
+    # A new date re-arms the alert
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_reminders_alert_date_update
+        AFTER UPDATE OF reminder_date, alert_days_before ON reminders
+        BEGIN
+            UPDATE reminders SET alert_date = {REMINDER_ALERT_DATE}, alerted_at = NULL WHERE id = NEW.id;
+        END
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_company_alert ON reminders(company_id, alert_date) "
+                   "WHERE is_active = 1")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reminders_pending_alert ON reminders(alert_date) "
+                   "WHERE is_active = 1 AND alerted_at IS NULL")
+
+
+@migration(14, "task deadline escalations for the deadline scheduler")
+def _deadline_escalations(cursor: sqlite3.Cursor):
+    # One row per notification sent. Keyed on the deadline too, so moving a
+    # deadline re-arms its thresholds while repeating one never does.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_escalations (
+            task_id INTEGER NOT NULL,
+            threshold TEXT NOT NULL,
+            deadline TEXT NOT NULL,
+            escalated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (task_id, threshold, deadline)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_task_escalations_delete AFTER DELETE ON tasks
+        BEGIN
+            DELETE FROM task_escalations WHERE task_id = OLD.id;
+        END
+    ''')
+    # Tasks already overdue are not escalated after the upgrade
+    cursor.execute('''
+        INSERT OR IGNORE INTO task_escalations (task_id, threshold, deadline)
+        SELECT t.id, th.threshold, t.deadline
+        FROM tasks t, (SELECT 'due_soon' AS threshold UNION ALL SELECT 'overdue') th
+        WHERE t.status != 'Completed' AND t.deadline > '' AND DATE(t.deadline) < DATE('now', 'localtime')
+    ''')
+    # Seeds the scheduler; "deadline > ''" also leaves out tasks saved with an empty deadline
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_open_deadline ON tasks(deadline) "
+                   "WHERE status != 'Completed' AND deadline > ''")
+    # Keeps it current: every task changed after the sequence value it last read
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tasks_change_seq ON tasks(change_seq)")
+
+
+@migration(15, "task watchers only from the task's own company")
+def _task_watchers_same_company(cursor: sqlite3.Cursor):
+    # Commenting or uploading made any user a watcher of any task id, letting
+    # another company's users into its event room and its search results.
+    # The routes now check access first; the triggers also refuse outsiders.
+    same_company = "EXISTS (SELECT 1 FROM tasks t JOIN users u ON u.company_id = t.company_id " \
+                   "WHERE t.id = NEW.task_id AND u.id = NEW.{user})"
+    for name, table, user in (('comment', 'task_comments', 'user_id'),
+                              ('attachment', 'file_attachments', 'uploaded_by')):
+        cursor.execute(f"DROP TRIGGER IF EXISTS trg_task_watchers_{name}")
+        cursor.execute(f'''
+            CREATE TRIGGER trg_task_watchers_{name} AFTER INSERT ON {table}
+            WHEN {same_company.format(user=user)}
+            BEGIN
+                INSERT OR IGNORE INTO task_watchers (task_id, user_id, reason)
+                VALUES (NEW.task_id, NEW.{user}, 'participant');
+            END
+        ''')
+    cursor.execute('''
+        DELETE FROM task_watchers
+        WHERE NOT EXISTS (SELECT 1 FROM tasks t JOIN users u ON u.company_id = t.company_id
+                          WHERE t.id = task_watchers.task_id AND u.id = task_watchers.user_id)
+    ''')
+
+
+@migration(16, "file name index for the storage reconciler")
+def _legacy_attachment_name_index(cursor: sqlite3.Cursor):
+    # storage_gc.py matches files in the upload folder by name: stored paths are
+    # relative to whatever directory the app ran in, so they cannot be compared
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_file_attachments_legacy_name ON file_attachments(filename)
+        WHERE content_hash IS NULL
+    ''')
+    cursor.execute("DROP INDEX IF EXISTS idx_file_attachments_path")
+
+
+def latest_version() -> int:
+    """Schema version produced by the newest registered migration"""
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def get_schema_version(conn) -> int:
+    """Read the schema version recorded in the database header"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn, target: Optional[int] = None) -> List[int]:
+    """Apply every pending migration up to target (default: latest).
+
+    Runs on the writer connection; BEGIN IMMEDIATE makes a second process
+    wait and then skip the steps that were already applied. Returns the
+    versions applied by this call.
+    """
+    target = latest_version() if target is None else target
+    applied = []
+    for version, description, step in MIGRATIONS:
+        if version > target:
+            break
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if get_schema_version(conn) >= version:
+                cursor.execute("COMMIT")
+                continue
+            step(cursor)
+            cursor.execute(f"PRAGMA user_version = {int(version)}")
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        print(f"🗄️  Applied schema migration {version}: {description}")
+        applied.append(version)
+    return applied
@@ -14,10 +14,14 @@ import {
 } from 'react-native';
 import * as SQLite from 'expo-sqlite';
 import AsyncStorage from '@react-native-async-storage/async-storage';
+import Constants from 'expo-constants';
 
 // Initialize local SQLite database
 const db = SQLite.openDatabase('eagle_tasks.db');
 
+// Eagle server to sync tasks from (app.json "extra.apiUrl"); leave empty to stay offline
+const API_URL = Constants.expoConfig?.extra?.apiUrl;
+
 export default function App() {
   const [isLoggedIn, setIsLoggedIn] = useState(false);
   const [user, setUser] = useState(null);
@@ -47,6 +51,7 @@ export default function App() {
   useEffect(() => {
     if (isLoggedIn && user) {
       loadTasks();
+      syncTasks();
     }
   }, [isLoggedIn, user]);
 
@@ -88,6 +93,11 @@ export default function App() {
         );`
       );
 
+      // Columns the server sends that older installs do not have yet
+      ['start_date TEXT', 'deadline TEXT', 'updated_at DATETIME'].forEach(column => {
+        tx.executeSql(`ALTER TABLE tasks ADD COLUMN ${column};`, [], null, () => false);
+      });
+
       // Insert sample data
       tx.executeSql(
         `INSERT OR IGNORE INTO companies (id, name) VALUES (1, 'TechCorp');`
@@ -183,6 +193,66 @@ export default function App() {
     });
   };
 
+  // Pull only the tasks changed since the last sync from /api/tasks/changes
+  const syncTasks = async (currentUser = user) => {
+    if (!API_URL || !currentUser) {
+      return;
+    }
+    const cursorKey = `tasks_sync_cursor_${currentUser.id}`;
+    try {
+      let since = parseInt(await AsyncStorage.getItem(cursorKey) || '0', 10);
+      let hasMore = true;
+      while (hasMore) {
+        const response = await fetch(`${API_URL}/api/tasks/changes?since=${since}`, { credentials: 'include' });
+        if (!response.ok) {
+          console.log('Task sync failed:', response.status);
+          return;
+        }
+        const delta = await response.json();
+        await applyTaskChanges(delta, currentUser);
+        since = delta.cursor;
+        hasMore = delta.has_more;
+        await AsyncStorage.setItem(cursorKey, String(since));
+      }
+      loadTasks();
+    } catch (error) {
+      console.log('Task sync unavailable, using local data:', error.message);
+    }
+  };
+
+  const applyTaskChanges = (delta, currentUser) => new Promise((resolve, reject) => {
+    db.transaction(tx => {
+      delta.deleted.forEach(id => {
+        tx.executeSql('DELETE FROM tasks WHERE id = ?', [id]);
+      });
+      delta.tasks.forEach(task => {
+        tx.executeSql(
+          `INSERT OR REPLACE INTO tasks
+             (id, title, description, assigned_to, company_id, status, priority, created_at, start_date, deadline, updated_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)`,
+          [task.id, task.title, task.description, task.assigned_to, currentUser.company_id, task.status,
+           task.priority, task.created_at, task.start_date, task.deadline, task.updated_at]
+        );
+      });
+    }, reject, resolve);
+  });
+
+  const loginToServer = async (credentials) => {
+    if (!API_URL) {
+      return;
+    }
+    try {
+      await fetch(`${API_URL}/login`, {
+        method: 'POST',
+        credentials: 'include',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(credentials)
+      });
+    } catch (error) {
+      console.log('Server login failed, working offline:', error.message);
+    }
+  };
+
   const handleLogin = () => {
     if (!loginForm.username || !loginForm.password || !loginForm.company_id) {
       Alert.alert('Error', 'Please fill in all fields');
@@ -201,6 +271,10 @@ export default function App() {
             
             // Store user data locally
             await AsyncStorage.setItem('user', JSON.stringify(userData));
+
+            // Open a server session so syncTasks can pull changes
+            await loginToServer(loginForm);
+            syncTasks(userData);
             
             // Load users for task assignment
             loadUsers(userData.company_id);
@@ -0,0 +1,170 @@
+"""
+Notification outbox dispatcher for the Eagle Task Management System
+
+Notifications are written to the outbox table in the same transaction as the
+change that caused them (see Database.create_task). Background worker threads
+claim due rows, deliver them through a per-channel handler and record the
+outcome: sent, retried later with exponential backoff, or dead-lettered.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict
+
+from database import Database
+from telegram_client import (TelegramClient, TelegramRejected, TelegramUnavailable, format_notification,
+                             get_telegram_client)
+
+OUTBOX_WORKERS = int(os.getenv('EAGLE_OUTBOX_WORKERS', '2'))
+OUTBOX_BATCH_SIZE = 10
+OUTBOX_POLL_INTERVAL = 5.0  # seconds between polls when nobody wakes the workers
+OUTBOX_LEASE = 60.0  # seconds a claimed row stays reserved for its worker
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('EAGLE_OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_RETRY_BASE = 5.0  # seconds, doubled per attempt
+OUTBOX_RETRY_MAX = 3600.0
+
+
+class PermanentDeliveryError(Exception):
+    """Delivery can never succeed (unknown user, no chat ID, rejected request); do not retry"""
+
+
+class RetryLater(Exception):
+    """Delivery failed transiently; retry_after overrides the backoff when the API asks for it"""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, capped at OUTBOX_RETRY_MAX"""
+    delay = min(OUTBOX_RETRY_BASE * (2 ** (attempts - 1)), OUTBOX_RETRY_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def make_telegram_handler(db: Database, client: TelegramClient) -> Callable[[Dict], None]:
+    """Deliver {'message': ...} payloads to the user's Telegram chat"""
+    def deliver(item: Dict):
+        contact = db.get_user_contact(item['user_id'])
+        if not contact:
+            raise PermanentDeliveryError(f"User not found: {item['user_id']}")
+        if not contact['telegram_chat_id']:
+            raise PermanentDeliveryError(f"No Chat ID configured for user: {contact['username']}")
+
+        try:
+            client.send_message(contact['telegram_chat_id'],
+                                format_notification(contact['username'], item['payload']['message']))
+        except TelegramRejected as e:
+            raise PermanentDeliveryError(str(e))
+        except TelegramUnavailable as e:
+            raise RetryLater(str(e), e.retry_after)
+
+    return deliver
+
+
+class OutboxDispatcher:
+    """Worker threads that drain the outbox table"""
+
+    def __init__(self, db: Database = None, workers: int = OUTBOX_WORKERS, batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL, lease: float = OUTBOX_LEASE,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self.db = db or Database()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.handlers: Dict[str, Callable[[Dict], None]] = {}
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._counter_lock = threading.Lock()
+        self.counters = {'sent': 0, 'retried': 0, 'dead': 0}
+
+    def register(self, channel: str, handler: Callable[[Dict], None]):
+        """Route a channel's rows to handler; it returns on success and raises on failure"""
+        self.handlers[channel] = handler
+
+    def start(self):
+        if self._threads:
+            return
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"outbox-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"📬 Outbox dispatcher started with {self.workers} workers")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        """Tell idle workers new rows are waiting instead of letting them sleep out the poll"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                processed = self.dispatch_once()
+            except Exception as e:
+                print(f"❌ Outbox worker error: {e}")
+                processed = 0
+            if processed < self.batch_size:
+                self._wake.wait(self.poll_interval)
+
+    def dispatch_once(self) -> int:
+        """Claim and deliver one batch; returns how many rows were processed"""
+        items = self.db.claim_outbox(self.batch_size, self.lease)
+        for item in items:
+            self._deliver(item)
+        return len(items)
+
+    def _deliver(self, item: Dict):
+        handler = self.handlers.get(item['channel'])
+        try:
+            if handler is None:
+                raise PermanentDeliveryError(f"No handler for channel: {item['channel']}")
+            handler(item)
+        except PermanentDeliveryError as e:
+            self._dead_letter(item, str(e))
+            return
+        except Exception as e:
+            if item['attempts'] >= self.max_attempts:
+                self._dead_letter(item, str(e))
+                return
+            delay = getattr(e, 'retry_after', None) or retry_delay(item['attempts'])
+            self.db.mark_outbox_failed(item['id'], str(e), time.time() + delay)
+            self._count('retried')
+            print(f"⚠️ Outbox #{item['id']} attempt {item['attempts']} failed, retrying in {delay:.0f}s: {e}")
+            return
+
+        self.db.mark_outbox_sent(item['id'])
+        self._count('sent')
+
+    def _dead_letter(self, item: Dict, error: str):
+        self.db.mark_outbox_failed(item['id'], error)
+        self._count('dead')
+        print(f"❌ Outbox #{item['id']} dead-lettered after {item['attempts']} attempts: {error}")
+
+    def _count(self, name: str):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def stats(self) -> Dict:
+        with self._counter_lock:
+            counters = dict(self.counters)
+        return {'workers': len(self._threads), 'dispatched': counters, 'queue': self.db.get_outbox_stats()}
+
+
+def create_dispatcher(db: Database = None) -> OutboxDispatcher:
+    """Dispatcher wired with the built-in channels"""
+    dispatcher = OutboxDispatcher(db)
+    dispatcher.register('telegram', make_telegram_handler(dispatcher.db, get_telegram_client()))
+    return dispatcher
@@ -0,0 +1,218 @@
+"""
+Presence tracking for the Eagle Task Management System
+
+Each connected socket holds a presence entry that expires unless the client
+heartbeats. A user is online while any of their entries is live. A disconnect
+does not drop the entry at once; it leaves it to expire after a short grace
+period, so a quick reconnect (page reload, flaky network, another worker)
+joins the same presence and nobody sees a left/joined pair.
+
+EAGLE_PRESENCE picks where entries live:
+
+    (unset) / memory://          this process only
+    sqlite:////tmp/presence.db   a local file shared by every worker on the host
+                                 (sqlite:///presence.db for a relative path)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+EAGLE_PRESENCE = os.getenv('EAGLE_PRESENCE', '')
+PRESENCE_TTL = float(os.getenv('EAGLE_PRESENCE_TTL', '60'))  # seconds an entry lives without a heartbeat
+PRESENCE_HEARTBEAT_INTERVAL = 25  # seconds between client heartbeats, well inside the TTL
+PRESENCE_LEAVE_GRACE = float(os.getenv('EAGLE_PRESENCE_LEAVE_GRACE', '10'))  # seconds a closed socket still counts
+PRESENCE_SWEEP_INTERVAL = 5.0  # seconds between expiry sweeps
+
+
+class MemoryPresenceStore:
+    """Presence entries in this process, indexed by company so listings touch only online users"""
+
+    shared = False
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict] = {}
+        # company_id -> user_id -> set of sids
+        self._companies: Dict[int, Dict[int, set]] = {}
+        self._lock = threading.Lock()
+
+    def touch(self, sid: str, user_id: int, company_id: int, username: str, ttl: float = PRESENCE_TTL) -> bool:
+        """Create or refresh a socket's entry; True if this brought the user online"""
+        with self._lock:
+            users = self._companies.setdefault(company_id, {})
+            sids = users.get(user_id)
+            came_online = not sids
+            if came_online:
+                sids = users[user_id] = set()
+            sids.add(sid)
+            self._sessions[sid] = {'user_id': user_id, 'company_id': company_id, 'username': username,
+                                   'expires_at': time.time() + ttl}
+            return came_online
+
+    def release(self, sid: str, grace: float = PRESENCE_LEAVE_GRACE):
+        """A socket closed: let its entry lapse after the grace period"""
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry:
+                entry['expires_at'] = min(entry['expires_at'], time.time() + grace)
+
+    def expire(self, now: float = None) -> List[Dict]:
+        """Drop lapsed entries and return the users left with none"""
+        now = time.time() if now is None else now
+        gone = []
+        with self._lock:
+            for sid in [sid for sid, entry in self._sessions.items() if entry['expires_at'] <= now]:
+                entry = self._sessions.pop(sid)
+                users = self._companies.get(entry['company_id'], {})
+                sids = users.get(entry['user_id'])
+                if sids is None:
+                    continue
+                sids.discard(sid)
+                if not sids:
+                    del users[entry['user_id']]
+                    gone.append({key: entry[key] for key in ('user_id', 'company_id', 'username')})
+        return gone
+
+    def online_users(self, company_id: int) -> List[Dict]:
+        with self._lock:
+            users = self._companies.get(company_id, {})
+            return [{'user_id': user_id, 'username': self._sessions[next(iter(sids))]['username'],
+                     'connections': len(sids)}
+                    for user_id, sids in users.items()]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'backend': 'memory', 'connections': len(self._sessions),
+                    'users': sum(len(users) for users in self._companies.values())}
+
+
+class SQLitePresenceStore:
+    """Presence entries in a small SQLite file, so workers on one host share them.
+
+    Kept apart from the main database: heartbeats are frequent, disposable
+    writes that should not queue behind task updates.
+    """
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS presence (
+                sid TEXT PRIMARY KEY,
+                company_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                username TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_presence_user ON presence(company_id, user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_presence_expiry ON presence(expires_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")  # losing presence in a crash is harmless
+            self._local.conn = conn
+        return conn
+
+    def touch(self, sid: str, user_id: int, company_id: int, username: str, ttl: float = PRESENCE_TTL) -> bool:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            was_online = conn.execute("SELECT 1 FROM presence WHERE company_id = ? AND user_id = ? LIMIT 1",
+                                      (company_id, user_id)).fetchone() is not None
+            conn.execute('''
+                INSERT INTO presence (sid, company_id, user_id, username, expires_at) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (sid) DO UPDATE SET expires_at = excluded.expires_at
+            ''', (sid, company_id, user_id, username, time.time() + ttl))
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return not was_online
+
+    def release(self, sid: str, grace: float = PRESENCE_LEAVE_GRACE):
+        self._connection().execute("UPDATE presence SET expires_at = MIN(expires_at, ?) WHERE sid = ?",
+                                   (time.time() + grace, sid))
+
+    def expire(self, now: float = None) -> List[Dict]:
+        # Delete and check in one write transaction, so of several sweeping
+        # workers exactly one reports each user as gone
+        now = time.time() if now is None else now
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            lapsed = conn.execute("SELECT DISTINCT company_id, user_id, username FROM presence WHERE expires_at <= ?",
+                                  (now,)).fetchall()
+            conn.execute("DELETE FROM presence WHERE expires_at <= ?", (now,))
+            gone = [{'user_id': user_id, 'company_id': company_id, 'username': username}
+                    for company_id, user_id, username in lapsed
+                    if conn.execute("SELECT 1 FROM presence WHERE company_id = ? AND user_id = ? LIMIT 1",
+                                    (company_id, user_id)).fetchone() is None]
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        return gone
+
+    def online_users(self, company_id: int) -> List[Dict]:
+        rows = self._connection().execute('''
+            SELECT user_id, MIN(username), COUNT(*) FROM presence
+            WHERE company_id = ? GROUP BY user_id
+        ''', (company_id,)).fetchall()
+        return [{'user_id': user_id, 'username': username, 'connections': connections}
+                for user_id, username, connections in rows]
+
+    def stats(self) -> Dict:
+        connections, users = self._connection().execute(
+            "SELECT COUNT(*), COUNT(DISTINCT company_id || ':' || user_id) FROM presence").fetchone()
+        return {'backend': 'sqlite', 'connections': connections, 'users': users}
+
+
+def is_shared(url: str = EAGLE_PRESENCE) -> bool:
+    """Whether every worker process sees the same entries"""
+    return url.startswith('sqlite:///')
+
+
+def create_presence_store(url: str = EAGLE_PRESENCE):
+    """Presence store for the configured URL"""
+    if not url or url.startswith('memory://'):
+        return MemoryPresenceStore()
+    if url.startswith('sqlite:///'):
+        return SQLitePresenceStore(url[len('sqlite:///'):] or 'presence.db')
+    raise ValueError(f"Unsupported presence backend: {url}")
+
+
+class PresenceSweeper:
+    """Background loop that expires entries and reports users who went offline"""
+
+    def __init__(self, store, on_offline, interval: float = PRESENCE_SWEEP_INTERVAL):
+        self.store = store
+        self.on_offline = on_offline
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="presence-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                for user in self.store.expire():
+                    self.on_offline(user)
+            except Exception as e:
+                print(f"❌ Presence sweep error: {e}")
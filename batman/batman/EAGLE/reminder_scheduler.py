@@ -0,0 +1,82 @@
+"""
+Reminder alerts for the Eagle Task Management System
+
+Each reminder stores the day it starts alerting (reminders.alert_date, kept
+by a trigger). The scheduler sleeps until the earliest alert date still
+pending, then claims every due reminder in one transaction: the claim marks
+them alerted and queues their Telegram notifications in the outbox, so a
+reminder alerts exactly once even with several workers running schedulers.
+Claimed reminders are handed to on_alert, which pushes them to dashboards.
+
+Creating or changing a reminder calls wake() so a reminder due today is not
+left until the next alert date. Sleeps are capped at REMINDER_MAX_SLEEP to
+pick up reminders created by another worker and clock changes.
+"""
+
+import threading
+from datetime import date, datetime, time
+from typing import Callable, Dict, Optional
+
+from database import Database
+
+REMINDER_MAX_SLEEP = 3600.0  # seconds
+REMINDER_RETRY_DELAY = 60.0  # seconds after an error
+
+
+class ReminderScheduler:
+    """Thread that wakes when the next reminder alert is due"""
+
+    def __init__(self, on_alert: Callable[[Dict], None], db: Database = None,
+                 max_sleep: float = REMINDER_MAX_SLEEP):
+        self.db = db or Database()
+        self.on_alert = on_alert
+        self.max_sleep = max_sleep
+        self.alerted = 0
+        self.next_alert: Optional[str] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread:
+            return
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        """Reminders changed; look again now instead of at the next alert date"""
+        self._wake.set()
+
+    def run_once(self) -> float:
+        """Alert every due reminder; returns seconds until the next one is due"""
+        today = date.today()
+        for reminder in self.db.claim_due_reminders(today.isoformat()):
+            self.alerted += 1
+            try:
+                self.on_alert(reminder)
+            except Exception as e:
+                print(f"❌ Reminder alert error: {e}")
+
+        self.next_alert = self.db.get_next_reminder_alert()
+        if self.next_alert is None:
+            return self.max_sleep
+        due_at = datetime.combine(date.fromisoformat(self.next_alert), time.min)
+        # An alert date already reached here was claimed by another worker in the meantime
+        return min(max((due_at - datetime.now()).total_seconds(), 1.0), self.max_sleep)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                delay = self.run_once()
+            except Exception as e:
+                print(f"❌ Reminder scheduler error: {e}")
+                delay = REMINDER_RETRY_DELAY
+            self._wake.wait(delay)
+
+    def stats(self) -> Dict:
+        return {'alerted': self.alerted, 'next_alert': self.next_alert}
@@ -0,0 +1,73 @@
+"""
+Wire encodings for the Eagle Task Management System
+
+JSON stays the default everywhere. With the optional msgpack package
+installed:
+
+- /api/* responses are sent as MessagePack to clients that prefer it
+  (Accept: application/msgpack); every response there carries Vary: Accept.
+- EAGLE_SOCKETIO_SERIALIZER=msgpack switches the Socket.IO wire format for
+  all clients; pages then load the client build with the msgpack parser.
+"""
+
+import os
+from typing import Dict
+
+from flask import has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPES = ('application/msgpack', 'application/x-msgpack')
+API_PREFIX = '/api/'
+
+SOCKETIO_SERIALIZER = os.getenv('EAGLE_SOCKETIO_SERIALIZER', 'default')
+SOCKETIO_CLIENT_JS = {
+    'default': 'https://cdn.socket.io/4.0.0/socket.io.min.js',
+    'msgpack': 'https://cdn.socket.io/4.0.0/socket.io.msgpack.min.js',
+}
+
+
+def prefers_msgpack(accept) -> bool:
+    """Whether a werkzeug Accept header ranks MessagePack above JSON (ties go to JSON)"""
+    return msgpack is not None and accept.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES) in MSGPACK_MIMETYPES
+
+
+class NegotiatingJSONProvider(DefaultJSONProvider):
+    """jsonify() that answers /api/* requests in MessagePack when the client asks for it"""
+
+    def packb(self, obj) -> bytes:
+        # Same conversions as JSON for dates, UUIDs, dataclasses and Decimals
+        return msgpack.packb(obj, default=self.default, use_bin_type=True)
+
+    def response(self, *args, **kwargs):
+        if not (has_request_context() and request.path.startswith(API_PREFIX)):
+            return super().response(*args, **kwargs)
+        if prefers_msgpack(request.accept_mimetypes):
+            obj = self._prepare_response_obj(args, kwargs)
+            response = self._app.response_class(self.packb(obj), mimetype=MSGPACK_MIMETYPES[0])
+        else:
+            response = super().response(*args, **kwargs)
+        response.vary.add('Accept')
+        return response
+
+
+def socketio_serializer_options(serializer: str = SOCKETIO_SERIALIZER) -> Dict:
+    """Keyword arguments for SocketIO() selecting the packet encoding"""
+    if serializer == 'msgpack':
+        if msgpack is None:
+            print("⚠️ EAGLE_SOCKETIO_SERIALIZER=msgpack but msgpack is not installed; using JSON")
+            return {}
+        return {'serializer': 'msgpack'}
+    if serializer != 'default':
+        raise ValueError(f"Unknown Socket.IO serializer: {serializer}")
+    return {}
+
+
+def socketio_client_script(options: Dict) -> str:
+    """Socket.IO client build matching the options returned by socketio_serializer_options()"""
+    return SOCKETIO_CLIENT_JS[options.get('serializer', 'default')]
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Production server for the Eagle Task Management System
+
+Runs the Flask app and Socket.IO under an async-capable server in N worker
+processes. Worker i listens on base_port + i; put a proxy with sticky
+sessions in front (e.g. nginx ip_hash) since a Socket.IO session must stay on
+the worker that opened it. Rooms are shared across workers through the queue
+in EAGLE_MESSAGE_QUEUE (see message_queue.py).
+
+    python server.py --workers 4 --port 5000
+    EAGLE_MESSAGE_QUEUE=redis://localhost:6379/0 python main.py --production
+
+Async mode (--async-mode / EAGLE_ASYNC_MODE): eventlet (a declared dependency)
+or gevent. The default picks the first one that is installed. threading is
+refused: its only WebSocket server is Werkzeug's development server, which is
+what python main.py runs for development.
+"""
+
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Optional
+
+ASYNC_MODES = ('eventlet', 'gevent')
+WORKER_RESTART_DELAY = 2.0  # seconds before a crashed worker is restarted
+
+
+def detect_async_mode() -> Optional[str]:
+    for mode in ASYNC_MODES:
+        try:
+            __import__(mode)
+            return mode
+        except ImportError:
+            continue
+    return None
+
+
+def run_worker(host: str, port: int, async_mode: str):
+    """Serve the app in this process; must run before anything imports web_app"""
+    os.environ['EAGLE_ASYNC_MODE'] = async_mode
+    if async_mode == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    elif async_mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+
+    from web_app import app, socketio, start_background_workers
+
+    start_background_workers()
+    print(f"🚀 Worker {os.getpid()} serving on {host}:{port} ({async_mode})")
+    socketio.run(app, host=host, port=port, debug=False, use_reloader=False)
+
+
+def serve(host: str = None, port: int = 5000, workers: int = 1, async_mode: str = None):
+    """Start and supervise the worker processes.
+
+    Workers are fresh interpreters so eventlet/gevent can patch before
+    anything else is imported.
+    """
+    from message_queue import EAGLE_MESSAGE_QUEUE, is_multi_process
+
+    host = host or ('127.0.0.1' if not os.getenv('REPLIT_DB_URL') else '0.0.0.0')
+    async_mode = async_mode or os.getenv('EAGLE_ASYNC_MODE') or detect_async_mode()
+    if async_mode is None:
+        raise ValueError("The production server needs eventlet or gevent; pip install -r requirements.txt")
+    if async_mode not in ASYNC_MODES:
+        raise ValueError(f"Unsupported async mode for the production server: {async_mode} "
+                         f"(use {' or '.join(ASYNC_MODES)}; python main.py runs the development server)")
+    if workers > 1 and not is_multi_process(EAGLE_MESSAGE_QUEUE):
+        raise ValueError("Running more than one worker needs EAGLE_MESSAGE_QUEUE set to a shared queue (e.g. redis://)")
+    from presence import EAGLE_PRESENCE, is_shared
+    if workers > 1 and not is_shared(EAGLE_PRESENCE):
+        print("⚠️ EAGLE_PRESENCE is per-process; set it to sqlite:///<path> so online users are shared between workers")
+
+    # Bring the schema up to date once instead of racing from every worker
+    from database import Database
+    Database()
+
+    def spawn(index):
+        return subprocess.Popen([sys.executable, os.path.abspath(__file__), '--worker',
+                                 '--host', host, '--port', str(port + index), '--async-mode', async_mode])
+
+    processes = {i: spawn(i) for i in range(workers)}
+    print(f"🦅 Eagle running {workers} worker(s) from port {port} ({async_mode})")
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for process in processes.values():
+            process.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    while not stopping:
+        time.sleep(1)
+        for index, process in list(processes.items()):
+            if process.poll() is not None and not stopping:
+                print(f"⚠️ Worker on port {port + index} exited with {process.returncode}, restarting")
+                time.sleep(WORKER_RESTART_DELAY)
+                processes[index] = spawn(index)
+
+    for process in processes.values():
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Eagle production server")
+    parser.add_argument('--host')
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', '5000')))
+    parser.add_argument('--workers', type=int, default=int(os.getenv('EAGLE_WORKERS', '1')))
+    parser.add_argument('--async-mode', choices=ASYNC_MODES)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.host, args.port, args.async_mode)
+        return
+    try:
+        serve(args.host, args.port, args.workers, args.async_mode)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
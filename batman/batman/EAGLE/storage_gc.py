@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Storage reconciler for the Eagle Task Management System
+
+Deleting an attachment only drops its reference; the bytes are collected
+here once nothing has pointed at them for a grace period (a re-upload of the
+same content within it revives the blob). Each pass also removes what
+crashes and older code paths leave behind:
+
+    unreferenced blobs    blobs rows with ref_count 0, released > grace ago
+    orphan blob files     files under the blob root with no blobs row
+    legacy orphans        files directly in uploads/ no attachment points at
+                          (admin_delete_task used to leave these); skipped
+                          unless the stored attachments are found there
+    staging leftovers     .staging files from uploads that died mid-save
+    trash leftovers       blobs detached by a transaction that never finished;
+                          restored if their row survived, purged otherwise
+    upload partials       expired chunked-upload sessions and .part files
+                          without a session
+
+Directories are read with os.scandir and checked against the database
+RECONCILE_BATCH_SIZE entries at a time, so neither side is ever loaded
+whole. Nothing younger than the grace period is touched. Attachments whose
+file is missing are counted, not deleted.
+
+    python storage_gc.py                  # one pass, then exit
+    python storage_gc.py --dry-run        # report what a pass would do
+    python storage_gc.py --grace 600
+"""
+
+import argparse
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+from database import Database
+from uploads import ChunkedUploads
+
+STORAGE_GC_INTERVAL = float(os.getenv('EAGLE_STORAGE_GC_INTERVAL', '3600'))  # seconds between passes, 0 = off
+STORAGE_GC_GRACE = float(os.getenv('EAGLE_STORAGE_GC_GRACE', '3600'))  # seconds before anything is removed
+RECONCILE_BATCH_SIZE = 500
+
+
+def _batches(items: Iterator, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _files(path: str) -> Iterator[os.DirEntry]:
+    """Regular files directly in path, streamed"""
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    yield entry
+    except FileNotFoundError:
+        return
+
+
+def _old_entries(path: str, cutoff: float) -> Iterator[os.DirEntry]:
+    """Files in path last modified before cutoff, with their stat cached"""
+    for entry in _files(path):
+        try:
+            if entry.stat().st_mtime <= cutoff:
+                yield entry
+        except FileNotFoundError:
+            continue
+
+
+class StorageReconciler:
+    """One reconciliation pass over the upload folder and the blob store"""
+
+    def __init__(self, upload_folder: str = 'uploads', db: Database = None,
+                 grace: float = STORAGE_GC_GRACE, batch_size: int = RECONCILE_BATCH_SIZE):
+        self.db = db or Database()
+        self.upload_folder = upload_folder
+        self.grace = grace
+        self.batch_size = batch_size
+        self.uploads = ChunkedUploads(upload_folder, self.db)
+
+    def run(self, dry_run: bool = False) -> Dict:
+        started = time.time()
+        report = {'unreferenced_blobs': 0, 'orphan_blob_files': 0, 'legacy_orphans': 0, 'staging_leftovers': 0,
+                  'trash_restored': 0, 'trash_purged': 0, 'expired_uploads': 0, 'orphan_partials': 0,
+                  'missing_files': 0, 'bytes_reclaimed': 0, 'legacy_skipped': False, 'dry_run': dry_run}
+        self._collect_blobs(report, dry_run)
+        self._orphan_blob_files(report, dry_run)
+        self._trash(report, dry_run)
+        self._old_files(self.db.blob_store.staging_dir, 'staging_leftovers', report, dry_run)
+        self._legacy_orphans(report, dry_run)
+        self._partials(report, dry_run)
+        self._missing_files(report)
+        report['seconds'] = round(time.time() - started, 3)
+        return report
+
+    def _cutoff(self) -> float:
+        return time.time() - self.grace
+
+    def _collect_blobs(self, report: Dict, dry_run: bool):
+        if dry_run:
+            stats = self.db.get_blob_stats()
+            report['unreferenced_blobs'] = stats['unreferenced']
+            return
+        while True:
+            collected, freed = self.db.collect_unreferenced_blobs(self.grace, self.batch_size)
+            report['unreferenced_blobs'] += collected
+            report['bytes_reclaimed'] += freed
+            if collected < self.batch_size:
+                break
+
+    def _orphan_blob_files(self, report: Dict, dry_run: bool):
+        for digests in _batches(self.db.blob_store.iter_digests(), self.batch_size):
+            if dry_run:
+                known = self.db.get_known_blobs(digests)
+                report['orphan_blob_files'] += sum(1 for digest in digests if digest not in known)
+                continue
+            removed, freed = self.db.remove_orphan_blob_files(digests, self.grace)
+            report['orphan_blob_files'] += removed
+            report['bytes_reclaimed'] += freed
+
+    def _trash(self, report: Dict, dry_run: bool):
+        # Trash entries are named <sha256>.<uuid>
+        entries = ((entry.name.split('.', 1)[0], entry.path) for entry in _files(self.db.blob_store.trash_dir))
+        for batch in _batches(entries, self.batch_size):
+            if dry_run:
+                report['trash_purged'] += len(batch)
+                continue
+            restored, purged, freed = self.db.recover_blob_trash(batch)
+            report['trash_restored'] += restored
+            report['trash_purged'] += purged
+            report['bytes_reclaimed'] += freed
+
+    def _old_files(self, path: str, key: str, report: Dict, dry_run: bool, keep=None):
+        """Remove files in path older than the grace period (and not kept by keep(entry))"""
+        for entry in _old_entries(path, self._cutoff()):
+            if keep and keep(entry):
+                continue
+            if not dry_run:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+            report[key] += 1
+            report['bytes_reclaimed'] += entry.stat().st_size
+
+    def _legacy_folder_verified(self) -> bool:
+        """Whether upload_folder is the folder the pre-blob-store attachments were saved in.
+
+        Checked before removing anything from it, since --uploads or the
+        working directory can point somewhere else entirely: some recent
+        legacy attachment has to be there, by resolved path or by name. With
+        no legacy attachments the blob store has to live inside it.
+        """
+        folder = os.path.realpath(self.upload_folder)
+        legacy = self.db.get_legacy_attachment_files(self.batch_size)
+        if not legacy:
+            return os.path.realpath(self.db.blob_store.root).startswith(folder + os.sep)
+        return any(os.path.dirname(os.path.realpath(file_path)) == folder
+                   or os.path.isfile(os.path.join(folder, filename)) for filename, file_path in legacy)
+
+    def _legacy_orphans(self, report: Dict, dry_run: bool):
+        if not self._legacy_folder_verified():
+            report['legacy_skipped'] = True
+            print(f"⚠️ {os.path.abspath(self.upload_folder)} does not hold the stored attachments; "
+                  f"not removing legacy orphans from it")
+            return
+        # Legacy files are uploads/<filename>; the name is compared, as the stored
+        # path is relative to the directory the app ran in
+        candidates = (entry for entry in _old_entries(self.upload_folder, self._cutoff())
+                      if not entry.name.startswith('.'))
+        for batch in _batches(candidates, self.batch_size):
+            referenced = self.db.get_referenced_legacy_filenames([entry.name for entry in batch])
+            for entry in batch:
+                if entry.name in referenced:
+                    continue
+                size = entry.stat().st_size
+                if not dry_run:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                report['legacy_orphans'] += 1
+                report['bytes_reclaimed'] += size
+
+    def _partials(self, report: Dict, dry_run: bool):
+        if not dry_run:
+            report['expired_uploads'] = self.uploads.purge_stale()
+
+        def has_session(entry: os.DirEntry) -> bool:
+            return self.db.get_upload_session(entry.name[:-len('.part')]) is not None
+
+        # Partial files live at most UPLOAD_SESSION_TTL with a session; without one they are done
+        self._old_files(self.uploads.partial_dir, 'orphan_partials', report, dry_run, keep=has_session)
+
+    def _missing_files(self, report: Dict):
+        after_id = 0
+        while True:
+            page = self.db.get_attachment_files_page(after_id, self.batch_size)
+            if not page:
+                break
+            for attachment_id, file_path in page:
+                if not os.path.exists(file_path):
+                    report['missing_files'] += 1
+                    print(f"⚠️ Attachment {attachment_id} has no file at {file_path}")
+            after_id = page[-1][0]
+
+
+class StorageReconcilerThread:
+    """Runs a reconciliation pass every interval seconds and keeps the last report"""
+
+    def __init__(self, reconciler: StorageReconciler, interval: float = STORAGE_GC_INTERVAL):
+        self.reconciler = reconciler
+        self.interval = interval
+        self.last_report: Optional[Dict] = None
+        self.total_reclaimed = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._run, name="storage-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_report = self.reconciler.run()
+                self.total_reclaimed += self.last_report['bytes_reclaimed']
+                if self.last_report['bytes_reclaimed']:
+                    print(f"🧹 Storage reconciler reclaimed {self.last_report['bytes_reclaimed']} bytes")
+            except Exception as e:
+                print(f"❌ Storage reconciler error: {e}")
+
+    def stats(self) -> Dict:
+        return {'interval': self.interval, 'grace': self.reconciler.grace,
+                'total_reclaimed': self.total_reclaimed, 'last_report': self.last_report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reclaim attachment storage nothing refers to")
+    parser.add_argument('--uploads', default='uploads', help="upload folder (default: uploads)")
+    parser.add_argument('--grace', type=float, default=STORAGE_GC_GRACE,
+                        help="seconds a file must be unused before it is removed")
+    parser.add_argument('--batch-size', type=int, default=RECONCILE_BATCH_SIZE)
+    parser.add_argument('--dry-run', action='store_true', help="report only, remove nothing")
+    args = parser.parse_args()
+
+    reconciler = StorageReconciler(args.uploads, grace=args.grace, batch_size=args.batch_size)
+    report = reconciler.run(dry_run=args.dry_run)
+    print("🧹 Storage reconciliation" + (" (dry run)" if args.dry_run else ""))
+    for key, value in report.items():
+        if key != 'dry_run':
+            print(f"   {key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -41,12 +41,13 @@ class TaskManager:
         return self.db.create_user(username, password, role, company_id)
     
     def assign_task(self, title: str, description: str, assigned_to: int, 
-                   start_date: str = None, deadline: str = None, priority: str = 'Medium') -> bool:
-        """Assign task to user (Admin only)"""
+                   start_date: str = None, deadline: str = None, priority: str = 'Medium',
+                   outbox=None):
+        """Assign task to user (Admin only); returns the new task id or None"""
         if not self.current_user or self.current_user['role'] != 'Admin':
-            return False
+            return None
         return self.db.create_task(title, description, assigned_to, self.current_user['company_id'], 
-                                 start_date, deadline, priority)
+                                 start_date, deadline, priority, outbox)
     
     def view_all_tasks(self):
         """View all tasks in company (Admin only)"""
@@ -54,6 +55,29 @@ class TaskManager:
             return []
         return self.db.get_tasks_by_company(self.current_user['company_id'])
     
+    def view_tasks_page(self, **filters):
+        """One page of tasks: whole company for Admin, own tasks otherwise"""
+        if not self.current_user:
+            return {'tasks': [], 'next_cursor': None}
+        if self.current_user['role'] != 'Admin':
+            filters['assigned_to'] = self.current_user['id']
+        return self.db.get_tasks_page(self.current_user['company_id'], **filters)
+    
+    def get_task_changes(self, since: int = 0, limit: int = 500):
+        """Task delta since a sync cursor: whole company for Admin, own tasks otherwise"""
+        if not self.current_user:
+            return None
+        assigned_to = None if self.current_user['role'] == 'Admin' else self.current_user['id']
+        return self.db.get_task_changes(self.current_user['company_id'], since, assigned_to, limit)
+    
+    def get_task_stats(self):
+        """Task counts for the company (Admin) or for the current user's own tasks"""
+        if not self.current_user:
+            return None
+        if self.current_user['role'] == 'Admin':
+            return self.db.get_task_stats(self.current_user['company_id'])
+        return self.db.get_task_stats(self.current_user['company_id'], self.current_user['id'])
+    
     # Manager/Employee functions
     def view_my_tasks(self):
         """View tasks assigned to current user"""
@@ -0,0 +1,232 @@
+"""
+Telegram Bot API client for the Eagle Task Management System
+
+One shared client keeps a keep-alive connection pool, paces sends with token
+buckets matching Telegram's limits (about 30 messages/s per bot and 1
+message/s per chat) and wraps the API in a circuit breaker so an outage fails
+fast instead of holding a thread for the whole request timeout.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+TELEGRAM_API_BASE = os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org')
+TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', "7653297508:AAE_sfu893LJ-D5Z5xtr_sjy-XEJvvf7haQ")
+TELEGRAM_BOT_USERNAME = os.getenv('TELEGRAM_BOT_USERNAME', "taskmanager_eagle_bot")
+
+TELEGRAM_TIMEOUT = (3.05, 10)  # connect, read (seconds)
+TELEGRAM_GLOBAL_RATE = 30.0  # messages per second per bot
+TELEGRAM_CHAT_RATE = 1.0  # messages per second per chat
+TELEGRAM_MAX_WAIT = 2.0  # seconds a send may wait for a rate-limit token
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_TIMEOUT = 30.0  # seconds before a trial call is let through
+
+
+class TelegramError(Exception):
+    """Base class for Telegram send failures"""
+
+
+class TelegramUnavailable(TelegramError):
+    """Transient failure (network, 5xx, 429, throttled or circuit open); worth retrying"""
+
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TelegramRejected(TelegramError):
+    """Telegram refused the request (bad chat ID, blocked bot, malformed message); do not retry"""
+
+
+def format_notification(username: str, message: str) -> str:
+    """Text of a task notification as sent to a user's chat"""
+    return f"🦅 *Eagle Task Manager*\n\n*Task Notification for:* {username}\n\n*Message:* {message}"
+
+
+class TokenBucket:
+    """Classic token bucket; callers hold the client's limiter lock"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets one trial call through per reset timeout"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0)
+
+    def cancel(self):
+        """The allowed call never reached Telegram; hand the trial slot back"""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"🔌 Telegram circuit opened after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class TelegramClient:
+    """Rate-limited, circuit-broken sendMessage client"""
+
+    def __init__(self, bot_token: str = TELEGRAM_BOT_TOKEN, api_base: str = TELEGRAM_API_BASE,
+                 global_rate: float = TELEGRAM_GLOBAL_RATE, chat_rate: float = TELEGRAM_CHAT_RATE,
+                 max_wait: float = TELEGRAM_MAX_WAIT, breaker: CircuitBreaker = None, pool_size: int = 10):
+        self.url = f"{api_base}/bot{bot_token}/sendMessage"
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.chat_rate = chat_rate
+        self.max_wait = max_wait
+        self.breaker = breaker or CircuitBreaker()
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets: Dict[str, TokenBucket] = {}
+        self._limiter_lock = threading.Lock()
+
+        self._counter_lock = threading.Lock()
+        self.counters = {'sent': 0, 'failed': 0, 'rejected': 0, 'throttled': 0, 'short_circuited': 0}
+
+    def _count(self, name: str):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def _reserve(self, chat_id: str):
+        """Block until both the global and the chat bucket have a token, or give up after max_wait"""
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self._limiter_lock:
+                now = time.monotonic()
+                chat_bucket = self._chat_buckets.get(chat_id)
+                if chat_bucket is None:
+                    if len(self._chat_buckets) > 10000:
+                        self._prune_chat_buckets(now)
+                    chat_bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+                wait = max(self._global_bucket.wait_time(now), chat_bucket.wait_time(now))
+                if wait == 0:
+                    self._global_bucket.take()
+                    chat_bucket.take()
+                    return
+            if now + wait > deadline:
+                self._count('throttled')
+                raise TelegramUnavailable(f"Rate limited for chat {chat_id}", retry_after=wait)
+            time.sleep(wait)
+
+    def _prune_chat_buckets(self, now: float):
+        # A bucket that has been idle long enough to refill is indistinguishable from a new one
+        idle = [chat for chat, bucket in self._chat_buckets.items() if now - bucket.updated > 1 / self.chat_rate]
+        for chat in idle:
+            del self._chat_buckets[chat]
+
+    def send_message(self, chat_id, text: str, parse_mode: Optional[str] = 'Markdown') -> Dict:
+        """Send a message; raises TelegramUnavailable or TelegramRejected on failure"""
+        if not self.breaker.allow():
+            self._count('short_circuited')
+            raise TelegramUnavailable("Telegram circuit open", retry_after=self.breaker.retry_after())
+        chat_id = str(chat_id)
+        try:
+            self._reserve(chat_id)
+        except TelegramUnavailable:
+            self.breaker.cancel()
+            raise
+
+        data = {'chat_id': chat_id, 'text': text}
+        if parse_mode:
+            data['parse_mode'] = parse_mode
+        try:
+            response = self.session.post(self.url, data=data, timeout=TELEGRAM_TIMEOUT)
+        except requests.RequestException as e:
+            self.breaker.record_failure()
+            self._count('failed')
+            raise TelegramUnavailable(f"Telegram request failed: {e}")
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = {'description': response.text[:200]}
+
+        if response.status_code == 200:
+            self.breaker.record_success()
+            self._count('sent')
+            return body
+        if response.status_code == 429 or response.status_code >= 500:
+            # A 429 means we are talking too fast, not that Telegram is down
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            self._count('failed')
+            retry_after = (body.get('parameters') or {}).get('retry_after')
+            raise TelegramUnavailable(f"Telegram returned {response.status_code}", retry_after=retry_after)
+
+        self.breaker.record_success()
+        self._count('rejected')
+        raise TelegramRejected(f"Telegram returned {response.status_code}: {body.get('description')}")
+
+    def stats(self) -> Dict:
+        with self._counter_lock:
+            counters = dict(self.counters)
+        counters['circuit'] = self.breaker.state
+        return counters
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_telegram_client() -> TelegramClient:
+    """Process-wide client, so every sender shares the pool, limiter and breaker"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TelegramClient()
+    return _client
@@ -0,0 +1,82 @@
+"""Rooms shared between Socket.IO servers through the local:// message queue"""
+
+import threading
+import unittest
+import uuid
+
+import socketio
+from flask import Flask
+from flask_socketio import SocketIO, join_room
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from message_queue import LocalPubSubManager, socketio_queue_options
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class LocalMessageQueueTest(unittest.TestCase):
+    """Two servers in one process stand in for two workers sharing Redis"""
+
+    def setUp(self):
+        # A channel of its own, so servers left over from other tests do not hear these emits
+        self.channel = f"test-{uuid.uuid4().hex}"
+        self.servers = []
+        self.first = self.start_server()
+        self.second = self.start_server()
+        self.client = socketio.Client()
+        self.received = []
+        self.got_event = threading.Event()
+
+        @self.client.on('task_updated')
+        def on_task_updated(data):
+            self.received.append(data)
+            self.got_event.set()
+
+    def tearDown(self):
+        self.client.disconnect()
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def start_server(self) -> SocketIO:
+        app = Flask(__name__)
+        sio = SocketIO(app, async_mode='threading', **socketio_queue_options('local://', self.channel))
+
+        @sio.on('join')
+        def on_join(room):
+            join_room(room)
+            return True
+
+        server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.servers.append(server)
+        sio.port = server.server_port
+        return sio
+
+    def connect_to(self, sio: SocketIO, room: str):
+        self.client.connect(f"http://127.0.0.1:{sio.port}", transports=['polling'])
+        self.assertTrue(self.client.call('join', room, timeout=5))
+
+    def test_queue_options_use_local_manager(self):
+        self.assertIsInstance(self.first.server.manager, LocalPubSubManager)
+        self.assertEqual(self.first.server.manager.channel, self.channel)
+
+    def test_emit_reaches_room_on_other_server(self):
+        self.connect_to(self.second, 'company_1')
+        self.first.emit('task_updated', {'id': 7}, to='company_1')
+        self.assertTrue(self.got_event.wait(5))
+        self.assertEqual(self.received, [{'id': 7}])
+
+    def test_emit_skips_clients_outside_the_room(self):
+        self.connect_to(self.second, 'company_1')
+        self.first.emit('task_updated', {'id': 8}, to='company_2')
+        self.first.emit('task_updated', {'id': 9}, to='company_1')
+        self.assertTrue(self.got_event.wait(5))
+        self.assertEqual(self.received, [{'id': 9}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""Outbox delivery against a local fake of the Telegram Bot API"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from database import Database
+from outbox import OutboxDispatcher, make_telegram_handler
+from telegram_client import CircuitBreaker, TelegramClient
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    """sendMessage endpoint answering with whatever the test queued for the chat (200 by default)"""
+
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+        chat_id = form['chat_id'][0]
+        self.server.received.append((self.path, chat_id, form['text'][0]))
+        replies = self.server.replies.get(chat_id)
+        status, body = replies.pop(0) if replies else (200, {'ok': True, 'result': {}})
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class OutboxTelegramTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTelegram)
+        self.server.received, self.server.replies = [], {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.tmp = tempfile.TemporaryDirectory()
+        Database._instance = None
+        self.db = Database(os.path.join(self.tmp.name, 'test.db'))
+        self.db.create_company("Acme")
+        company_id = self.db.get_companies()[0]['id']
+        for username in ('alice', 'bob'):
+            self.db.create_user(username, 'pw', 'Employee', company_id)
+        self.users = {user['username']: user['id'] for user in self.db.get_users_by_company(company_id)}
+        self.db.update_user_telegram_chat_id(self.users['alice'], '100')
+
+        client = TelegramClient('TOKEN', f"http://127.0.0.1:{self.server.server_port}", chat_rate=1000,
+                                breaker=CircuitBreaker(failure_threshold=100))
+        self.dispatcher = OutboxDispatcher(self.db, workers=0, max_attempts=3)
+        self.dispatcher.register('telegram', make_telegram_handler(self.db, client))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        Database._instance = None
+        self.tmp.cleanup()
+
+    def outbox_row(self, outbox_id):
+        conn = self.db.get_connection()
+        try:
+            return conn.execute("SELECT status, attempts, next_attempt_at, last_error FROM outbox WHERE id = ?",
+                                (outbox_id,)).fetchone()
+        finally:
+            conn.close()
+
+    def queue(self, username):
+        self.db.enqueue_notification('telegram', self.users[username], {'message': 'Task due'})
+        conn = self.db.get_connection()
+        try:
+            return conn.execute("SELECT MAX(id) FROM outbox").fetchone()[0]
+        finally:
+            conn.close()
+
+    def make_due(self, outbox_id):
+        conn = self.db.get_write_connection()
+        try:
+            conn.execute("UPDATE outbox SET next_attempt_at = 0 WHERE id = ?", (outbox_id,))
+        finally:
+            conn.close()
+
+    def test_delivers_and_marks_sent(self):
+        outbox_id = self.queue('alice')
+        self.assertEqual(self.dispatcher.dispatch_once(), 1)
+        self.assertEqual(self.outbox_row(outbox_id)[0], 'sent')
+        path, chat_id, text = self.server.received[0]
+        self.assertEqual((path, chat_id), ('/botTOKEN/sendMessage', '100'))
+        self.assertIn('Task due', text)
+
+    def test_server_error_backs_off_then_succeeds(self):
+        self.server.replies['100'] = [(500, {'ok': False, 'description': 'Internal'})]
+        outbox_id = self.queue('alice')
+        before = time.time()
+        self.dispatcher.dispatch_once()
+        status, attempts, next_attempt_at, error = self.outbox_row(outbox_id)
+        self.assertEqual((status, attempts), ('pending', 1))
+        self.assertGreater(next_attempt_at, before + 3)  # OUTBOX_RETRY_BASE with jitter
+        self.assertIn('500', error)
+        self.assertEqual(self.dispatcher.dispatch_once(), 0)  # not due yet
+
+        self.make_due(outbox_id)
+        self.dispatcher.dispatch_once()
+        self.assertEqual(self.outbox_row(outbox_id)[:2], ('sent', 2))
+
+    def test_rate_limit_honours_retry_after(self):
+        self.server.replies['100'] = [(429, {'ok': False, 'parameters': {'retry_after': 120}})]
+        outbox_id = self.queue('alice')
+        before = time.time()
+        self.dispatcher.dispatch_once()
+        status, _, next_attempt_at, _ = self.outbox_row(outbox_id)
+        self.assertEqual(status, 'pending')
+        self.assertAlmostEqual(next_attempt_at - before, 120, delta=5)
+
+    def test_rejected_request_is_dead_lettered(self):
+        self.server.replies['100'] = [(400, {'ok': False, 'description': 'Bad Request: chat not found'})]
+        outbox_id = self.queue('alice')
+        self.dispatcher.dispatch_once()
+        status, attempts, _, error = self.outbox_row(outbox_id)
+        self.assertEqual((status, attempts), ('dead', 1))
+        self.assertIn('chat not found', error)
+
+    def test_dead_lettered_after_max_attempts(self):
+        self.server.replies['100'] = [(502, {'ok': False})] * 3
+        outbox_id = self.queue('alice')
+        for _ in range(3):
+            self.make_due(outbox_id)
+            self.dispatcher.dispatch_once()
+        self.assertEqual(self.outbox_row(outbox_id)[:2], ('dead', 3))
+        self.assertEqual(len(self.server.received), 3)
+
+    def test_user_without_chat_id_is_dead_lettered_without_a_request(self):
+        outbox_id = self.queue('bob')
+        self.dispatcher.dispatch_once()
+        self.assertEqual(self.outbox_row(outbox_id)[0], 'dead')
+        self.assertEqual(self.server.received, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
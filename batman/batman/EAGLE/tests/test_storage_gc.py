@@ -0,0 +1,71 @@
+"""Legacy orphan removal however the upload folder is spelled, and refusal when it is the wrong one"""
+
+import os
+import tempfile
+import unittest
+
+from blob_store import BlobStore
+from database import Database
+from storage_gc import StorageReconciler
+
+
+class LegacyOrphanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app_dir = os.path.join(self.tmp.name, 'app')
+        self.folder = os.path.join(self.app_dir, 'uploads')
+        os.makedirs(self.folder)
+        self.cwd = os.getcwd()
+        os.chdir(self.app_dir)
+
+        Database._instance = None
+        self.db = Database(os.path.join(self.tmp.name, 'test.db'))
+        self.db.blob_store = BlobStore(os.path.join(self.folder, 'blobs'))
+        self.db.create_company("Acme")
+        company_id = self.db.get_companies()[0]['id']
+        self.db.create_user('alice', 'pw', 'Admin', company_id)
+        user_id = self.db.get_users_by_company(company_id)[0]['id']
+        task_id = self.db.create_task("Report", "d", user_id, company_id)
+
+        # As the old upload route stored them: relative to the app's working directory
+        for name in ('live.pdf', 'orphan.pdf'):
+            with open(os.path.join(self.folder, name), 'wb') as f:
+                f.write(b'x')
+        self.db.save_file_attachment(task_id, 'live.pdf', 'report.pdf', os.path.join('uploads', 'live.pdf'), 1,
+                                     'pdf', user_id, 'task_progress')
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        Database._instance = None
+        self.tmp.cleanup()
+
+    def remaining(self):
+        return sorted(name for name in os.listdir(self.folder) if name.endswith('.pdf'))
+
+    def test_folder_spellings_keep_live_files(self):
+        for folder in ('uploads', './uploads', self.folder, os.path.join('..', 'app', 'uploads')):
+            with self.subTest(folder=folder):
+                report = StorageReconciler(folder, self.db, grace=0).run()
+                self.assertFalse(report['legacy_skipped'])
+                self.assertEqual(self.remaining(), ['live.pdf'])
+
+    def test_other_working_directory(self):
+        os.chdir(self.tmp.name)
+        report = StorageReconciler(self.folder, self.db, grace=0).run()
+        self.assertEqual(report['legacy_orphans'], 1)
+        self.assertEqual(self.remaining(), ['live.pdf'])
+
+    def test_refuses_a_folder_without_the_stored_attachments(self):
+        other = os.path.join(self.tmp.name, 'elsewhere')
+        os.makedirs(other)
+        with open(os.path.join(other, 'notes.txt'), 'wb') as f:
+            f.write(b'x')
+        report = StorageReconciler(other, self.db, grace=0).run()
+        self.assertTrue(report['legacy_skipped'])
+        self.assertEqual(report['legacy_orphans'], 0)
+        self.assertTrue(os.path.exists(os.path.join(other, 'notes.txt')))
+
+
+if __name__ == '__main__':
+    unittest.main()
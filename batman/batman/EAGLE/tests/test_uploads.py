@@ -0,0 +1,58 @@
+"""Chunked uploads and the skip-the-upload path for content the company already has"""
+
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+
+from blob_store import BlobStore
+from database import Database
+from uploads import ChunkedUploads
+
+CONTENT = b'quarterly report'
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+class DeduplicatedUploadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        Database._instance = None
+        self.db = Database(os.path.join(self.tmp.name, 'test.db'))
+        self.db.blob_store = BlobStore(os.path.join(self.tmp.name, 'blobs'))
+        self.db.create_company("Acme")
+        self.company_id = self.db.get_companies()[0]['id']
+        self.db.create_user('alice', 'pw', 'Admin', self.company_id)
+        self.user_id = self.db.get_users_by_company(self.company_id)[0]['id']
+        self.task_id = self.db.create_task("Report", "d", self.user_id, self.company_id)
+        self.uploads = ChunkedUploads(os.path.join(self.tmp.name, 'uploads'), self.db)
+
+        upload = self.uploads.create(self.task_id, self.user_id, self.company_id, 'report.pdf', len(CONTENT))
+        self.uploads.write_chunk(upload['upload_id'], self.user_id, 0, io.BytesIO(CONTENT), len(CONTENT))
+        self.uploads.complete(upload['upload_id'], self.user_id)
+
+    def tearDown(self):
+        Database._instance = None
+        self.tmp.cleanup()
+
+    def attachment_sizes(self):
+        return {attachment['original_filename']: attachment['file_size']
+                for attachment in self.db.get_task_attachments(self.task_id)}
+
+    def test_known_content_is_attached_without_chunks(self):
+        result = self.uploads.create(self.task_id, self.user_id, self.company_id, 'copy.pdf', len(CONTENT),
+                                     sha256=DIGEST)
+        self.assertTrue(result['deduplicated'])
+        self.assertEqual(self.attachment_sizes()['copy.pdf'], len(CONTENT))
+
+    def test_declared_size_must_match_the_stored_blob(self):
+        result = self.uploads.create(self.task_id, self.user_id, self.company_id, 'copy.pdf', 10 ** 6,
+                                     sha256=DIGEST)
+        self.assertNotIn('complete', result)
+        self.assertEqual(result['total_size'], 10 ** 6)
+        self.assertNotIn('copy.pdf', self.attachment_sizes())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+"""
+Resumable chunked uploads for the Eagle Task Management System
+
+    POST   /api/uploads                  {task_id, filename, size, upload_type?, sha256?}
+    PUT    /api/uploads/<id>?offset=N    raw chunk body (or Content-Range: bytes N-M/total)
+    GET    /api/uploads/<id>             {received, total_size, status}
+    POST   /api/uploads/<id>/complete    attach the finished file to its task
+    DELETE /api/uploads/<id>             abandon it
+
+Chunk bodies are read from the request stream in UPLOAD_IO_BLOCK pieces and
+written straight to uploads/.partial/<id>.part, so memory stays flat
+whatever the file size and Werkzeug's form parser is never involved. The
+SHA-256 state is carried from chunk to chunk; after a restart (or on
+another worker) it is rebuilt from the partial file. A client whose
+connection drops asks for the received offset and continues from there.
+
+Finished uploads land in the content-addressed blob store. A client that
+sends sha256 and size up front for content its company already holds gets
+the attachment straight away ({"complete": true}) and sends no chunks; if
+the size is not the stored one it uploads the file like anyone else.
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from typing import Dict, Optional, Tuple
+
+from database import Database
+
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # suggested to clients
+UPLOAD_MAX_CHUNK = 8 * 1024 * 1024  # stays under MAX_CONTENT_LENGTH
+UPLOAD_MAX_FILE_SIZE = int(os.getenv('EAGLE_UPLOAD_MAX_FILE_SIZE', str(1024 * 1024 * 1024)))
+UPLOAD_IO_BLOCK = 64 * 1024
+UPLOAD_SESSION_TTL = float(os.getenv('EAGLE_UPLOAD_SESSION_TTL', str(24 * 3600)))  # seconds without a chunk
+
+
+class UploadError(Exception):
+    """A request the upload protocol refuses; status is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status: int = 400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+class ChunkedUploads:
+    """Upload sessions: rows in upload_sessions plus a partial file each"""
+
+    def __init__(self, upload_folder: str, db: Database = None):
+        self._db = db
+        self.upload_folder = upload_folder
+        self.partial_dir = os.path.join(upload_folder, '.partial')
+        os.makedirs(self.partial_dir, exist_ok=True)
+        # upload_id -> (offset, sha256 of the bytes before it)
+        self._hashers: Dict[str, Tuple[int, 'hashlib._Hash']] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    @property
+    def db(self) -> Database:
+        # Resolved per call so importing the web app does not open the database
+        return self._db or Database()
+
+    def partial_path(self, upload_id: str) -> str:
+        return os.path.join(self.partial_dir, f"{upload_id}.part")
+
+    def _lock_for(self, upload_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(upload_id, threading.Lock())
+
+    def _forget(self, upload_id: str):
+        with self._locks_lock:
+            self._locks.pop(upload_id, None)
+            self._hashers.pop(upload_id, None)
+
+    def _session(self, upload_id: str, user_id: int) -> Dict:
+        session = self.db.get_upload_session(upload_id)
+        if not session or session['user_id'] != user_id:
+            raise UploadError("Upload not found", 404)
+        return session
+
+    def _hasher_at(self, session: Dict):
+        """SHA-256 of the first `received` bytes, from memory or re-read from the partial file"""
+        cached = self._hashers.get(session['id'])
+        if cached and cached[0] == session['received']:
+            return cached[1]
+        hasher = hashlib.sha256()
+        remaining = session['received']
+        with open(self.partial_path(session['id']), 'rb') as f:
+            while remaining > 0:
+                block = f.read(min(UPLOAD_IO_BLOCK, remaining))
+                if not block:
+                    raise UploadError("Partial upload is missing data", 409, received=0)
+                hasher.update(block)
+                remaining -= len(block)
+        self._hashers[session['id']] = (session['received'], hasher)
+        return hasher
+
+    def create(self, task_id: int, user_id: int, company_id: int, filename: str, size: int,
+               upload_type: str = 'task_progress', sha256: str = None) -> Dict:
+        """Open an upload session; the caller has checked the file type and task access"""
+        if size <= 0:
+            raise UploadError("File is empty")
+        if size > UPLOAD_MAX_FILE_SIZE:
+            raise UploadError(f"File is larger than {UPLOAD_MAX_FILE_SIZE} bytes", 413)
+        self.purge_stale()
+
+        file_type = filename.rsplit('.', 1)[1].lower()
+        sha256 = sha256.lower() if sha256 else None
+        if sha256 and self.db.company_has_blob(sha256, company_id):
+            # Only content the company already has, so a hash alone never reaches another company's file
+            if self.db.save_blob_attachment(task_id, sha256, size, filename, file_type, user_id, upload_type):
+                return {'complete': True, 'deduplicated': True, 'task_id': task_id, 'filename': filename,
+                        'size': size, 'sha256': sha256}
+
+        upload_id = uuid.uuid4().hex
+        open(self.partial_path(upload_id), 'wb').close()
+        if not self.db.create_upload_session(upload_id, task_id, user_id, company_id, filename, file_type,
+                                             upload_type, size, sha256):
+            os.remove(self.partial_path(upload_id))
+            raise UploadError("Failed to start upload", 500)
+        return {'upload_id': upload_id, 'chunk_size': UPLOAD_CHUNK_SIZE, 'max_chunk_size': UPLOAD_MAX_CHUNK,
+                'received': 0, 'total_size': size}
+
+    def status(self, upload_id: str, user_id: int) -> Dict:
+        session = self._session(upload_id, user_id)
+        return {'upload_id': upload_id, 'received': session['received'], 'total_size': session['total_size'],
+                'status': session['status']}
+
+    def write_chunk(self, upload_id: str, user_id: int, offset: int, stream, length: Optional[int]) -> Dict:
+        """Append length bytes read from stream at offset, which must be the received count"""
+        if length is None:
+            raise UploadError("Content-Length is required", 411)
+        if length > UPLOAD_MAX_CHUNK:
+            raise UploadError(f"Chunks are limited to {UPLOAD_MAX_CHUNK} bytes", 413)
+
+        with self._lock_for(upload_id):
+            session = self._session(upload_id, user_id)
+            if session['status'] != 'uploading':
+                raise UploadError(f"Upload is {session['status']}", 409, received=session['received'])
+            if offset != session['received']:
+                raise UploadError("Chunk does not start at the received offset", 409, received=session['received'])
+            if offset + length > session['total_size']:
+                raise UploadError("Chunk runs past the declared size", 400, received=session['received'])
+
+            # Hash into a copy so a chunk cut short leaves the stored state untouched
+            hasher = self._hasher_at(session).copy()
+            written = 0
+            with open(self.partial_path(upload_id), 'r+b') as f:
+                f.seek(offset)
+                f.truncate()  # drop whatever a failed earlier attempt left past offset
+                while written < length:
+                    block = stream.read(min(UPLOAD_IO_BLOCK, length - written))
+                    if not block:
+                        break
+                    f.write(block)
+                    hasher.update(block)
+                    written += len(block)
+            if written != length:
+                raise UploadError("Chunk was cut short", 400, received=offset)
+            if not self.db.advance_upload_session(upload_id, offset, offset + length):
+                raise UploadError("Chunk was already received", 409,
+                                  received=self.db.get_upload_session(upload_id)['received'])
+            self._hashers[upload_id] = (offset + length, hasher)
+
+        return {'upload_id': upload_id, 'received': offset + length, 'total_size': session['total_size']}
+
+    def complete(self, upload_id: str, user_id: int) -> Dict:
+        """Verify the upload and store it as a file attachment; safe to retry"""
+        with self._lock_for(upload_id):
+            session = self._session(upload_id, user_id)
+            if session['status'] == 'complete':
+                return {'task_id': session['task_id'], 'filename': session['original_filename'],
+                        'size': session['total_size'], 'already_complete': True}
+            if session['status'] != 'uploading':
+                raise UploadError(f"Upload is {session['status']}", 409)
+            if session['received'] != session['total_size']:
+                raise UploadError("Upload is incomplete", 409, received=session['received'])
+
+            digest = self._hasher_at(session).hexdigest()
+            if session['expected_sha256'] and session['expected_sha256'] != digest:
+                self.db.set_upload_session_status(upload_id, 'failed')
+                self._discard_partial(upload_id)
+                raise UploadError("Checksum mismatch", 422, sha256=digest)
+            if not self.db.set_upload_session_status(upload_id, 'finalizing', expected='uploading'):
+                raise UploadError("Upload is being finalized", 409)
+
+            saved = self.db.save_blob_attachment(session['task_id'], digest, session['total_size'],
+                                                 session['original_filename'], session['file_type'], user_id,
+                                                 session['upload_type'], staged_path=self.partial_path(upload_id))
+            if not saved:
+                self.db.set_upload_session_status(upload_id, 'failed')
+                self._discard_partial(upload_id)
+                raise UploadError("Failed to save file info", 500)
+            self.db.set_upload_session_status(upload_id, 'complete')
+
+        self._forget(upload_id)
+        return {'task_id': session['task_id'], 'filename': session['original_filename'],
+                'size': session['total_size'], 'sha256': digest}
+
+    def abort(self, upload_id: str, user_id: int):
+        with self._lock_for(upload_id):
+            session = self._session(upload_id, user_id)
+            if session['status'] == 'finalizing':
+                raise UploadError("Upload is being finalized", 409)
+            self.db.delete_upload_session(upload_id)
+            self._discard_partial(upload_id)
+
+    def _discard_partial(self, upload_id: str):
+        self._forget(upload_id)
+        try:
+            os.remove(self.partial_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def purge_stale(self, max_age: float = UPLOAD_SESSION_TTL) -> int:
+        """Drop sessions (and their partial files) nobody has touched for max_age seconds"""
+        stale = self.db.get_stale_upload_sessions(max_age)
+        for upload_id in stale:
+            self.db.delete_upload_session(upload_id)
+            self._discard_partial(upload_id)
+        return len(stale)
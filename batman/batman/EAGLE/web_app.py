@@ -1,23 +1,38 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, send_from_directory
+from flask import Flask, Response, render_template, request, jsonify, session, redirect, url_for
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 from task_manager import TaskManager
-from database import Database
+from database import SEARCH_KINDS, Database
+from event_log import EventLog
+from message_queue import socketio_queue_options
+from presence import PresenceSweeper, create_presence_store
+from serialization import NegotiatingJSONProvider, socketio_client_script, socketio_serializer_options
+from telegram_client import TELEGRAM_BOT_USERNAME, TelegramError, format_notification, get_telegram_client
+from uploads import ChunkedUploads, UploadError
 import json
 import os
+import threading
 import uuid
 from datetime import datetime
-from werkzeug.utils import secure_filename
+from werkzeug.utils import secure_filename, send_file
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import requests
 
 app = Flask(__name__)
+# jsonify() answers Accept: application/msgpack on /api/* (see serialization.py)
+app.json = NegotiatingJSONProvider(app)
 app.config['SECRET_KEY'] = 'your-secret-key-change-this'
 CORS(app, supports_credentials=True)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# Downloads: how long browsers may reuse one, and whether a fronting proxy sends the bytes.
+# EAGLE_DOWNLOAD_OFFLOAD=x-accel answers with X-Accel-Redirect: <prefix><path under uploads/>
+# (nginx: an internal location aliased to the upload folder); x-sendfile answers with
+# X-Sendfile: <absolute path> (Apache mod_xsendfile, lighttpd).
+app.config['DOWNLOAD_MAX_AGE'] = int(os.getenv('EAGLE_DOWNLOAD_MAX_AGE', '3600'))
+app.config['DOWNLOAD_OFFLOAD'] = os.getenv('EAGLE_DOWNLOAD_OFFLOAD', '').lower()
+app.config['X_ACCEL_PREFIX'] = os.getenv('EAGLE_X_ACCEL_PREFIX', '/protected-uploads/')
 
 # Create uploads directory if it doesn't exist
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -28,88 +43,252 @@ ALLOWED_EXTENSIONS = {'pdf', 'xlsx', 'xls', 'doc', 'docx', 'txt', 'csv'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-socketio = SocketIO(app, cors_allowed_origins="*")
-
-# Store active users and their rooms
-active_users = {}
+# EAGLE_ASYNC_MODE is set by server.py after it has monkey-patched for eventlet/gevent;
+# the message queue shares rooms between worker processes
+socketio_serializer = socketio_serializer_options()
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=os.getenv('EAGLE_ASYNC_MODE') or None,
+                    **socketio_queue_options(), **socketio_serializer)
+
+@app.context_processor
+def inject_socketio_client():
+    # Pages must load the client build that speaks the server's packet encoding
+    return {'socketio_client_js': socketio_client_script(socketio_serializer)}
+
+# Connected users by socket, expired by heartbeat TTL (see presence.py)
+presence = create_presence_store()
+
+# Recent emits per room so reconnecting clients can catch up (see event_log.py).
+# Held across id assignment and emit so clients receive ids in order.
+event_log = EventLog()
+event_emit_lock = threading.Lock()
+
+def emit_logged(event, data, rooms):
+    """Emit an event to one or more rooms and keep it for replay on reconnect"""
+    rooms = [rooms] if isinstance(rooms, str) else list(rooms)
+    with event_emit_lock:
+        event_id = event_log.append(rooms, event, data)
+        socketio.emit(event, dict(data, event_id=event_id, event_epoch=event_log.epoch), to=rooms)
+    return event_id
+
+def session_rooms():
+    """Rooms the logged-in socket user belongs to"""
+    rooms = [f"company_{session['company_id']}", f"user_{session['user_id']}"]
+    if session.get('role') == 'Admin':
+        rooms.append(f"company_{session['company_id']}_admins")
+    else:
+        # Admins get every task's events through the admins room
+        rooms.extend(f"task_{task_id}" for task_id in Database().get_watched_task_ids(session['user_id']))
+    return rooms
+
+def task_event_rooms(task_id, company_id):
+    """Rooms for a task's comment and attachment events: its watchers and the company's admins"""
+    return [f"task_{task_id}", f"company_{company_id}_admins"]
+
+def get_accessible_task(task_id):
+    """The task's snapshot if the session user may comment on or upload to it: an admin of
+    the task's company or its assignee. Either makes the user a watcher, so check first."""
+    task = Database().get_task_snapshot(task_id)
+    if not task or task['company_id'] != session['company_id']:
+        return None
+    if session['role'] != 'Admin' and task['assigned_to'] != session['user_id']:
+        return None
+    return task
+
+def set_task_subscription(user_id, task_id, subscribed=True):
+    """Move a user's open sockets into (or out of) a task room as they start or stop watching it"""
+    room = f"task_{task_id}"
+    for sid, _ in list(socketio.server.manager.get_participants('/', f"user_{user_id}")):
+        if subscribed:
+            socketio.server.enter_room(sid, room, namespace='/')
+        else:
+            socketio.server.leave_room(sid, room, namespace='/')
+    # Only this worker's sockets are visible here; the others (re)join via
+    # subscribe_task. Logged so SSE streams pick up the room change too.
+    emit_logged('task_subscribed' if subscribed else 'task_unsubscribed', {'task_id': task_id}, f"user_{user_id}")
+
+def replay_missed_events(resume, rooms):
+    """Send a reconnecting client what it missed in rooms, or tell it to resync; caller holds
+    event_emit_lock"""
+    if not resume or resume.get('last_event_id') is None:
+        emit('event_log_position', event_log.position())
+        return
+    try:
+        missed = event_log.since(rooms, int(resume['last_event_id']), resume.get('epoch'))
+    except (TypeError, ValueError):
+        missed = None
+    if missed is None:
+        emit('resync_required', event_log.position())
+        return
+    emit('replay', dict(event_log.position(), events=[
+        {'event': event, 'data': dict(data, event_id=event_id, event_epoch=event_log.epoch)}
+        for event_id, event, data in missed
+    ]))
+
+def announce_presence(event, user, skip_sid=None):
+    """Tell a company's chat that a user came online (user_joined) or went offline (user_left)"""
+    verb = 'joined' if event == 'user_joined' else 'left'
+    socketio.emit(event, {
+        'user_id': user['user_id'],
+        'username': user['username'],
+        'message': f"{user['username']} {verb} the chat"
+    }, to=f"company_{user['company_id']}", skip_sid=skip_sid)
+
+def touch_presence():
+    """Create or refresh this socket's presence entry, announcing the user if it brought them online"""
+    user = {'user_id': session['user_id'], 'company_id': session['company_id'], 'username': session['username']}
+    # A reconnect within the grace period finds the old entry and stays silent
+    if presence.touch(request.sid, **user):
+        announce_presence('user_joined', user, skip_sid=request.sid)
+
+# Background notification delivery, presence expiry, storage reconciliation,
+# attachment indexing, reminder alerts and deadline escalations, started by
+# start_background_workers()
+outbox_dispatcher = None
+presence_sweeper = None
+storage_gc = None
+attachment_indexer = None
+reminder_scheduler = None
+deadline_scheduler = None
+
+def announce_reminder(reminder):
+    """A reminder reached its alert date; its Telegram notifications are already queued"""
+    emit_logged('reminder_alert', {
+        'id': reminder['id'],
+        'title': reminder['title'],
+        'description': reminder['description'],
+        'reminder_date': reminder['reminder_date']
+    }, f"company_{reminder['company_id']}_admins")
+    if outbox_dispatcher:
+        outbox_dispatcher.wake()
+
+def announce_escalation(escalation):
+    """A task crossed a deadline threshold; its Telegram notifications are already queued"""
+    send_notification(escalation['assigned_to'], escalation['message'])
+    emit_logged('task_deadline', {
+        'id': escalation['id'],
+        'title': escalation['title'],
+        'deadline': escalation['deadline'],
+        'threshold': escalation['threshold']
+    }, [f"company_{escalation['company_id']}_admins", f"user_{escalation['assigned_to']}"])
+    if outbox_dispatcher:
+        outbox_dispatcher.wake()
+
+def start_background_workers():
+    """Start the outbox dispatcher, presence sweeper, storage reconciler, attachment indexer,
+    reminder scheduler and deadline scheduler (idempotent)"""
+    global outbox_dispatcher, presence_sweeper, storage_gc, attachment_indexer, reminder_scheduler, \
+        deadline_scheduler
+    if outbox_dispatcher is None:
+        from outbox import create_dispatcher
+        outbox_dispatcher = create_dispatcher()
+        outbox_dispatcher.start()
+    if presence_sweeper is None:
+        presence_sweeper = PresenceSweeper(presence, lambda user: announce_presence('user_left', user))
+        presence_sweeper.start()
+    if storage_gc is None:
+        from storage_gc import StorageReconciler, StorageReconcilerThread
+        storage_gc = StorageReconcilerThread(StorageReconciler(app.config['UPLOAD_FOLDER']))
+        storage_gc.start()
+    if attachment_indexer is None and os.getenv('EAGLE_ASYNC_MODE') not in ('eventlet', 'gevent'):
+        from attachment_indexer import INDEX_WORKERS, AttachmentIndexer
+        if INDEX_WORKERS > 0:
+            attachment_indexer = AttachmentIndexer()
+            attachment_indexer.start()
+    if reminder_scheduler is None:
+        from reminder_scheduler import ReminderScheduler
+        reminder_scheduler = ReminderScheduler(announce_reminder)
+        reminder_scheduler.start()
+    if deadline_scheduler is None:
+        from deadline_scheduler import DeadlineScheduler
+        deadline_scheduler = DeadlineScheduler(announce_escalation)
+        deadline_scheduler.start()
+    return outbox_dispatcher
 
 def send_telegram_notification(user_id, message):
     """Send Telegram notification to user using their telegram_chat_id"""
     try:
         db = Database()
-        conn = db.get_connection()
-        cursor = conn.cursor()
+        contact = db.get_user_contact(user_id)
 
-        # Get user's telegram_chat_id and username
-        cursor.execute("SELECT telegram_chat_id, username FROM users WHERE id = ?", (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-
-        if not result:
+        if not contact:
             print(f"⚠️ User not found for user_id: {user_id}")
             return False
 
-        telegram_chat_id, username = result
+        telegram_chat_id, username = contact['telegram_chat_id'], contact['username']
         
         if not telegram_chat_id:
             print(f"⚠️ No Chat ID configured for user: {username}. User needs to set up Chat ID in settings.")
             return False
-        
-        # Get bot credentials from environment variables
-        import os
-        bot_token = os.getenv('TELEGRAM_BOT_TOKEN', "7653297508:AAE_sfu893LJ-D5Z5xtr_sjy-XEJvvf7haQ")
-        bot_username = os.getenv('TELEGRAM_BOT_USERNAME', "taskmanager_eagle_bot")
-
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-        
-        # Create a clean notification message
-        notification_text = f"🦅 *Eagle Task Manager*\n\n*Task Notification for:* {username}\n\n*Message:* {message}"
-        
-        data = {
-            'chat_id': telegram_chat_id,
-            'text': notification_text,
-            'parse_mode': 'Markdown'
-        }
 
         print(f"📤 Sending Telegram notification to {username} (chat_id: {telegram_chat_id})")
-        response = requests.post(url, data=data, timeout=10)
-
-        if response.status_code == 200:
-            print(f" Telegram notification sent successfully to {username}")
-            return True
-        else:
-            error_data = response.json() if response.headers.get('content-type') == 'application/json' else response.text
-            print(f" Failed to send Telegram notification to {username}")
-            print(f"Error: {error_data}")
-            return False
+        get_telegram_client().send_message(telegram_chat_id, format_notification(username, message))
+        print(f" Telegram notification sent successfully to {username}")
+        return True
 
+    except TelegramError as e:
+        print(f" Failed to send Telegram notification to {username}")
+        print(f"Error: {e}")
+        return False
     except Exception as e:
         print(f" Error sending Telegram notification: {e}")
         return False
 
-def send_bot_setup_message(mobile_number, username, bot_token, bot_username):
+def send_bot_setup_message(mobile_number, username, bot_username=TELEGRAM_BOT_USERNAME):
     """Send a setup message to user's mobile number to help them start the bot"""
     try:
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
         bot_start_link = f"https://t.me/{bot_username}?start=user_{mobile_number}"
         
         setup_message = f" *Eagle Task Manager Bot Setup*\n\nHi {username}!\n\n📲 To receive task notifications directly on your phone:\n\n1️⃣ Click this link: {bot_start_link}\n2️⃣ Or search @{bot_username} on Telegram\n3️⃣ Type /start to activate notifications\n\n✅ Once activated, you'll receive all task notifications directly!"
         
-        data = {
-            'chat_id': mobile_number,
-            'text': setup_message,
-            'parse_mode': 'Markdown'
-        }
-        
-        response = requests.post(url, data=data, timeout=10)
-        if response.status_code == 200:
-            print(f"📱 Setup message sent to {username} at {mobile_number}")
-        else:
-            print(f"⚠️ Could not send setup message to {mobile_number}")
+        get_telegram_client().send_message(mobile_number, setup_message)
+        print(f"📱 Setup message sent to {username} at {mobile_number}")
             
+    except TelegramError as e:
+        print(f"⚠️ Could not send setup message to {mobile_number}: {e}")
     except Exception as e:
         print(f"💥 Error sending setup message: {e}")
 
+def emit_task_change(before, after):
+    """Push a task delta to the company's admins and to the assignee.
+
+    before/after are Database.get_task_snapshot() results (None for a created
+    or deleted task). Updates carry only the fields that changed; a
+    reassignment is a task_deleted for the old assignee and a task_created
+    for the new one.
+    """
+    task = after or before
+    if task is None:
+        return
+    if deadline_scheduler:
+        deadline_scheduler.wake()
+    admins = f"company_{task['company_id']}_admins"
+
+    def public(snapshot):
+        return {key: value for key, value in snapshot.items() if key != 'company_id'}
+
+    if before is None:
+        emit_logged('task_created', public(after), [admins, f"user_{after['assigned_to']}"])
+        set_task_subscription(after['assigned_to'], after['id'])
+        return
+    if after is None:
+        emit_logged('task_deleted', {'id': before['id']}, [admins, f"user_{before['assigned_to']}"])
+        socketio.close_room(f"task_{before['id']}")
+        return
+
+    changed = {key: value for key, value in public(after).items() if before.get(key) != value}
+    if not changed:
+        return
+    delta = dict(changed, id=after['id'])
+    if before['assigned_to'] != after['assigned_to']:
+        emit_logged('task_updated', delta, admins)
+        emit_logged('task_deleted', {'id': after['id']}, f"user_{before['assigned_to']}")
+        emit_logged('task_created', public(after), f"user_{after['assigned_to']}")
+        if not Database().is_task_watcher(after['id'], before['assigned_to']):
+            set_task_subscription(before['assigned_to'], after['id'], subscribed=False)
+        set_task_subscription(after['assigned_to'], after['id'])
+    else:
+        emit_logged('task_updated', delta, [admins, f"user_{after['assigned_to']}"])
+
 @app.route('/')
 def index():
     if 'user_id' not in session:
@@ -139,12 +318,9 @@ def login():
                 'role': 'Admin',
                 'company_id': int(company_id)
             }
-            tasks = tm.view_all_tasks()
-            pending = len([t for t in tasks if t['status'] == 'Pending'])
-            in_progress = len([t for t in tasks if t['status'] == 'In Progress'])
-            completed = len([t for t in tasks if t['status'] == 'Completed'])
+            stats = tm.get_task_stats()
 
-            ai_message = f"Namaste Nigam Ji! I am your AI Eagle 🦅. Current status: {pending} pending, {in_progress} in progress, {completed} completed tasks."
+            ai_message = f"Namaste Nigam Ji! I am your AI Eagle 🦅. Current status: {stats['pending']} pending, {stats['in_progress']} in progress, {stats['completed']} completed tasks."
 
             user = {
                 'id': 1,
@@ -167,12 +343,9 @@ def login():
                 # AI Greeting for admin
                 ai_message = ""
                 if user['role'] == 'Admin':
-                    tasks = tm.view_all_tasks()
-                    pending = len([t for t in tasks if t['status'] == 'Pending'])
-                    in_progress = len([t for t in tasks if t['status'] == 'In Progress'])
-                    completed = len([t for t in tasks if t['status'] == 'Completed'])
+                    stats = tm.get_task_stats()
 
-                    ai_message = f"Namaste Nigam Ji! I am your AI Eagle 🦅. Current status: {pending} pending, {in_progress} in progress, {completed} completed tasks."
+                    ai_message = f"Namaste Nigam Ji! I am your AI Eagle 🦅. Current status: {stats['pending']} pending, {stats['in_progress']} in progress, {stats['completed']} completed tasks."
 
                 return jsonify({'success': True, 'user': user, 'ai_message': ai_message})
             else:
@@ -280,6 +453,24 @@ def get_tasks():
         'company_id': session['company_id']
     }
 
+    # Any paging or filter parameter switches to the keyset-paginated response
+    page_params = ('limit', 'cursor', 'sort', 'status', 'priority', 'assigned_to', 'deadline_from', 'deadline_to')
+    if any(param in request.args for param in page_params):
+        try:
+            page = tm.view_tasks_page(
+                assigned_to=request.args.get('assigned_to', type=int),
+                status=request.args.get('status'),
+                priority=request.args.get('priority'),
+                deadline_from=request.args.get('deadline_from'),
+                deadline_to=request.args.get('deadline_to'),
+                sort=request.args.get('sort', 'deadline'),
+                cursor=request.args.get('cursor'),
+                limit=request.args.get('limit', 50, type=int)
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(page)
+
     if session['role'] == 'Admin':
         tasks = tm.view_all_tasks()
     else:
@@ -287,6 +478,25 @@ def get_tasks():
 
     return jsonify(tasks)
 
+@app.route('/api/tasks/changes')
+def get_task_changes():
+    """Tasks changed since ?since=<cursor>; since=0 (or omitted) returns everything"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    since = request.args.get('since', 0, type=int)
+    if since < 0:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    tm = TaskManager()
+    tm.current_user = {
+        'id': session['user_id'],
+        'username': session['username'],
+        'role': session['role'],
+        'company_id': session['company_id']
+    }
+    return jsonify(tm.get_task_changes(since, request.args.get('limit', 500, type=int)))
+
 @app.route('/api/create_task', methods=['POST'])
 def create_task():
     if 'user_id' not in session or session['role'] != 'Admin':
@@ -301,24 +511,28 @@ def create_task():
         'company_id': session['company_id']
     }
 
-    success = tm.assign_task(
+    # The Telegram notification is queued with the task and delivered by the outbox workers
+    notification_message = f"📋 *New Task Assigned*\n\n*Title:* {data['title']}\n*Description:* {data['description']}\n*Priority:* {data.get('priority', 'Medium')}"
+    if data.get('deadline'):
+        notification_message += f"\n*Deadline:* {data['deadline']}"
+
+    task_id = tm.assign_task(
         data['title'],
         data['description'],
         data['assigned_to'],
         data.get('start_date'),
         data.get('deadline'),
-        data.get('priority', 'Medium')
+        data.get('priority', 'Medium'),
+        outbox=[('telegram', data['assigned_to'], {'message': notification_message})]
     )
 
-    if success:
+    if task_id:
+        emit_task_change(None, tm.db.get_task_snapshot(task_id))
         # Send notification to assigned user
         send_notification(data['assigned_to'], f"New task assigned: {data['title']}")
-        # Send Telegram notification
-        notification_message = f"📋 *New Task Assigned*\n\n*Title:* {data['title']}\n*Description:* {data['description']}\n*Priority:* {data.get('priority', 'Medium')}"
-        if data.get('deadline'):
-            notification_message += f"\n*Deadline:* {data['deadline']}"
-        send_telegram_notification(data['assigned_to'], notification_message)
-        return jsonify({'success': True})
+        if outbox_dispatcher:
+            outbox_dispatcher.wake()
+        return jsonify({'success': True, 'task_id': task_id})
     else:
         return jsonify({'success': False, 'message': 'Failed to create task'})
 
@@ -329,6 +543,7 @@ def admin_update_task(task_id):
 
     data = request.get_json()
     db = Database()
+    before = db.get_task_snapshot(task_id)
 
     success = db.admin_update_task(
         task_id,
@@ -343,6 +558,7 @@ def admin_update_task(task_id):
     )
 
     if success:
+        emit_task_change(before, db.get_task_snapshot(task_id))
         return jsonify({'success': True})
     else:
         return jsonify({'success': False, 'message': 'Failed to update task'})
@@ -353,9 +569,11 @@ def admin_delete_task(task_id):
         return jsonify({'error': 'Unauthorized'}), 401
 
     db = Database()
+    before = db.get_task_snapshot(task_id)
     success = db.admin_delete_task(task_id, session['company_id'])
 
     if success:
+        emit_task_change(before, None)
         return jsonify({'success': True})
     else:
         return jsonify({'success': False, 'message': 'Failed to delete task'})
@@ -374,9 +592,11 @@ def update_task_status():
         'company_id': session['company_id']
     }
 
+    before = tm.db.get_task_snapshot(data['task_id'])
     success = tm.update_task_status(data['task_id'], data['status'])
 
     if success:
+        emit_task_change(before, tm.db.get_task_snapshot(data['task_id']))
         return jsonify({'success': True})
     else:
         return jsonify({'success': False, 'message': 'Failed to update task'})
@@ -396,28 +616,29 @@ def add_task_comment():
         return jsonify({'error': 'Not logged in'}), 401
 
     data = request.get_json()
-    db = Database()
+    task = get_accessible_task(data.get('task_id'))
+    if not task:
+        return jsonify({'success': False, 'message': 'Task not found'}), 404
 
+    db = Database()
     success = db.add_task_comment(
-        data['task_id'],
+        task['id'],
         session['user_id'],
         data['comment']
     )
 
     if success:
-        # Get task info to find who to notify
-        db_conn = Database()
-        task = db_conn.get_task_by_id(data['task_id'])
-        if task:
-            # Send notification to task assignee if not the commenter
-            if task['assigned_to'] != session['user_id']:
-                send_notification(task['assigned_to'], f"New comment on task: {task['title']}")
-
-        # Emit notification to task assignee
-        socketio.emit('new_comment_notification', {
-            'task_id': data['task_id'],
+        # Send notification to task assignee if not the commenter
+        if task['assigned_to'] != session['user_id']:
+            send_notification(task['assigned_to'], f"New comment on task: {task['title']}")
+
+        # Commenting makes the user a watcher; only watchers and admins hear about it
+        if session['role'] != 'Admin':
+            set_task_subscription(session['user_id'], task['id'])
+        emit_logged('new_comment_notification', {
+            'task_id': task['id'],
             'message': f"New comment on task from {session['username']}"
-        }, room=f"company_{session['company_id']}")
+        }, task_event_rooms(task['id'], task['company_id']))
 
         return jsonify({'success': True})
     else:
@@ -432,11 +653,28 @@ def get_unread_comments_count():
     count = db.get_unread_comments_count(session['user_id'], session['company_id'])
     return jsonify({'count': count})
 
+def announce_attachment(task, original_filename):
+    """Uploading makes the user a watcher; tell the task's watchers and admins about the file"""
+    if session['role'] != 'Admin':
+        set_task_subscription(session['user_id'], task['id'])
+    emit_logged('new_attachment', {
+        'task_id': task['id'],
+        'filename': original_filename,
+        'message': f"New file on task from {session['username']}"
+    }, task_event_rooms(task['id'], task['company_id']))
+    # The new attachment is queued for text extraction by a trigger
+    if attachment_indexer:
+        attachment_indexer.wake()
+
 @app.route('/api/upload_task_file/<int:task_id>', methods=['POST'])
 def upload_task_file(task_id):
     if 'user_id' not in session:
         return jsonify({'error': 'Not logged in'}), 401
 
+    task = get_accessible_task(task_id)
+    if not task:
+        return jsonify({'success': False, 'message': 'Task not found'}), 404
+
     if 'file' not in request.files:
         return jsonify({'success': False, 'message': 'No file uploaded'})
 
@@ -448,35 +686,28 @@ def upload_task_file(task_id):
 
     if file and allowed_file(file.filename):
         try:
-            # Generate unique filename
             original_filename = secure_filename(file.filename)
             file_extension = original_filename.rsplit('.', 1)[1].lower()
-            unique_filename = f"{uuid.uuid4()}.{file_extension}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
 
-            # Save file
-            file.save(file_path)
-            file_size = os.path.getsize(file_path)
-
-            # Save to database
+            # Hash while saving; identical content is stored once (see blob_store.py)
             db = Database()
-            success = db.save_file_attachment(
+            staged_path, digest, file_size = db.blob_store.stage(file.stream)
+            attachment_id = db.save_blob_attachment(
                 task_id,
-                unique_filename,
-                original_filename,
-                file_path,
+                digest,
                 file_size,
+                original_filename,
                 file_extension,
                 session['user_id'],
-                upload_type
+                upload_type,
+                staged_path=staged_path
             )
 
-            if success:
+            if attachment_id:
+                announce_attachment(task, original_filename)
                 return jsonify({'success': True, 'filename': original_filename})
             else:
-                # Remove file if database save failed
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                db.blob_store.discard_staged(staged_path)
                 return jsonify({'success': False, 'message': 'Failed to save file info'})
 
         except Exception as e:
@@ -484,6 +715,104 @@ def upload_task_file(task_id):
 
     return jsonify({'success': False, 'message': 'Invalid file type. Only PDF, Excel, Word, and text files are allowed.'})
 
+# Resumable uploads for files of any size (see uploads.py)
+chunked_uploads = ChunkedUploads(app.config['UPLOAD_FOLDER'])
+
+def upload_error_response(error):
+    return jsonify(dict(error.details, success=False, message=str(error))), error.status
+
+@app.route('/api/uploads', methods=['POST'])
+def start_upload():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return upload_error_response(UploadError("Expected a JSON object"))
+    try:
+        size = int(data.get('size') or 0)
+    except (TypeError, ValueError):
+        return upload_error_response(UploadError("size must be a number of bytes"))
+    sha256 = data.get('sha256')
+    if not isinstance(data.get('filename') or '', str) or not isinstance(sha256 or '', str):
+        return upload_error_response(UploadError("filename and sha256 must be strings"))
+
+    filename = secure_filename(data.get('filename') or '')
+    if not allowed_file(filename):
+        return jsonify({'success': False, 'message': 'Invalid file type. Only PDF, Excel, Word, and text files are allowed.'})
+    task = get_accessible_task(data.get('task_id'))
+    if not task:
+        return jsonify({'success': False, 'message': 'Task not found'}), 404
+
+    try:
+        upload = chunked_uploads.create(task['id'], session['user_id'], session['company_id'], filename,
+                                        size, data.get('upload_type', 'task_progress'), sha256)
+    except UploadError as e:
+        return upload_error_response(e)
+    if upload.get('complete'):
+        announce_attachment(task, filename)
+    return jsonify(dict(upload, success=True))
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    try:
+        return jsonify(dict(chunked_uploads.status(upload_id, session['user_id']), success=True))
+    except UploadError as e:
+        return upload_error_response(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    # Offset from ?offset= or a Content-Range header ("bytes 0-4194303/10485760")
+    offset = request.args.get('offset', type=int)
+    content_range = request.headers.get('Content-Range', '')
+    if offset is None and content_range.startswith('bytes '):
+        try:
+            offset = int(content_range[len('bytes '):].split('-', 1)[0])
+        except ValueError:
+            offset = None
+    if offset is None:
+        return jsonify({'success': False, 'message': 'Chunk offset is required'}), 400
+
+    try:
+        # request.stream reads the raw body; nothing is buffered or form-parsed
+        result = chunked_uploads.write_chunk(upload_id, session['user_id'], offset, request.stream,
+                                             request.content_length)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(dict(result, success=True))
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    try:
+        result = chunked_uploads.complete(upload_id, session['user_id'])
+    except UploadError as e:
+        return upload_error_response(e)
+    # The task was checked when the upload started
+    task = Database().get_task_snapshot(result['task_id'])
+    if task and not result.get('already_complete'):
+        announce_attachment(task, result['filename'])
+    return jsonify(dict(result, success=True))
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def abort_upload(upload_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    try:
+        chunked_uploads.abort(upload_id, session['user_id'])
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'success': True})
+
 @app.route('/api/task_attachments/<int:task_id>')
 def get_task_attachments(task_id):
     if 'user_id' not in session:
@@ -493,32 +822,82 @@ def get_task_attachments(task_id):
     attachments = db.get_task_attachments(task_id)
     return jsonify(attachments)
 
-@app.route('/api/download_file/<int:attachment_id>')
-def download_file(attachment_id):
+@app.route('/api/search')
+def search():
     if 'user_id' not in session:
         return jsonify({'error': 'Not logged in'}), 401
 
-    db = Database()
-    conn = db.get_connection()
-    cursor = conn.cursor()
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing search query'}), 400
+    kinds = [kind for kind in request.args.get('type', ','.join(SEARCH_KINDS)).split(',') if kind in SEARCH_KINDS]
+    limit = max(min(request.args.get('limit', 20, type=int), 100), 1)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    results = Database().search(session['company_id'], session['user_id'], session['role'] == 'Admin',
+                                query, kinds, limit, offset)
+    return jsonify({'query': query, 'results': results})
 
-    cursor.execute('''
-        SELECT fa.file_path, fa.original_filename 
-        FROM file_attachments fa
-        JOIN tasks t ON fa.task_id = t.id
-        WHERE fa.id = ? AND (t.assigned_to = ? OR t.company_id = ?)
-    ''', (attachment_id, session['user_id'], session['company_id']))
+@app.route('/api/attachments/search')
+def search_attachments():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
 
-    result = cursor.fetchone()
-    conn.close()
+    query = request.args.get('q', '').strip()
+    limit = max(min(request.args.get('limit', 20, type=int), 100), 1)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    if not query:
+        return jsonify({'error': 'Missing search query'}), 400
 
-    if result:
-        file_path, original_filename = result
-        directory = os.path.dirname(file_path)
-        filename = os.path.basename(file_path)
-        return send_from_directory(directory, filename, as_attachment=True, download_name=original_filename)
+    return jsonify(Database().search_attachments(session['company_id'], session['user_id'],
+                                                 session['role'] == 'Admin', query, limit, offset))
 
-    return jsonify({'error': 'File not found'}), 404
+@app.route('/api/download_file/<int:attachment_id>')
+def download_file(attachment_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    attachment = Database().get_download_attachment(attachment_id, session['user_id'], session['company_id'])
+    if not attachment or not os.path.isfile(attachment['file_path']):
+        return jsonify({'error': 'File not found'}), 404
+
+    return send_attachment(attachment)
+
+def send_attachment(attachment):
+    """Serve an attachment with conditional GET and byte ranges, or hand it to the proxy"""
+    file_path = attachment['file_path']
+    offload = app.config['DOWNLOAD_OFFLOAD']
+    accel_path = None
+    if offload == 'x-accel':
+        relative = os.path.relpath(file_path, app.config['UPLOAD_FOLDER'])
+        if not relative.startswith(os.pardir):
+            accel_path = app.config['X_ACCEL_PREFIX'].rstrip('/') + '/' + relative.replace(os.sep, '/')
+    use_proxy = accel_path is not None or offload == 'x-sendfile'
+
+    if attachment['content_hash']:
+        # Content-addressed: the bytes behind this ETag can never change
+        etag = f"{attachment['content_hash']}-{attachment['file_size']}"
+    else:
+        etag = True  # mtime, size and path, as Werkzeug derives it
+    response = send_file(os.path.abspath(file_path), request.environ, as_attachment=True,
+                         download_name=attachment['original_filename'], etag=etag,
+                         max_age=app.config['DOWNLOAD_MAX_AGE'], use_x_sendfile=use_proxy,
+                         conditional=not use_proxy, response_class=app.response_class)
+    if use_proxy:
+        # The proxy does Range/If-Range itself; only a 304 is decided here
+        response = response.make_conditional(request.environ)
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+        elif accel_path:
+            response.headers['X-Accel-Redirect'] = accel_path
+            del response.headers['X-Sendfile']
+
+    # Behind a login, so never stored by shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if attachment['content_hash']:
+        response.cache_control.immutable = True
+    return response
 
 @app.route('/api/delete_attachment/<int:attachment_id>', methods=['DELETE'])
 def delete_attachment(attachment_id):
@@ -550,7 +929,7 @@ def create_reminder():
     data = request.get_json()
     db = Database()
 
-    success = db.create_reminder(
+    reminder_id = db.create_reminder(
         data['title'],
         data.get('description', ''),
         data['reminder_date'],
@@ -559,8 +938,16 @@ def create_reminder():
         session['user_id']
     )
 
-    if success:
-        return jsonify({'success': True})
+    if reminder_id:
+        emit_logged('reminder_created', {
+            'id': reminder_id,
+            'title': data['title'],
+            'reminder_date': data['reminder_date']
+        }, f"company_{session['company_id']}_admins")
+        # It may be due already
+        if reminder_scheduler:
+            reminder_scheduler.wake()
+        return jsonify({'success': True, 'reminder_id': reminder_id})
     else:
         return jsonify({'success': False, 'message': 'Failed to create reminder'})
 
@@ -573,6 +960,7 @@ def delete_reminder(reminder_id):
     success = db.delete_reminder(reminder_id, session['company_id'])
 
     if success:
+        emit_logged('reminder_deleted', {'id': reminder_id}, f"company_{session['company_id']}_admins")
         return jsonify({'success': True})
     else:
         return jsonify({'success': False, 'message': 'Failed to delete reminder'})
@@ -623,13 +1011,13 @@ def send_message():
             send_notification(receiver_id, f"New message from {session['username']}")
 
             # Emit to specific user
-            socketio.emit('new_private_message', {
+            emit_logged('new_private_message', {
                 'id': message_id,
                 'message': data['message'],
                 'sender_name': session['username'],
                 'sender_id': session['user_id'],
                 'timestamp': datetime.now().isoformat()
-            }, room=f"user_{receiver_id}")
+            }, f"user_{receiver_id}")
 
             return jsonify({'success': True})
     else:
@@ -642,39 +1030,125 @@ def send_message():
 
         if message_id:
             room = f"company_{session['company_id']}"
-            socketio.emit('new_message', {
+            emit_logged('new_message', {
                 'id': message_id,
                 'message': data['message'],
                 'username': session['username'],
                 'timestamp': datetime.now().isoformat(),
                 'user_id': session['user_id']
-            }, room=room)
+            }, room)
 
             return jsonify({'success': True})
 
     return jsonify({'success': False, 'message': 'Failed to send message'})
 
+# Server-Sent Events: the logged events of the user's rooms over plain HTTP
+SSE_KEEPALIVE_INTERVAL = 15  # seconds between comment lines on an idle stream
+SSE_RETRY_MS = 3000
+# Streams one process serves under async_mode threading, where each holds a server thread
+SSE_THREADED_MAX_STREAMS = int(os.getenv('EAGLE_SSE_THREADED_MAX_STREAMS', '32'))
+sse_thread_slots = threading.BoundedSemaphore(SSE_THREADED_MAX_STREAMS)
+
+def format_sse(event, data, event_id=None):
+    """One SSE message; the id is <epoch>:<event_id> so a resume from another epoch is detected"""
+    message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    if event_id is not None:
+        message = f"id: {event_log.epoch}:{event_id}\n" + message
+    return message
+
+@app.route('/api/stream')
+def event_stream():
+    """Task, comment, message and reminder events as text/event-stream.
+
+    Resumes after the Last-Event-ID header (sent by EventSource on reconnect)
+    or ?last_event_id=<epoch>:<id>, or sends resync_required when that is no
+    longer possible. An idle stream is a generator, a room set and an Event
+    that only appends to its own rooms wake; under eventlet/gevent that is a
+    greenlet, so one worker holds thousands. With async_mode threading each
+    stream occupies a server thread, so at most SSE_THREADED_MAX_STREAMS are
+    served and the rest get 503 with Retry-After; run server.py for more.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    rooms = set(session_rooms())
+    resume = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    threaded = socketio.async_mode == 'threading'
+    if threaded and not sse_thread_slots.acquire(blocking=False):
+        response = jsonify({'error': 'Too many event streams on this server; use Socket.IO or retry later'})
+        response.headers['Retry-After'] = str(SSE_RETRY_MS // 1000)
+        return response, 503
+
+    def generate():
+        signal = threading.Event()
+        event_log.listen(rooms, signal)
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            head = event_log.last_id
+            missed = []
+            if resume:
+                epoch, _, resume_id = resume.rpartition(':')
+                try:
+                    missed = event_log.since(rooms, int(resume_id), epoch or None)
+                except ValueError:
+                    missed = None
+                if missed is None:
+                    yield format_sse('resync_required', event_log.position(), head)
+                    missed = []
+            else:
+                # Gives EventSource a Last-Event-ID even if nothing else arrives before a reconnect
+                yield format_sse('stream_position', event_log.position(), head)
+
+            while True:
+                for event_id, event, data in missed:
+                    if event in ('task_subscribed', 'task_unsubscribed'):
+                        room = f"task_{data['task_id']}"
+                        if event == 'task_subscribed' and room not in rooms:
+                            rooms.add(room)
+                            event_log.listen([room], signal)
+                        elif event == 'task_unsubscribed' and room in rooms:
+                            rooms.discard(room)
+                            event_log.unlisten([room], signal)
+                    yield format_sse(event, dict(data, event_id=event_id, event_epoch=event_log.epoch), event_id)
+                last_id = max(head, missed[-1][0]) if missed else head
+                missed = []
+
+                if not signal.wait(SSE_KEEPALIVE_INTERVAL):
+                    yield ": keep-alive\n\n"
+                    continue
+                signal.clear()
+                head = event_log.last_id
+                missed = event_log.since(rooms, last_id)
+                if missed is None:
+                    yield format_sse('resync_required', event_log.position(), head)
+                    missed = []
+        finally:
+            event_log.unlisten(rooms, signal)
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    if threaded:
+        # Runs when the server closes the response, even if the stream never started
+        response.call_on_close(sse_thread_slots.release)
+    return response
+
 # Socket.IO events
 @socketio.on('connect')
-def on_connect():
+def on_connect(auth=None):
     if 'user_id' in session:
-        user_id = session['user_id']
-        company_id = session['company_id']
-        username = session['username']
-
-        room = f"company_{company_id}"
-        join_room(room)
-
-        active_users[request.sid] = {
-            'user_id': user_id,
-            'username': username,
-            'company_id': company_id
-        }
-
-        emit('user_joined', {
-            'username': username,
-            'message': f'{username} joined the chat'
-        }, room=room, include_self=False)
+        # company_{id}: chat; company_{id}_admins: every task event, so Admin only;
+        # user_{id}: own task events and private messages; task_{id}: comments
+        # and attachments on the tasks the user watches. Looked up before taking
+        # the emit lock so a reconnect storm's queries do not hold up emits.
+        rooms = session_rooms()
+        # Joining and replaying under the emit lock means every later event
+        # reaches this socket live, after the replayed ones
+        with event_emit_lock:
+            for joined in rooms:
+                join_room(joined)
+            replay_missed_events(auth, rooms)
+
+        touch_presence()
 
 @app.route('/api/all_users')
 def get_all_users():
@@ -736,17 +1210,16 @@ def get_users_by_company(company_id):
         return jsonify({'error': 'Unauthorized'}), 401
 
     db = Database()
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT u.id, u.username, u.role, u.is_active, u.created_at
-        FROM users u
-        WHERE u.company_id = ?
-        ORDER BY u.username
-    ''', (company_id,))
+    with db.get_connection() as conn:
+        rows = conn.execute('''
+            SELECT u.id, u.username, u.role, u.is_active, u.created_at
+            FROM users u
+            WHERE u.company_id = ?
+            ORDER BY u.username
+        ''', (company_id,)).fetchall()
 
     users = []
-    for row in cursor.fetchall():
+    for row in rows:
         users.append({
             "id": row[0],
             "username": row[1],
@@ -754,7 +1227,6 @@ def get_users_by_company(company_id):
             "is_active": row[3] if len(row) > 3 else True,
             "created_at": row[4]
         })
-    conn.close()
     return jsonify(users)
 
 @app.route('/api/private_messages/<int:user_id>')
@@ -781,6 +1253,33 @@ def get_admin_all_messages():
     messages = db.get_all_company_messages(limit=100)
     return jsonify(messages)
 
+@app.route('/api/admin/system_stats')
+def get_system_stats():
+    if 'user_id' not in session or session['role'] != 'Admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    db = Database()
+    return jsonify({
+        'db_pool': db.get_pool_stats(),
+        'reference_cache': db.get_cache_stats(),
+        'outbox': outbox_dispatcher.stats() if outbox_dispatcher else {'queue': db.get_outbox_stats()},
+        'telegram': get_telegram_client().stats(),
+        'event_log': event_log.stats(),
+        'presence': presence.stats(),
+        'blob_store': db.get_blob_stats(),
+        'storage_gc': storage_gc.stats() if storage_gc else None,
+        'attachment_index': attachment_indexer.stats() if attachment_indexer else {'queue': db.get_index_stats()},
+        'reminders': reminder_scheduler.stats() if reminder_scheduler else None,
+        'deadlines': deadline_scheduler.stats() if deadline_scheduler else None
+    })
+
+@app.route('/api/online_users')
+def get_online_users():
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    return jsonify(presence.online_users(session['company_id']))
+
 @app.route('/api/subscribe_notifications', methods=['POST'])
 def subscribe_notifications():
     if 'user_id' not in session:
@@ -810,23 +1309,7 @@ def get_task_stats():
         'company_id': session['company_id']
     }
 
-    if session['role'] == 'Admin':
-        tasks = tm.view_all_tasks()
-    else:
-        tasks = tm.view_my_tasks()
-
-    stats = {
-        'total': len(tasks),
-        'pending': len([t for t in tasks if t['status'] == 'Pending']),
-        'in_progress': len([t for t in tasks if t['status'] == 'In Progress']),
-        'completed': len([t for t in tasks if t['status'] == 'Completed']),
-        'by_priority': {
-            'critical': len([t for t in tasks if t.get('priority') == 'Critical']),
-            'high': len([t for t in tasks if t.get('priority') == 'High']),
-            'medium': len([t for t in tasks if t.get('priority') == 'Medium']),
-            'low': len([t for t in tasks if t.get('priority') == 'Low'])
-        }
-    }
+    stats = tm.get_task_stats()
 
     return jsonify(stats)
 
@@ -838,16 +1321,14 @@ def get_telegram_setup_info():
     
     # Get user's mobile number
     db = Database()
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT mobile_number, telegram_chat_id FROM users WHERE id = ?", (session['user_id'],))
-    result = cursor.fetchone()
-    conn.close()
+    with db.get_connection() as conn:
+        result = conn.execute("SELECT mobile_number, telegram_chat_id FROM users WHERE id = ?",
+                              (session['user_id'],)).fetchone()
     
     mobile_number = result[0] if result else None
     telegram_chat_id = result[1] if result else None
     
-    bot_username = "taskmanager_eagle_bot"
+    bot_username = TELEGRAM_BOT_USERNAME
     bot_start_link = f"https://t.me/{bot_username}?start=user_{mobile_number}" if mobile_number else f"https://t.me/{bot_username}"
     
     setup_info = {
@@ -875,23 +1356,17 @@ def send_telegram_setup():
     try:
         # Get user info
         db = Database()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT mobile_number, username FROM users WHERE id = ?", (session['user_id'],))
-        result = cursor.fetchone()
-        conn.close()
+        with db.get_connection() as conn:
+            result = conn.execute("SELECT mobile_number, username FROM users WHERE id = ?",
+                                  (session['user_id'],)).fetchone()
         
         if not result or not result[0]:
             return jsonify({'success': False, 'message': 'Mobile number not found'})
         
         mobile_number, username = result
-        # Get bot credentials from environment variables
-        import os
-        bot_token = os.getenv('TELEGRAM_BOT_TOKEN', "7653297508:AAE_sfu893LJ-D5Z5xtr_sjy-XEJvvf7haQ")
-        bot_username = os.getenv('TELEGRAM_BOT_USERNAME', "taskmanager_eagle_bot")
         
         # Send setup message
-        send_bot_setup_message(mobile_number, username, bot_token, bot_username)
+        send_bot_setup_message(mobile_number, username)
         
         return jsonify({'success': True, 'message': 'Setup instructions sent to your mobile number'})
         
@@ -906,13 +1381,9 @@ def get_chat_id():
     
     try:
         db = Database()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT telegram_chat_id FROM users WHERE id = ?", (session['user_id'],))
-        result = cursor.fetchone()
-        conn.close()
+        contact = db.get_user_contact(session['user_id'])
         
-        chat_id = result[0] if result and result[0] else None
+        chat_id = contact['telegram_chat_id'] if contact and contact['telegram_chat_id'] else None
         return jsonify({'success': True, 'chat_id': chat_id})
         
     except Exception as e:
@@ -936,34 +1407,55 @@ def update_chat_id():
             return jsonify({'success': False, 'message': 'Chat ID should only contain numbers'})
         
         db = Database()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("UPDATE users SET telegram_chat_id = ? WHERE id = ?", (chat_id, session['user_id']))
-        conn.commit()
-        conn.close()
+        db.update_user_telegram_chat_id(session['user_id'], chat_id)
         
         return jsonify({'success': True, 'message': 'Chat ID updated successfully'})
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Error: {str(e)}'})
 
+@socketio.on('resume')
+def on_resume(data):
+    """Explicit catch-up: {'epoch', 'last_event_id'} as reported by the last event seen"""
+    if 'user_id' in session:
+        rooms = session_rooms()
+        with event_emit_lock:
+            replay_missed_events(data or {}, rooms)
+
+@socketio.on('subscribe_task')
+def on_subscribe_task(data):
+    """Join a task room; only its watchers may (admins already get its events)"""
+    if 'user_id' not in session or session['role'] == 'Admin':
+        return
+    try:
+        task_id = int((data or {}).get('task_id'))
+    except (TypeError, ValueError):
+        return
+    if Database().is_task_watcher(task_id, session['user_id']):
+        join_room(f"task_{task_id}")
+
+@socketio.on('unsubscribe_task')
+def on_unsubscribe_task(data):
+    try:
+        leave_room(f"task_{int((data or {}).get('task_id'))}")
+    except (TypeError, ValueError):
+        pass
+
 @socketio.on('join_user_room')
 def on_join_user_room():
     if 'user_id' in session:
         join_room(f"user_{session['user_id']}")
 
+@socketio.on('heartbeat')
+def on_heartbeat():
+    """Keep this socket's presence entry alive; clients send one every PRESENCE_HEARTBEAT_INTERVAL"""
+    if 'user_id' in session:
+        touch_presence()
+
 @socketio.on('disconnect')
 def on_disconnect():
-    if request.sid in active_users:
-        user_info = active_users[request.sid]
-        room = f"company_{user_info['company_id']}"
-
-        emit('user_left', {
-            'username': user_info['username'],
-            'message': f"{user_info['username']} left the chat"
-        }, room=room)
-
-        del active_users[request.sid]
+    # user_left comes from the presence sweeper once the grace period has passed
+    presence.release(request.sid)
 
 def send_notification(user_id, message):
     """Send push notification to user"""
@@ -1002,4 +1494,5 @@ def send_notification(user_id, message):
 if __name__ == '__main__':
     # Use localhost for local development, 0.0.0.0 for Replit
     host = '127.0.0.1' if not os.getenv('REPLIT_DB_URL') else '0.0.0.0'
+    start_background_workers()
     socketio.run(app, host=host, port=5000, debug=True)